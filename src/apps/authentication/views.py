@@ -2,12 +2,15 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db import transaction
+from apps.cart.merge import merge_guest_cart
 from .serializers import *
 from rest_framework.permissions import IsAuthenticated
 
@@ -40,6 +43,18 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        # Гостевая корзина переходит к пользователю в той же транзакции
+        merge_guest_cart(request, serializer.user)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,)
@@ -73,10 +88,13 @@ class RegisterView(generics.CreateAPIView):
 class LoginView(APIView):
     permission_classes = (permissions.AllowAny,)
     
+    @transaction.atomic
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data
+            # Гостевая корзина переходит к пользователю в той же транзакции
+            merge_guest_cart(request, user)
             refresh = RefreshToken.for_user(user)
             
             return Response({
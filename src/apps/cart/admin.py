@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from .models import Cart, CartItem
+from .models import Cart, CartItem, StockReservation
+from .reservations import release_reservations
+from .totals import deferred_cart_totals
 
 
 class CartItemInline(admin.TabularInline):
@@ -105,6 +108,7 @@ class CartAdmin(admin.ModelAdmin):
             count
         )
     get_total_items.short_description = 'Товаров'
+    get_total_items.admin_order_field = 'total_items'
     
     def get_total_price(self, obj):
         """Отобразить общую стоимость"""
@@ -115,6 +119,7 @@ class CartAdmin(admin.ModelAdmin):
             formatted_total
         )
     get_total_price.short_description = 'Сумма'
+    get_total_price.admin_order_field = 'total_price'
     
     def get_cart_details(self, obj):
         """Отобразить детали корзины"""
@@ -169,11 +174,13 @@ class CartAdmin(admin.ModelAdmin):
     
     def clear_carts(self, request, queryset):
         """Очистить выбранные корзины"""
-        count = 0
-        for cart in queryset:
-            cart.items.all().delete()
-            count += 1
-        self.message_user(request, f'Очищено {count} корзин(а)')
+        # Один DELETE на все позиции и один пересчёт итогов вместо цикла по корзинам
+        cart_ids = list(queryset.values_list('pk', flat=True))
+        with transaction.atomic(), deferred_cart_totals() as deferred_ids:
+            CartItem.objects.filter(cart_id__in=cart_ids).delete()
+            release_reservations(cart_ids)
+            deferred_ids.update(cart_ids)
+        self.message_user(request, f'Очищено {len(cart_ids)} корзин(а)')
     clear_carts.short_description = 'Очистить корзины'
     
     # Дополнительные настройки
@@ -315,4 +322,15 @@ class CartItemAdmin(admin.ModelAdmin):
     
     def has_delete_permission(self, request, obj=None):
         """Разрешить удаление только суперпользователям"""
-        return request.user.is_superuser
\ No newline at end of file
+        return request.user.is_superuser
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Админка для резервов остатков"""
+    
+    list_display = ['variant', 'cart', 'quantity', 'expires_at', 'created_at']
+    list_filter = ['expires_at']
+    search_fields = ['variant__sku', 'variant__product__name']
+    raw_id_fields = ['cart', 'variant']
+    ordering = ['-expires_at']
@@ -0,0 +1,167 @@
+"""
+Оформление заказа из корзины.
+
+Всё выполняется в одной транзакции:
+- корзина блокируется (SELECT ... FOR UPDATE), повторный checkout той же
+  корзины ждёт первый;
+- цены и доступность всех вариантов читаются одним запросом;
+- остаток списывается условным UPDATE ... WHERE stock >= qty + чужие резервы
+  по каждому варианту (в порядке id, чтобы конкурирующие заказы не ловили
+  дедлок); варианты товаров «Предзаказ» со склада не списываются;
+- заказ с уникальным idempotency_key и его позиции (один bulk_create)
+  создаются по этим ценам, корзина очищается, её резервы снимаются.
+
+bulk_create и update() сигналов не шлют, поэтому ключи сортировки (popularity),
+версии каталога и снимок overview обновляются явно — после коммита, вне
+блокировок. Документы товаров не пересобираются: остаток в ответах
+подставляется текущий (apps.products.stock).
+"""
+import hashlib
+from decimal import Decimal
+from functools import partial
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.utils import timezone
+
+from apps.products.conditional import PRODUCTS_SCOPE, STOCK_SCOPE
+from apps.products.snapshots import mark_overview_stale
+from apps.products.sorting import refresh_product_sort_keys
+from apps.products.stock import get_reserved_quantities, reserved_stock_expression
+from apps.products.versioning import invalidate_versions
+
+from .models import Cart, StockReservation
+from .totals import deferred_cart_totals
+
+
+class CheckoutError(Exception):
+    """Заказ не оформлен; unavailable — [{'variant', 'requested', 'available'}]."""
+
+    def __init__(self, message, unavailable=()):
+        super().__init__(message)
+        self.message = message
+        self.unavailable = list(unavailable)
+
+
+def get_order_models():
+    return apps.get_model('products', 'Order'), apps.get_model('products', 'OrderItem')
+
+
+def get_product_variant_model():
+    return apps.get_model('products', 'ProductVariant')
+
+
+def make_idempotency_key(cart, key):
+    """Ключ клиента привязывается к владельцу корзины, чтобы чужой ключ не находил чужой заказ."""
+    if not key:
+        return None
+    owner = f'user:{cart.user_id}' if cart.user_id else f'guest:{cart.session_key}'
+    return hashlib.sha256(f'{owner}:{key}'.encode()).hexdigest()
+
+
+def find_order(idempotency_key):
+    if not idempotency_key:
+        return None
+    Order, _ = get_order_models()
+    return Order.objects.filter(idempotency_key=idempotency_key).first()
+
+
+def checkout_cart(cart, contact_name, contact_phone, idempotency_key=None):
+    """
+    Создаёт заказ из корзины и возвращает (order, created).
+    Повтор с тем же ключом возвращает уже созданный заказ с created=False.
+    """
+    idempotency_key = make_idempotency_key(cart, idempotency_key)
+    order = find_order(idempotency_key)
+    if order is not None:
+        return order, False
+
+    try:
+        return _create_order(cart, contact_name, contact_phone, idempotency_key)
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел закоммитить заказ
+        order = find_order(idempotency_key)
+        if order is None:
+            raise
+        return order, False
+
+
+@transaction.atomic
+def _create_order(cart, contact_name, contact_phone, idempotency_key):
+    Order, OrderItem = get_order_models()
+    ProductVariant = get_product_variant_model()
+
+    Cart.objects.select_for_update().get(pk=cart.pk)
+    # Повтор с тем же ключом мог ждать блокировку, пока первый запрос оформлял заказ
+    order = find_order(idempotency_key)
+    if order is not None:
+        return order, False
+
+    lines = dict(cart.items.values_list('variant_id', 'quantity'))
+    if not lines:
+        raise CheckoutError('Корзина пуста')
+
+    variants = {
+        row['pk']: row
+        for row in ProductVariant.objects.filter(pk__in=lines).values(
+            'pk', 'price', 'is_active', 'product_id', 'product__is_active', 'product__is_preorder',
+        )
+    }
+
+    inactive, out_of_stock = [], []
+    for variant_id in sorted(lines):
+        variant = variants[variant_id]
+        if not (variant['is_active'] and variant['product__is_active']):
+            inactive.append(variant_id)
+        elif not variant['product__is_preorder']:
+            # Резервы других корзин остаток не отдают, свой резерв — расходуется
+            updated = ProductVariant.objects.filter(
+                pk=variant_id,
+                stock__gte=Value(lines[variant_id]) + reserved_stock_expression(exclude_cart=cart),
+            ).update(stock=F('stock') - lines[variant_id], updated_at=timezone.now())
+            if not updated:
+                out_of_stock.append(variant_id)
+
+    if inactive or out_of_stock:
+        stock = dict(ProductVariant.objects.filter(pk__in=out_of_stock).values_list('pk', 'stock'))
+        reserved = get_reserved_quantities(out_of_stock, exclude_cart=cart)
+        # Исключение откатывает транзакцию вместе с уже списанными остатками
+        raise CheckoutError('Недостаточно товара на складе', [
+            {
+                'variant': variant_id,
+                'requested': lines[variant_id],
+                'available': max(stock.get(variant_id, 0) - reserved.get(variant_id, 0), 0),
+            }
+            for variant_id in sorted(inactive + out_of_stock)
+        ])
+
+    order = Order.objects.create(
+        user_id=cart.user_id,
+        contact_name=contact_name,
+        contact_phone=contact_phone,
+        total_price=sum(
+            (variants[variant_id]['price'] * quantity for variant_id, quantity in lines.items()),
+            Decimal('0'),
+        ),
+        idempotency_key=idempotency_key,
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, variant_id=variant_id, quantity=quantity, price_at_time=variants[variant_id]['price'])
+        for variant_id, quantity in lines.items()
+    ])
+
+    with deferred_cart_totals():
+        cart.items.all().delete()
+    StockReservation.objects.filter(cart=cart).delete()
+
+    product_ids = {variant['product_id'] for variant in variants.values()}
+    transaction.on_commit(partial(refresh_after_checkout, product_ids))
+    return order, True
+
+
+def refresh_after_checkout(product_ids):
+    """После коммита заказа: popularity товаров, версии каталога и снимок overview."""
+    refresh_product_sort_keys(product_ids)
+    invalidate_versions(PRODUCTS_SCOPE, STOCK_SCOPE)
+    mark_overview_stale()
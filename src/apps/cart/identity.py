@@ -0,0 +1,52 @@
+"""
+Идентификатор гостевой корзины.
+
+Гостю выдаётся случайный токен в подписанной cookie; он же хранится в
+Cart.session_key. Сессия Django для корзины не нужна, поэтому запросы
+к каталогу ничего не пишут в БД, а к базе обращается только сама корзина.
+"""
+import secrets
+
+from django.conf import settings
+
+CART_COOKIE_SALT = 'apps.cart.guest'
+
+
+def get_cart_cookie_name():
+    return getattr(settings, 'CART_COOKIE_NAME', 'cart_token')
+
+
+def get_cart_cookie_age():
+    return getattr(settings, 'CART_COOKIE_AGE', settings.SESSION_COOKIE_AGE)
+
+
+def new_guest_token():
+    return secrets.token_urlsafe(24)
+
+
+def get_guest_token(request):
+    """Токен из подписанной cookie или None, если её нет, она подделана или истекла."""
+    return request.get_signed_cookie(
+        get_cart_cookie_name(),
+        default=None,
+        salt=CART_COOKIE_SALT,
+        max_age=get_cart_cookie_age(),
+    )
+
+
+def get_legacy_session_key(request):
+    """Ключ сессии из старой cookie sessionid — корзины, созданные до перехода на токен."""
+    return request.COOKIES.get(settings.SESSION_COOKIE_NAME) or None
+
+
+def set_guest_cookie(response, token):
+    """Выставляет (и продлевает) cookie гостевой корзины. БД не трогает."""
+    response.set_signed_cookie(
+        get_cart_cookie_name(),
+        token,
+        salt=CART_COOKIE_SALT,
+        max_age=get_cart_cookie_age(),
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.cart.reservations import RESERVATION_BATCH_SIZE, expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие резервы остатков пачками; с --interval работает постоянно'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RESERVATION_BATCH_SIZE,
+            help='Сколько резервов удалять за один DELETE',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Пауза в секундах между проходами; 0 — один проход',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_reservations(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Удалено истёкших резервов: {expired}'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from apps.cart.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = 'Удаляет пустые корзины порциями (пустая корзина теперь отдаётся без строки в БД)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько корзин удалять за один DELETE',
+        )
+        parser.add_argument(
+            '--older-than-hours',
+            type=int,
+            default=1,
+            help='Не трогать корзины, изменённые за последние N часов',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать пустые корзины',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        cutoff = timezone.now() - timedelta(hours=options['older_than_hours'])
+
+        empty_carts = Cart.objects.filter(updated_at__lt=cutoff).exclude(
+            Exists(CartItem.objects.filter(cart=OuterRef('pk'))),
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Пустых корзин: {empty_carts.count()}')
+            return
+
+        # Короткие DELETE по первичному ключу не держат блокировки на всю таблицу
+        total = 0
+        last_pk = 0
+        while True:
+            chunk = list(
+                empty_carts.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1]
+            deleted, _ = Cart.objects.filter(pk__in=chunk).exclude(
+                Exists(CartItem.objects.filter(cart=OuterRef('pk'))),
+            ).delete()
+            total += deleted
+
+        self.stdout.write(self.style.SUCCESS(f'Удалено пустых корзин: {total}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.cart.totals import recalculate_cart_totals
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохранённые итоги всех корзин одним агрегирующим запросом'
+
+    def handle(self, *args, **options):
+        updated = recalculate_cart_totals()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано корзин: {updated}'))
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.cart.retention import (
+    RETENTION_CHUNK_SIZE,
+    delete_closed_carts,
+    delete_expired_sessions,
+    mark_abandoned_carts,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Помечает простаивающие корзины брошенными, удаляет старые корзины с позициями '
+        'и истёкшие сессии. Работает диапазонами pk в коротких транзакциях, подходит для cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--abandon-after-hours',
+            type=int,
+            default=settings.CART_ABANDON_AFTER_HOURS,
+            help='Через сколько часов без изменений активная корзина считается брошенной',
+        )
+        parser.add_argument(
+            '--delete-after-days',
+            type=int,
+            default=settings.CART_RETENTION_DAYS,
+            help='Через сколько дней без изменений удалять брошенные и завершённые корзины',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=RETENTION_CHUNK_SIZE,
+            help='Ширина диапазона pk (строк сессий) на одну транзакцию',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Пауза в секундах между транзакциями, чтобы не мешать живому трафику',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        chunk_size, pause = options['chunk_size'], options['pause']
+
+        self.report('Помечено брошенными', *mark_abandoned_carts(
+            now - timedelta(hours=options['abandon_after_hours']), chunk_size, pause,
+        ))
+        self.report('Удалено корзин', *delete_closed_carts(
+            now - timedelta(days=options['delete_after_days']), chunk_size, pause,
+        ))
+        self.report('Удалено сессий', *delete_expired_sessions(chunk_size, pause))
+
+    def report(self, label, rows, seconds):
+        rate = rows / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(f'{label}: {rows} за {seconds:.2f} с ({rate:.0f} строк/с)'))
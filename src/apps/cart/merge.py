@@ -0,0 +1,64 @@
+"""
+Слияние гостевой корзины с корзиной пользователя при входе.
+
+Число запросов не зависит от размера корзин: позиции гостя переносятся
+одним upsert по (cart, variant), итоги пересчитываются один раз
+(deferred_cart_totals), гостевая корзина удаляется.
+"""
+from .identity import get_guest_token, get_legacy_session_key
+from .models import Cart, CartItem
+from .totals import deferred_cart_totals
+
+
+def get_guest_cart_key(request):
+    return get_guest_token(request) or get_legacy_session_key(request)
+
+
+def merge_guest_cart(request, user):
+    """
+    Переносит позиции гостевой корзины запроса в корзину user.
+    Совпадающие варианты складываются. Вызывать внутри транзакции входа.
+    Возвращает корзину пользователя или None, если гостевой корзины нет.
+    """
+    guest_key = get_guest_cart_key(request)
+    if not guest_key:
+        return None
+
+    guest_cart = Cart.objects.select_for_update().filter(session_key=guest_key, user__isnull=True).first()
+    if guest_cart is None:
+        return None
+
+    user_cart = Cart.objects.select_for_update().filter(user=user).first()
+    if user_cart is None:
+        # Корзины у пользователя ещё нет — гостевая просто становится его корзиной
+        guest_cart.user = user
+        guest_cart.session_key = None
+        guest_cart.save(update_fields=['user', 'session_key', 'updated_at'])
+        return guest_cart
+
+    guest_items = list(guest_cart.items.values_list('variant_id', 'quantity'))
+    if guest_items:
+        existing = dict(
+            user_cart.items.filter(variant_id__in=[variant_id for variant_id, _ in guest_items])
+            .values_list('variant_id', 'quantity')
+        )
+        merged = [
+            CartItem(cart=user_cart, variant_id=variant_id, quantity=existing.get(variant_id, 0) + quantity)
+            for variant_id, quantity in guest_items
+        ]
+    else:
+        merged = []
+
+    with deferred_cart_totals() as cart_ids:
+        CartItem.objects.bulk_create(
+            merged,
+            update_conflicts=True,
+            unique_fields=['cart', 'variant'],
+            update_fields=['quantity'],
+        )
+        # Позиции гостя удаляются каскадом одним DELETE; сигналы лишь отмечают корзину
+        guest_cart.delete()
+        if merged:
+            cart_ids.add(user_cart.pk)
+
+    return user_cart
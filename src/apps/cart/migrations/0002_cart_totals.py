@@ -0,0 +1,45 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:14
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    price_field = DecimalField(max_digits=12, decimal_places=2)
+
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.update(
+        total_items=Coalesce(Subquery(items.annotate(value=Sum('quantity')).values('value')), 0),
+        total_price=Coalesce(
+            Subquery(items.annotate(
+                value=Sum(F('quantity') * F('variant__price'), output_field=price_field),
+            ).values('value')),
+            Value(Decimal('0'), output_field=price_field),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='total_items',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Товаров'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Сумма'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
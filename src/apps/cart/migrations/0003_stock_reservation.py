@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0024_order_checkout'),
+        ('cart', '0002_cart_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(verbose_name='Истекает')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='cart.cart', verbose_name='Корзина')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.productvariant', verbose_name='Вариант товара')),
+            ],
+            options={
+                'verbose_name': 'Резерв остатка',
+                'verbose_name_plural': 'Резервы остатков',
+                'indexes': [models.Index(fields=['variant', 'expires_at'], name='cart_reservation_live_idx'), models.Index(fields=['expires_at'], name='cart_reservation_expiry_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.UniqueConstraint(fields=('cart', 'variant'), name='cart_reservation_unique'),
+        ),
+    ]
@@ -36,6 +36,16 @@ class Cart(models.Model):
         verbose_name='Статус'
     )
     
+    # Итоги обновляются вместе с позициями корзины (см. totals.py)
+    total_items = models.PositiveIntegerField(default=0, editable=False, verbose_name='Товаров')
+    total_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name='Сумма'
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлена')
     
@@ -51,11 +61,11 @@ class Cart(models.Model):
     
     def get_total_items(self):
         """Общее количество товаров в корзине"""
-        return sum(item.quantity for item in self.items.all())
+        return self.total_items
     
     def get_total_price(self):
         """Общая стоимость товаров в корзине"""
-        return sum(item.get_total_price() for item in self.items.all())
+        return self.total_price
 
 
 class CartItem(models.Model):
@@ -83,6 +93,13 @@ class CartItem(models.Model):
     )
     
     added_at = models.DateTimeField(auto_now_add=True, verbose_name='Добавлен')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Количество из БД нужно сигналам, чтобы поправить итоги корзины на разницу
+        instance._saved_quantity = instance.__dict__.get('quantity')
+        return instance
     
     class Meta:
         verbose_name = 'Элемент корзины'
@@ -100,4 +117,40 @@ class CartItem(models.Model):
     def clean(self):
         """Валидация перед сохранением"""
         if self.quantity > self.variant.stock:
-            raise ValueError(f"Недостаточно товара на складе. Доступно: {self.variant.stock}")
\ No newline at end of file
+            raise ValueError(f"Недостаточно товара на складе. Доступно: {self.variant.stock}")
+
+class StockReservation(models.Model):
+    """Временное удержание остатка варианта за корзиной (см. reservations.py)"""
+    
+    cart = models.ForeignKey(
+        Cart,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name='Корзина'
+    )
+    
+    variant = models.ForeignKey(
+        'products.ProductVariant',
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name='Вариант товара'
+    )
+    
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(verbose_name='Истекает')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    
+    class Meta:
+        verbose_name = 'Резерв остатка'
+        verbose_name_plural = 'Резервы остатков'
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'variant'], name='cart_reservation_unique'),
+        ]
+        indexes = [
+            # Сумма живых резервов по варианту и выборка истёкших для очистки
+            models.Index(fields=['variant', 'expires_at'], name='cart_reservation_live_idx'),
+            models.Index(fields=['expires_at'], name='cart_reservation_expiry_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.variant} × {self.quantity} до {self.expires_at:%H:%M}"
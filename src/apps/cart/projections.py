@@ -0,0 +1,51 @@
+"""
+Проекция корзины для ответов API.
+
+Итоги берутся из полей Cart (см. totals.py), позиции загружаются одним
+запросом: вариант и товар через JOIN, главное медиа товара — подзапросом.
+CartSerializer дальше работает только с уже загруженными объектами.
+"""
+from decimal import Decimal
+
+from django.db.models import OuterRef, Prefetch, Subquery, prefetch_related_objects
+
+from .models import CartItem
+from .serializers import CartSerializer, get_product_image_model
+
+
+def get_cart_items_queryset():
+    primary_image = get_product_image_model().objects.filter(
+        product=OuterRef('variant__product'),
+    ).order_by('order', 'id').values('image')[:1]
+
+    return CartItem.objects.select_related(
+        'variant__product',
+    ).only(
+        'id', 'cart', 'quantity', 'added_at',
+        'variant__id', 'variant__attributes', 'variant__price',
+        'variant__product__id', 'variant__product__name',
+    ).annotate(
+        primary_image=Subquery(primary_image),
+    ).order_by(*CartItem._meta.ordering)
+
+
+def serialize_cart(cart):
+    """Данные корзины для ответа: итоги из Cart и позиции одним запросом."""
+    # Итоги и позиции могли измениться после загрузки корзины
+    cart.refresh_from_db(fields=['total_items', 'total_price', 'updated_at'])
+    getattr(cart, '_prefetched_objects_cache', {}).pop('items', None)
+    prefetch_related_objects([cart], Prefetch('items', queryset=get_cart_items_queryset()))
+    return CartSerializer(cart).data
+
+
+def serialize_empty_cart():
+    """Виртуальная пустая корзина: та же форма ответа, но строки в БД нет (id = null)."""
+    return {
+        'id': None,
+        'status': 'active',
+        'items': [],
+        'total_items': 0,
+        'total_price': CartSerializer().fields['total_price'].to_representation(Decimal('0')),
+        'created_at': None,
+        'updated_at': None,
+    }
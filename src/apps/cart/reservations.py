@@ -0,0 +1,113 @@
+"""
+Резервы остатка на время между корзиной и оплатой.
+
+Резерв — строка StockReservation (корзина, вариант, количество, срок).
+Строки ProductVariant блокируются только на время короткой транзакции
+резервирования; дальше остаток «держит» сама строка резерва: доступный
+остаток (products/stock.py) вычитает живые резервы, а checkout списывает
+склад с учётом чужих резервов. Истёкшие резервы перестают учитываться сразу,
+а удаляет их пачками expire_reservations (команда expire_stock_reservations).
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.products.conditional import STOCK_SCOPE
+from apps.products.stock import get_reserved_quantities
+from apps.products.versioning import invalidate_versions
+
+from .checkout import CheckoutError
+from .models import StockReservation
+
+RESERVATION_BATCH_SIZE = 1000
+
+
+def get_product_variant_model():
+    return apps.get_model('products', 'ProductVariant')
+
+
+@transaction.atomic
+def reserve_cart_stock(cart, minutes=None):
+    """
+    Резервирует остаток под все позиции корзины и возвращает срок резерва.
+    Повторный вызов продлевает резерв. Варианты товаров «Предзаказ» не
+    резервируются. При нехватке бросает CheckoutError, резервы не меняются.
+    """
+    minutes = minutes or settings.STOCK_RESERVATION_MINUTES
+    lines = dict(cart.items.values_list('variant_id', 'quantity'))
+    if not lines:
+        raise CheckoutError('Корзина пуста')
+
+    # Блокировка строк вариантов держится только до конца этой транзакции
+    variants = {
+        row['pk']: row
+        for row in get_product_variant_model().objects.select_for_update(of=('self',)).filter(
+            pk__in=lines,
+        ).order_by('pk').values('pk', 'stock', 'is_active', 'product__is_active', 'product__is_preorder')
+    }
+    reserved = get_reserved_quantities(lines, exclude_cart=cart)
+
+    holds, unavailable = {}, []
+    for variant_id in sorted(lines):
+        variant = variants[variant_id]
+        quantity = lines[variant_id]
+        if not (variant['is_active'] and variant['product__is_active']):
+            unavailable.append({'variant': variant_id, 'requested': quantity, 'available': 0})
+            continue
+        if variant['product__is_preorder']:
+            continue
+        available = max(variant['stock'] - reserved.get(variant_id, 0), 0)
+        if available < quantity:
+            unavailable.append({'variant': variant_id, 'requested': quantity, 'available': available})
+        else:
+            holds[variant_id] = quantity
+
+    if unavailable:
+        raise CheckoutError('Недостаточно товара на складе', unavailable)
+
+    expires_at = timezone.now() + timedelta(minutes=minutes)
+    StockReservation.objects.filter(cart=cart).exclude(variant_id__in=holds).delete()
+    StockReservation.objects.bulk_create(
+        [
+            StockReservation(cart=cart, variant_id=variant_id, quantity=quantity, expires_at=expires_at)
+            for variant_id, quantity in holds.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['cart', 'variant'],
+        update_fields=['quantity', 'expires_at'],
+    )
+    invalidate_versions(STOCK_SCOPE)
+    return expires_at
+
+
+def release_reservations(cart_ids):
+    """Снимает все резервы указанных корзин."""
+    deleted, _ = StockReservation.objects.filter(cart_id__in=cart_ids).delete()
+    if deleted:
+        invalidate_versions(STOCK_SCOPE)
+    return deleted
+
+
+def release_cart_reservations(cart):
+    return release_reservations([cart.pk])
+
+
+def expire_reservations(batch_size=RESERVATION_BATCH_SIZE, now=None):
+    """Удаляет истёкшие резервы пачками по первичному ключу и возвращает их число."""
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(expires_at__lte=now).order_by('pk')
+
+    total = 0
+    while True:
+        chunk = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not chunk:
+            break
+        deleted, _ = StockReservation.objects.filter(pk__in=chunk, expires_at__lte=now).delete()
+        total += deleted
+
+    if total:
+        invalidate_versions(STOCK_SCOPE)
+    return total
@@ -0,0 +1,95 @@
+"""
+Очистка старых корзин и сессий (команда sweep_carts).
+
+Каждая операция идёт по диапазонам первичного ключа фиксированной ширины,
+каждый диапазон — отдельная короткая транзакция. Так блокировки живых
+таблиц держатся миллисекунды, а прерванный прогон просто продолжается
+следующим запуском.
+"""
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import Cart
+from .reservations import release_reservations
+
+RETENTION_CHUNK_SIZE = 1000
+CLOSED_STATUSES = ('abandoned', 'completed')
+
+
+def iter_pk_ranges(queryset, chunk_size):
+    """Диапазоны [start, end) по целочисленному pk от минимального до максимального."""
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        yield start, start + chunk_size
+
+
+def _sweep(queryset, chunk_size, apply, pause=0):
+    """Применяет apply к каждому диапазону pk; возвращает (строк, секунд)."""
+    rows = 0
+    started = time.monotonic()
+    for start, end in iter_pk_ranges(queryset, chunk_size):
+        with transaction.atomic():
+            rows += apply(queryset.filter(pk__gte=start, pk__lt=end))
+        if pause:
+            time.sleep(pause)
+    return rows, time.monotonic() - started
+
+
+def mark_abandoned_carts(idle_since, chunk_size=RETENTION_CHUNK_SIZE, pause=0):
+    """Активные корзины, не менявшиеся с idle_since, становятся abandoned. updated_at не трогается."""
+    carts = Cart.objects.filter(status='active', updated_at__lt=idle_since)
+    return _sweep(carts, chunk_size, lambda chunk: chunk.update(status='abandoned'), pause)
+
+
+def delete_carts(carts):
+    """
+    Удаляет корзины; позиции удаляются каскадом, итоги удаляемых корзин
+    не пересчитываются (см. signals.cart_item_deleted). Резервы снимаются
+    заранее, чтобы сменилась версия остатков. Возвращает число корзин.
+    """
+    cart_ids = list(carts.values_list('pk', flat=True))
+    if not cart_ids:
+        return 0
+    release_reservations(cart_ids)
+    _, deleted = Cart.objects.filter(pk__in=cart_ids).delete()
+    return deleted.get(Cart._meta.label, 0)
+
+
+def delete_closed_carts(closed_before, chunk_size=RETENTION_CHUNK_SIZE, pause=0):
+    """Удаляет брошенные и завершённые корзины, не менявшиеся с closed_before."""
+    carts = Cart.objects.filter(status__in=CLOSED_STATUSES, updated_at__lt=closed_before)
+    return _sweep(carts, chunk_size, delete_carts, pause)
+
+
+def delete_expired_sessions(chunk_size=RETENTION_CHUNK_SIZE, pause=0):
+    """
+    Удаляет истёкшие сессии. Для БД-хранилищ — пачками по ключу,
+    для остальных движков — их собственным clear_expired().
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    started = time.monotonic()
+    if not hasattr(store, 'get_model_class'):
+        store.clear_expired()
+        return 0, time.monotonic() - started
+
+    # Ключ сессии — строка, поэтому вместо диапазонов идём по ключам по порядку
+    sessions = store.get_model_class().objects.filter(expire_date__lt=timezone.now()).order_by('pk')
+    rows = 0
+    last_key = ''
+    while True:
+        keys = list(sessions.filter(pk__gt=last_key).values_list('pk', flat=True)[:chunk_size])
+        if not keys:
+            break
+        last_key = keys[-1]
+        deleted, _ = sessions.filter(pk__in=keys).delete()
+        rows += deleted
+        if pause:
+            time.sleep(pause)
+    return rows, time.monotonic() - started
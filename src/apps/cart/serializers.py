@@ -9,6 +9,10 @@ def get_product_variant_model():
     return apps.get_model('products', 'ProductVariant')
 
 
+def get_product_image_model():
+    return apps.get_model('products', 'ProductImage')
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     """Сериализатор для элемента корзины"""
     
@@ -39,9 +43,16 @@ class CartItemSerializer(serializers.ModelSerializer):
     
     def get_variant_image(self, obj):
         """Получить изображение варианта товара"""
-        if obj.variant.product.images.exists():
-            return obj.variant.product.images.first().image.url
-        return None
+        # Проекция корзины (projections.py) подставляет путь к файлу подзапросом
+        if hasattr(obj, 'primary_image'):
+            image_name = obj.primary_image
+        else:
+            image = obj.variant.product.images.order_by('order', 'id').first()
+            image_name = image.image.name if image else None
+
+        if not image_name:
+            return None
+        return get_product_image_model()._meta.get_field('image').storage.url(image_name)
     
     def validate_quantity(self, value):
         """Проверка доступного количества"""
@@ -63,10 +74,9 @@ class CartSerializer(serializers.ModelSerializer):
     """Сериализатор для корзины"""
     
     items = CartItemSerializer(many=True, read_only=True)
-    total_items = serializers.IntegerField(source='get_total_items', read_only=True)
+    total_items = serializers.IntegerField(read_only=True)
     total_price = serializers.DecimalField(
-        source='get_total_price',
-        max_digits=10,
+        max_digits=12,
         decimal_places=2,
         read_only=True
     )
@@ -107,3 +117,54 @@ class CartUpdateItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(
         validators=[MinValueValidator(1)]  # ← Теперь импортировано правильно
     )
+
+
+class CartCheckoutSerializer(serializers.Serializer):
+    """Сериализатор данных оформления заказа"""
+
+    contact_name = serializers.CharField(max_length=255)
+    contact_phone = serializers.CharField(max_length=20)
+
+
+class CartBatchOperationSerializer(serializers.Serializer):
+    """Одна операция пакетного изменения корзины"""
+
+    OPERATIONS = ('add', 'set', 'remove')
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    variant_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(required=False, validators=[MinValueValidator(0)])
+
+    def validate(self, attrs):
+        # add: +quantity (по умолчанию 1), set: ровно quantity (0 — удалить), remove: удалить
+        if attrs['op'] == 'add':
+            attrs.setdefault('quantity', 1)
+            if attrs['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': 'Количество должно быть не меньше 1'})
+        elif attrs['op'] == 'set' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'Обязательное поле.'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """Сериализатор пакета операций над корзиной"""
+
+    MAX_OPERATIONS = 100
+
+    operations = CartBatchOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
+    def validate_operations(self, operations):
+        """Проверка всех вариантов одним запросом"""
+        variant_ids = {operation['variant_id'] for operation in operations}
+        variants = get_product_variant_model().objects.filter(pk__in=variant_ids).only('id', 'is_active').in_bulk()
+
+        errors = {}
+        for index, operation in enumerate(operations):
+            variant = variants.get(operation['variant_id'])
+            if variant is None:
+                errors[index] = {'variant_id': ['Вариант товара не найден']}
+            elif operation['op'] != 'remove' and not variant.is_active:
+                errors[index] = {'variant_id': ['Этот вариант товара не активен']}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return operations
@@ -0,0 +1,54 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Cart, CartItem
+from .totals import apply_item_delta, get_deferred_cart_ids, recalculate_cart_totals
+
+
+@receiver(post_save, sender=CartItem)
+def cart_item_saved(sender, instance, created, **kwargs):
+    deferred = get_deferred_cart_ids()
+    if deferred is not None:
+        deferred.add(instance.cart_id)
+        return
+
+    previous_quantity = 0 if created else getattr(instance, '_saved_quantity', None)
+    if previous_quantity is None:
+        # Позиция сохранена без загрузки из БД — считаем корзину заново
+        recalculate_cart_totals(Cart.objects.filter(pk=instance.cart_id))
+    else:
+        apply_item_delta(instance.cart_id, instance.variant_id, instance.quantity - previous_quantity)
+    instance._saved_quantity = instance.quantity
+
+
+@receiver(post_delete, sender=CartItem)
+def cart_item_deleted(sender, instance, origin=None, **kwargs):
+    # Позиция удаляется каскадом вместе с корзиной: её итоги уже не нужны
+    if isinstance(origin, Cart) or getattr(origin, 'model', None) is Cart:
+        return
+
+    deferred = get_deferred_cart_ids()
+    if deferred is not None:
+        deferred.add(instance.cart_id)
+        return
+
+    quantity = getattr(instance, '_saved_quantity', instance.quantity)
+    apply_item_delta(instance.cart_id, instance.variant_id, -quantity)
+
+
+@receiver(post_init, sender=apps.get_model('products', 'ProductVariant'))
+def remember_variant_price(sender, instance, **kwargs):
+    # Отложенное поле не загружено: цена неизвестна, при сохранении пересчитаем
+    instance._saved_price = instance.__dict__.get('price')
+
+
+@receiver(post_save, sender=apps.get_model('products', 'ProductVariant'))
+def variant_price_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Цена варианта входит в итоги всех корзин, где он лежит
+    saved_price, instance._saved_price = getattr(instance, '_saved_price', None), instance.price
+    if created or (update_fields is not None and 'price' not in update_fields):
+        return
+    if saved_price is not None and saved_price == instance.price:
+        return
+    recalculate_cart_totals(Cart.objects.filter(items__variant=instance))
@@ -1,10 +1,26 @@
+from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from apps.products.models import Category, Product, ProductVariant
+from apps.products.models import Category, Order, Product, ProductDocument, ProductImage, ProductVariant
+
+from . import checkout
+from .retention import delete_carts
+from .totals import recalculate_cart_totals
+from .models import Cart, CartItem, StockReservation
 
 
 class GuestCartViewSetTests(APITestCase):
@@ -61,3 +77,536 @@ class GuestCartViewSetTests(APITestCase):
         self.assertEqual(list_response.data['total_items'], 3)
         self.assertEqual(len(list_response.data['items']), 1)
         self.assertEqual(list_response.data['items'][0]['quantity'], 3)
+
+    def test_cart_queries_do_not_grow_with_items(self):
+        self.client.post(self.cart_add_url, {'variant_id': self.variant.id}, format='json')
+        with CaptureQueriesContext(connection) as one_item:
+            self.client.get(self.cart_list_url)
+
+        for index in range(9):
+            product = Product.objects.create(name=f'Phone {index}', slug=f'phone-{index}', category=self.category)
+            ProductImage.objects.create(
+                product=product,
+                image=SimpleUploadedFile(f'phone-{index}.jpg', b'fake-image-content', content_type='image/jpeg'),
+            )
+            variant = ProductVariant.objects.create(product=product, sku=f'PHONE-{index}', price=Decimal('10.00'))
+            self.client.post(self.cart_add_url, {'variant_id': variant.id}, format='json')
+
+        with CaptureQueriesContext(connection) as ten_items:
+            response = self.client.get(self.cart_list_url)
+
+        self.assertEqual(len(ten_items), len(one_item))
+        self.assertEqual(response.data['total_items'], 10)
+        self.assertEqual(response.data['total_price'], '1089.99')
+        self.assertTrue(response.data['items'][0]['variant_image'].startswith('/media/products/images/'))
+        self.assertIsNone(response.data['items'][-1]['variant_image'])
+
+
+class CartTotalsTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.first = ProductVariant.objects.create(product=product, sku='PHONE-X-128', price=Decimal('100.00'))
+        self.second = ProductVariant.objects.create(product=product, sku='PHONE-X-256', price=Decimal('150.00'))
+        self.cart = Cart.objects.create(session_key='totals')
+
+    def assertTotals(self, total_items, total_price):
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_items, total_items)
+        self.assertEqual(self.cart.total_price, Decimal(total_price))
+
+    def test_totals_follow_item_changes(self):
+        first = CartItem.objects.create(cart=self.cart, variant=self.first, quantity=2)
+        CartItem.objects.create(cart=self.cart, variant=self.second, quantity=1)
+        self.assertTotals(3, '350.00')
+
+        first = CartItem.objects.get(pk=first.pk)
+        first.quantity = 5
+        first.save()
+        self.assertTotals(6, '650.00')
+
+        first.delete()
+        self.assertTotals(1, '150.00')
+
+        self.cart.items.all().delete()
+        self.assertTotals(0, '0.00')
+
+    def test_repeated_adds_keep_totals_equal_to_aggregate(self):
+        for quantity in (1, 2, 3):
+            self.client.post(reverse('cart-add-item'), {'variant_id': self.first.id, 'quantity': quantity}, format='json')
+        self.client.post(reverse('cart-add-item'), {'variant_id': self.second.id, 'quantity': 1}, format='json')
+
+        cart = Cart.objects.exclude(pk=self.cart.pk).get()
+        self.assertEqual(cart.items.get(variant=self.first).quantity, 6)
+        stored = (cart.total_items, cart.total_price)
+        recalculate_cart_totals(Cart.objects.filter(pk=cart.pk))
+        cart.refresh_from_db()
+        self.assertEqual(stored, (cart.total_items, cart.total_price))
+        self.assertEqual(stored, (7, Decimal('750.00')))
+
+    def test_variant_price_change_updates_cart_totals(self):
+        CartItem.objects.create(cart=self.cart, variant=self.first, quantity=2)
+
+        self.first.price = Decimal('90.00')
+        self.first.save()
+
+        self.assertTotals(2, '180.00')
+
+    def test_variant_save_without_price_change_keeps_carts_untouched(self):
+        CartItem.objects.create(cart=self.cart, variant=self.first, quantity=2)
+        variant = ProductVariant.objects.get(pk=self.first.pk)
+        variant.stock = 7
+
+        with CaptureQueriesContext(connection) as queries:
+            variant.save()
+
+        self.assertFalse([query for query in queries if 'cart_cart' in query['sql']])
+        self.assertTotals(2, '200.00')
+
+    def test_recalculate_command_repairs_totals(self):
+        CartItem.objects.create(cart=self.cart, variant=self.first, quantity=2)
+        Cart.objects.filter(pk=self.cart.pk).update(total_items=0, total_price=0)
+
+        call_command('recalculate_cart_totals', stdout=StringIO())
+
+        self.assertTotals(2, '200.00')
+
+
+class CartBatchTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.first = ProductVariant.objects.create(product=product, sku='PHONE-X-128', price=Decimal('100.00'))
+        self.second = ProductVariant.objects.create(product=product, sku='PHONE-X-256', price=Decimal('150.00'))
+        self.third = ProductVariant.objects.create(product=product, sku='PHONE-X-512', price=Decimal('200.00'))
+        self.url = reverse('cart-batch')
+        self.client.post(reverse('cart-add-item'), {'variant_id': self.first.id, 'quantity': 2}, format='json')
+        self.client.post(reverse('cart-add-item'), {'variant_id': self.second.id}, format='json')
+
+    def test_batch_applies_operations_in_order(self):
+        response = self.client.post(self.url, {'operations': [
+            {'op': 'add', 'variant_id': self.first.id, 'quantity': 3},
+            {'op': 'remove', 'variant_id': self.second.id},
+            {'op': 'add', 'variant_id': self.third.id},
+            {'op': 'set', 'variant_id': self.third.id, 'quantity': 4},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        quantities = {item['variant']: item['quantity'] for item in response.data['items']}
+        self.assertEqual(quantities, {self.first.id: 5, self.third.id: 4})
+        self.assertEqual(response.data['total_items'], 9)
+        self.assertEqual(response.data['total_price'], '1300.00')
+
+        cart = Cart.objects.get(pk=response.data['id'])
+        self.assertEqual((cart.total_items, cart.total_price), (9, Decimal('1300.00')))
+
+    def test_batch_rejects_unknown_and_inactive_variants_atomically(self):
+        ProductVariant.objects.filter(pk=self.third.pk).update(is_active=False)
+
+        response = self.client.post(self.url, {'operations': [
+            {'op': 'set', 'variant_id': self.first.id, 'quantity': 1},
+            {'op': 'add', 'variant_id': self.third.id},
+            {'op': 'add', 'variant_id': 999999},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data['operations']), {1, 2})
+        self.assertEqual(CartItem.objects.get(variant=self.first).quantity, 2)
+
+    def test_batch_query_count_does_not_grow_with_operations(self):
+        def run(count):
+            operations = [{'op': 'add', 'variant_id': self.third.id}] * count
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.url, {'operations': operations}, format='json')
+            return len(queries)
+
+        self.assertEqual(run(1), run(20))
+
+
+class GuestCartIdentityTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.variant = ProductVariant.objects.create(product=product, sku='PHONE-X-128', price=Decimal('100.00'))
+        self.cart_add_url = reverse('cart-add-item')
+
+    def test_guest_cart_is_identified_by_signed_cookie(self):
+        response = self.client.post(self.cart_add_url, {'variant_id': self.variant.id}, format='json')
+
+        self.assertIn('cart_token', response.cookies)
+        self.assertNotIn('sessionid', response.cookies)
+        cart = Cart.objects.get(pk=response.data['id'])
+        self.assertNotEqual(response.cookies['cart_token'].value, cart.session_key)
+
+        response = self.client.get(reverse('cart-list'))
+        self.assertEqual(response.data['id'], cart.pk)
+        self.assertEqual(response.data['total_items'], 1)
+
+    def test_tampered_cookie_gets_a_new_cart(self):
+        response = self.client.post(self.cart_add_url, {'variant_id': self.variant.id}, format='json')
+        self.client.cookies['cart_token'] = response.cookies['cart_token'].value + 'x'
+
+        response = self.client.get(reverse('cart-list'))
+
+        self.assertEqual(response.data['total_items'], 0)
+
+    def test_legacy_session_cart_is_adopted(self):
+        cart = Cart.objects.create(session_key='a' * 32)
+        CartItem.objects.create(cart=cart, variant=self.variant, quantity=2)
+        self.client.cookies['sessionid'] = 'a' * 32
+
+        response = self.client.get(reverse('cart-list'))
+
+        self.assertEqual(response.data['id'], cart.pk)
+        self.assertIn('cart_token', response.cookies)
+
+    def test_catalog_requests_do_not_write(self):
+        url = reverse('product-list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('sessionid', response.cookies)
+        writes = [query['sql'] for query in queries if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+
+class LazyCartTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.variant = ProductVariant.objects.create(product=product, sku='PHONE-X-128', price=Decimal('100.00'))
+
+    def test_empty_cart_is_virtual_until_first_add(self):
+        response = self.client.get(reverse('cart-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['id'])
+        self.assertEqual(response.data['items'], [])
+        self.assertEqual(response.data['total_price'], '0.00')
+        self.assertNotIn('cart_token', response.cookies)
+
+        self.client.post(reverse('cart-add-item'), {'variant_id': 999999}, format='json')
+        self.client.delete(reverse('cart-clear'))
+        self.assertFalse(Cart.objects.exists())
+
+        response = self.client.post(reverse('cart-add-item'), {'variant_id': self.variant.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Cart.objects.get().pk, response.data['id'])
+
+    def test_purge_empty_carts_keeps_recent_and_filled_carts(self):
+        old = timezone.now() - timedelta(days=2)
+        for index in range(5):
+            Cart.objects.create(session_key=f'empty-{index}')
+        filled = Cart.objects.create(session_key='filled')
+        CartItem.objects.create(cart=filled, variant=self.variant)
+        Cart.objects.update(updated_at=old)
+        recent = Cart.objects.create(session_key='recent')
+
+        call_command('purge_empty_carts', chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {filled.pk, recent.pk})
+
+
+class GuestCartMergeTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.variants = [
+            ProductVariant.objects.create(product=product, sku=f'PHONE-X-{index}', price=Decimal('10.00'))
+            for index in range(6)
+        ]
+        self.user = get_user_model().objects.create_user(
+            username='buyer',
+            email='buyer@example.com',
+            password='secret-pass',
+            is_email_verified=True,
+        )
+        self.credentials = {'username': 'buyer', 'password': 'secret-pass'}
+
+    def add_guest_items(self, client, variants, quantity=1):
+        client.post(reverse('cart-batch'), {'operations': [
+            {'op': 'add', 'variant_id': variant.id, 'quantity': quantity} for variant in variants
+        ]}, format='json')
+
+    def test_login_sums_guest_items_into_user_cart(self):
+        user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=user_cart, variant=self.variants[0], quantity=2)
+        self.add_guest_items(self.client, self.variants[:2], quantity=3)
+
+        response = self.client.post(reverse('login'), self.credentials, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Cart.objects.filter(user__isnull=True).exists())
+        quantities = dict(user_cart.items.values_list('variant_id', 'quantity'))
+        self.assertEqual(quantities, {self.variants[0].id: 5, self.variants[1].id: 3})
+        user_cart.refresh_from_db()
+        self.assertEqual((user_cart.total_items, user_cart.total_price), (8, Decimal('80.00')))
+
+    def test_guest_cart_becomes_user_cart_on_token_login(self):
+        self.add_guest_items(self.client, self.variants[:1])
+        guest_cart = Cart.objects.get()
+
+        response = self.client.post(reverse('token_obtain_pair'), self.credentials, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        guest_cart.refresh_from_db()
+        self.assertEqual(guest_cart.user, self.user)
+        self.assertIsNone(guest_cart.session_key)
+
+    def test_merge_query_count_does_not_grow_with_cart_size(self):
+        def login(guest_variants):
+            Cart.objects.all().delete()
+            user_cart = Cart.objects.create(user=self.user)
+            CartItem.objects.create(cart=user_cart, variant=self.variants[0])
+            client = self.client_class()
+            self.add_guest_items(client, guest_variants)
+            with CaptureQueriesContext(connection) as queries:
+                client.post(reverse('login'), self.credentials, format='json')
+            self.assertEqual(user_cart.items.count(), len(set(guest_variants) | {self.variants[0]}))
+            return len(queries)
+
+        self.assertEqual(login(self.variants[:1]), login(self.variants))
+
+
+@override_settings(CATALOG_SNAPSHOT_ASYNC=False)
+class CheckoutTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        self.product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.preorder_product = Product.objects.create(
+            name='Phone Y', slug='phone-y', category=category, is_preorder=True,
+        )
+        self.first = ProductVariant.objects.create(
+            product=self.product, sku='PHONE-X-128', price=Decimal('100.00'), stock=5,
+        )
+        self.second = ProductVariant.objects.create(
+            product=self.product, sku='PHONE-X-256', price=Decimal('150.00'), stock=1,
+        )
+        self.preorder = ProductVariant.objects.create(
+            product=self.preorder_product, sku='PHONE-Y', price=Decimal('300.00'), stock=0,
+        )
+        self.url = reverse('cart-checkout')
+        self.contact = {'contact_name': 'Ivan', 'contact_phone': '+79990000000'}
+
+    def fill_cart(self, *lines):
+        self.client.post(reverse('cart-batch'), {'operations': [
+            {'op': 'add', 'variant_id': variant.id, 'quantity': quantity} for variant, quantity in lines
+        ]}, format='json')
+
+    def test_checkout_creates_order_and_decrements_stock(self):
+        self.fill_cart((self.first, 2), (self.preorder, 1))
+        ProductVariant.objects.filter(pk=self.first.pk).update(price=Decimal('90.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.contact, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get()
+        self.assertEqual(response.data['order']['id'], order.pk)
+        self.assertEqual(order.total_price, Decimal('480.00'))
+        self.assertEqual(
+            set(order.items.values_list('variant_id', 'quantity', 'price_at_time')),
+            {(self.first.id, 2, Decimal('90.00')), (self.preorder.id, 1, Decimal('300.00'))},
+        )
+        self.assertEqual(response.data['cart']['items'], [])
+        self.assertEqual(response.data['cart']['total_items'], 0)
+
+        self.first.refresh_from_db()
+        self.preorder.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.first.stock, self.preorder.stock), (3, 0))
+        self.assertEqual(self.product.popularity, 2)
+
+    def test_checkout_fails_atomically_when_stock_is_short(self):
+        self.fill_cart((self.first, 2), (self.second, 2))
+
+        response = self.client.post(self.url, self.contact, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['items'], [{'variant': self.second.id, 'requested': 2, 'available': 1}])
+        self.assertFalse(Order.objects.exists())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.stock, 5)
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_checkout_retry_with_idempotency_key_returns_same_order(self):
+        self.fill_cart((self.first, 1))
+
+        first = self.client.post(self.url, self.contact, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        retry = self.client.post(self.url, self.contact, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.stock, 4)
+
+    def test_concurrent_retry_finds_order_after_waiting_for_cart_lock(self):
+        self.fill_cart((self.first, 1))
+        first = self.client.post(self.url, self.contact, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+        find_order = checkout.find_order
+        calls = []
+
+        def find_order_before_commit(idempotency_key):
+            # Первая проверка, до блокировки корзины, ещё не видит заказ параллельного запроса
+            calls.append(idempotency_key)
+            return None if len(calls) == 1 else find_order(idempotency_key)
+
+        with mock.patch('apps.cart.checkout.find_order', side_effect=find_order_before_commit):
+            retry = self.client.post(self.url, self.contact, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_checkout_keeps_product_documents_and_lists_show_current_stock(self):
+        self.client.get(reverse('product-list'))
+        self.fill_cart((self.first, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self.contact, format='json')
+
+        self.assertTrue(ProductDocument.objects.filter(product=self.product).exists())
+        listed = self.client.get(reverse('product-list'), {'ordering': 'created_at'})
+        stock = {variant['id']: variant['stock'] for variant in listed.data['results'][0]['variants']}
+        self.assertEqual(stock[self.first.id], 3)
+
+    def test_orders_endpoint_lists_checked_out_order(self):
+        user = get_user_model().objects.create_user(username='buyer', password='secret-pass')
+        self.client.force_authenticate(user)
+        self.fill_cart((self.first, 1))
+        self.client.post(self.url, self.contact, format='json')
+
+        response = self.client.get(reverse('order-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = response.data['results'][0]
+        self.assertEqual(order['total_price'], '100.00')
+        self.assertEqual(order['items'][0]['price_at_time'], '100.00')
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        self.product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.variant = ProductVariant.objects.create(
+            product=self.product, sku='PHONE-X-128', price=Decimal('100.00'), stock=5,
+        )
+        self.contact = {'contact_name': 'Ivan', 'contact_phone': '+79990000000'}
+        self.other = self.client_class()
+
+    def fill_cart(self, client, quantity):
+        client.post(reverse('cart-add-item'), {'variant_id': self.variant.id, 'quantity': quantity}, format='json')
+
+    def test_reservation_holds_stock_for_its_cart(self):
+        self.fill_cart(self.client, 4)
+        self.fill_cart(self.other, 2)
+
+        response = self.client.post(reverse('cart-reserve'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['items'], [{'variant': self.variant.id, 'quantity': 4}])
+
+        variant = self.client.get(reverse('variant-detail', args=[self.variant.sku]))
+        self.assertEqual(variant.data['stock'], 1)
+        listed = self.client.get(reverse('product-list'))
+        self.assertEqual(listed.data['results'][0]['variants'][0]['stock'], 1)
+        detail = self.client.get(reverse('product-detail', args=[self.product.slug]))
+        self.assertEqual(detail.data['variants'][0]['stock'], 1)
+
+        response = self.other.post(reverse('cart-reserve'))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['items'][0]['available'], 1)
+        response = self.other.post(reverse('cart-checkout'), self.contact, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post(reverse('cart-checkout'), self.contact, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(StockReservation.objects.exists())
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 1)
+
+    def test_expired_reservations_are_ignored_and_swept(self):
+        self.fill_cart(self.client, 5)
+        self.client.post(reverse('cart-reserve'))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        variant = self.client.get(reverse('variant-detail', args=[self.variant.sku]))
+        self.assertEqual(variant.data['stock'], 5)
+
+        call_command('expire_stock_reservations', batch_size=1, stdout=StringIO())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_reservation(self):
+        self.fill_cart(self.client, 2)
+        self.client.post(reverse('cart-reserve'))
+
+        response = self.client.delete(reverse('cart-reserve'))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class CartRetentionTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone X', slug='phone-x', category=category)
+        self.variant = ProductVariant.objects.create(product=product, sku='PHONE-X-128', price=Decimal('100.00'))
+
+    def make_cart(self, key, days_idle, status='active'):
+        cart = Cart.objects.create(session_key=key, status=status)
+        CartItem.objects.create(cart=cart, variant=self.variant)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=days_idle))
+        return cart
+
+    def test_sweep_marks_abandoned_and_deletes_old_carts_and_sessions(self):
+        fresh = self.make_cart('fresh', 0)
+        idle = self.make_cart('idle', 5)
+        old = self.make_cart('old', 40, status='abandoned')
+        Session.objects.create(session_key='expired', session_data='', expire_date=timezone.now() - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=timezone.now() + timedelta(days=1))
+
+        output = StringIO()
+        call_command('sweep_carts', chunk_size=1, stdout=output)
+
+        statuses = dict(Cart.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {fresh.pk: 'active', idle.pk: 'abandoned'})
+        self.assertFalse(CartItem.objects.filter(cart_id=old.pk).exists())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertIn('строк/с', output.getvalue())
+
+    def test_delete_carts_cascades_items_without_touching_totals(self):
+        carts = [self.make_cart(f'closed-{index}', 40, status='completed') for index in range(3)]
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = delete_carts(Cart.objects.filter(pk__in=[cart.pk for cart in carts]))
+
+        self.assertEqual(deleted, 3)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
+    def test_cart_activity_reactivates_abandoned_cart(self):
+        cart = self.make_cart('idle', 5, status='abandoned')
+        item = CartItem.objects.get(cart=cart)
+        item.quantity = 2
+        item.save()
+
+        cart.refresh_from_db()
+        self.assertEqual(cart.status, 'active')
+
+    def test_admin_clear_carts_empties_carts_in_bulk(self):
+        carts = [self.make_cart(f'cart-{index}', 1) for index in range(3)]
+        admin_user = get_user_model().objects.create_superuser(username='admin', password='secret-pass')
+        self.client.force_login(admin_user)
+
+        response = self.client.post(reverse('admin:cart_cart_changelist'), {
+            'action': 'clear_carts',
+            '_selected_action': [cart.pk for cart in carts],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(set(Cart.objects.values_list('total_items', flat=True)), {0})
@@ -0,0 +1,98 @@
+"""
+Итоги корзины (total_items, total_price), хранящиеся в Cart.
+
+Изменения позиций сдвигают итоги на разницу одним UPDATE с F-выражениями —
+это атомарно и не перечитывает остальные позиции. Полный пересчёт
+агрегатом нужен при смене цены варианта и для починки (recalculate_cart_totals).
+"""
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.apps import apps
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Cart, CartItem
+
+PRICE_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+_state = threading.local()
+
+
+def get_product_variant_model():
+    return apps.get_model('products', 'ProductVariant')
+
+
+def cart_totals_expressions():
+    """Выражения для UPDATE корзин: суммы по их позициям."""
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    return {
+        'total_items': Coalesce(
+            Subquery(items.annotate(value=Sum('quantity')).values('value')),
+            0,
+        ),
+        'total_price': Coalesce(
+            Subquery(items.annotate(
+                value=Sum(F('quantity') * F('variant__price'), output_field=PRICE_FIELD),
+            ).values('value')),
+            Value(Decimal('0'), output_field=PRICE_FIELD),
+        ),
+    }
+
+
+def recalculate_cart_totals(carts=None):
+    """Пересчитывает итоги корзин (по умолчанию всех) одним запросом."""
+    if carts is None:
+        carts = Cart.objects.all()
+    return carts.update(**cart_totals_expressions())
+
+
+def apply_item_delta(cart_id, variant_id, quantity_delta):
+    """Сдвигает итоги корзины на quantity_delta единиц варианта по его текущей цене."""
+    if not quantity_delta:
+        return
+
+    variant_price = Subquery(
+        get_product_variant_model().objects.filter(pk=variant_id).values('price')[:1]
+    )
+    Cart.objects.filter(pk=cart_id).update(
+        total_items=F('total_items') + quantity_delta,
+        total_price=F('total_price') + ExpressionWrapper(
+            Value(quantity_delta) * variant_price,
+            output_field=PRICE_FIELD,
+        ),
+        # Изменённая корзина снова активна, даже если sweep_carts пометил её брошенной
+        status='active',
+        updated_at=timezone.now(),
+    )
+
+
+def get_deferred_cart_ids():
+    """Множество корзин, итоги которых отложены, или None вне deferred_cart_totals()."""
+    return getattr(_state, 'cart_ids', None)
+
+
+@contextmanager
+def deferred_cart_totals():
+    """
+    Для массовых изменений позиций: внутри блока сигналы не трогают итоги,
+    а только запоминают корзины; на выходе они пересчитываются одним запросом.
+    bulk_create/bulk_update сигналов не шлют — такие корзины добавляйте в
+    возвращаемое множество сами.
+    """
+    previous = get_deferred_cart_ids()
+    cart_ids = set()
+    _state.cart_ids = cart_ids
+    try:
+        yield cart_ids
+    finally:
+        _state.cart_ids = previous
+
+    if cart_ids:
+        Cart.objects.filter(pk__in=cart_ids).update(
+            **cart_totals_expressions(),
+            status='active',
+            updated_at=timezone.now(),
+        )
@@ -1,12 +1,23 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from apps.products.serializers import OrderSerializer
 from django.apps import apps
+from django.db import transaction
 from .models import Cart, CartItem
+from .checkout import CheckoutError, checkout_cart
+from .identity import get_guest_token, get_legacy_session_key, new_guest_token, set_guest_cookie
+from .reservations import release_cart_reservations, reserve_cart_stock
+from .projections import serialize_cart, serialize_empty_cart
 from .serializers import (
-    CartSerializer, CartItemSerializer,
-    CartAddItemSerializer, CartUpdateItemSerializer
+    CartItemSerializer,
+    CartAddItemSerializer, CartUpdateItemSerializer,
+    CartBatchSerializer, CartCheckoutSerializer
 )
+from .totals import deferred_cart_totals
+
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
 
 
 # Получаем модель из приложения products
@@ -17,39 +28,60 @@ def get_product_variant_model():
 class CartViewSet(viewsets.ViewSet):
     """Viewset для управления корзиной"""
     
-    def get_cart(self, request):
-        """Получить или создать корзину для пользователя/сессии"""
+    def get_cart(self, request, create=True):
+        """
+        Получить корзину пользователя/гостя.
+        С create=False корзина не создаётся: если её нет, возвращается None
+        (клиенту отдаётся виртуальная пустая корзина без INSERT).
+        """
         if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(
-                user=request.user,
-                defaults={'status': 'active'}
-            )
-            return cart
+            lookup = {'user': request.user}
         else:
-            session_key = request.session.session_key
-            if not session_key:
-                request.session.save()
-                session_key = request.session.session_key
-            
-            cart, created = Cart.objects.get_or_create(
-                session_key=session_key,
-                defaults={'status': 'active'}
-            )
-            return cart
+            # Гость узнаётся по токену в подписанной cookie (identity.py), сессия не пишется
+            token = get_guest_token(request)
+            if token is None:
+                # Корзины, созданные до перехода на токен, находим по старой cookie сессии
+                legacy_key = get_legacy_session_key(request)
+                if legacy_key and Cart.objects.filter(session_key=legacy_key, user__isnull=True).exists():
+                    token = legacy_key
+                elif not create:
+                    return None
+                else:
+                    token = new_guest_token()
+            lookup = {'session_key': token}
+        
+        if create:
+            cart, created = Cart.objects.get_or_create(**lookup, defaults={'status': 'active'})
+        else:
+            cart = Cart.objects.filter(**lookup).first()
+        
+        if cart is not None and not request.user.is_authenticated:
+            request.guest_cart_token = cart.session_key
+        return cart
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        token = getattr(request, 'guest_cart_token', None)
+        if token:
+            set_guest_cookie(response, token)
+        return response
     
     def list(self, request):
         """Получить содержимое корзины"""
-        cart = self.get_cart(request)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        cart = self.get_cart(request, create=False)
+        if cart is None:
+            return Response(serialize_empty_cart())
+        return Response(serialize_cart(cart))
     
     @action(detail=False, methods=['post'])
+    @transaction.atomic
     def add_item(self, request):
         """Добавить товар в корзину"""
-        cart = self.get_cart(request)
         serializer = CartAddItemSerializer(data=request.data)
         
         if serializer.is_valid():
+            # Строка Cart появляется только при первом успешном добавлении
+            cart = self.get_cart(request)
             variant_id = serializer.validated_data['variant_id']
             quantity = serializer.validated_data['quantity']
             
@@ -60,8 +92,9 @@ class CartViewSet(viewsets.ViewSet):
                 
                 # ✅ УДАЛЕНА ПРОВЕРКА СКЛАДА (товары заказываются по запросу)
                 
-                # Добавление или обновление элемента корзины
-                cart_item, created = CartItem.objects.get_or_create(
+                # Добавление или обновление элемента корзины; строка блокируется,
+                # чтобы параллельные добавления не потеряли количество и итоги
+                cart_item, created = CartItem.objects.select_for_update().get_or_create(
                     cart=cart,
                     variant=variant,
                     defaults={'quantity': quantity}
@@ -72,8 +105,7 @@ class CartViewSet(viewsets.ViewSet):
                     # ✅ УДАЛЕНА ПРОВЕРКА СКЛАДА ПОСЛЕ ОБНОВЛЕНИЯ
                     cart_item.save()
                 
-                cart_serializer = CartSerializer(cart)
-                return Response(cart_serializer.data, status=status.HTTP_201_CREATED)
+                return Response(serialize_cart(cart), status=status.HTTP_201_CREATED)
             
             except ProductVariant.DoesNotExist:
                 return Response(
@@ -84,14 +116,17 @@ class CartViewSet(viewsets.ViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['post'])
+    @transaction.atomic
     def update_item(self, request):
         """Обновить количество товара в корзине"""
-        cart = self.get_cart(request)
+        cart = self.get_cart(request, create=False)
         item_id = request.data.get('item_id')
         serializer = CartUpdateItemSerializer(data=request.data)
         
         if serializer.is_valid():
             try:
+                if cart is None:
+                    raise CartItem.DoesNotExist
                 cart_item = CartItem.objects.get(id=item_id, cart=cart)
                 quantity = serializer.validated_data['quantity']
                 
@@ -100,8 +135,7 @@ class CartViewSet(viewsets.ViewSet):
                 cart_item.quantity = quantity
                 cart_item.save()
                 
-                cart_serializer = CartSerializer(cart)
-                return Response(cart_serializer.data)
+                return Response(serialize_cart(cart))
             
             except CartItem.DoesNotExist:
                 return Response(
@@ -112,17 +146,19 @@ class CartViewSet(viewsets.ViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['delete'])
+    @transaction.atomic
     def remove_item(self, request):
         """Удалить товар из корзины"""
-        cart = self.get_cart(request)
+        cart = self.get_cart(request, create=False)
         item_id = request.data.get('item_id')
         
         try:
+            if cart is None:
+                raise CartItem.DoesNotExist
             cart_item = CartItem.objects.get(id=item_id, cart=cart)
             cart_item.delete()
             
-            cart_serializer = CartSerializer(cart)
-            return Response(cart_serializer.data)
+            return Response(serialize_cart(cart))
         
         except CartItem.DoesNotExist:
             return Response(
@@ -130,31 +166,154 @@ class CartViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    @action(detail=False, methods=['post'])
+    @transaction.atomic
+    def batch(self, request):
+        """
+        Применить пакет операций add/set/remove по variant_id.
+        Операции применяются по порядку в памяти, затем пишутся разом:
+        bulk_create новых позиций, bulk_update изменённых, один DELETE.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        cart = self.get_cart(request, create=False)
+        operations = serializer.validated_data['operations']
+        variant_ids = {operation['variant_id'] for operation in operations}
+        items = {}
+        if cart is not None:
+            items = {
+                item.variant_id: item
+                for item in cart.items.filter(variant_id__in=variant_ids).select_for_update()
+            }
+
+        quantities = {variant_id: item.quantity for variant_id, item in items.items()}
+        for operation in operations:
+            variant_id = operation['variant_id']
+            if operation['op'] == 'add':
+                quantities[variant_id] = quantities.get(variant_id, 0) + operation['quantity']
+            elif operation['op'] == 'set':
+                quantities[variant_id] = operation['quantity']
+            else:
+                quantities[variant_id] = 0
+
+        if cart is None:
+            if not any(quantities.values()):
+                return Response(serialize_empty_cart())
+            cart = self.get_cart(request)
+
+        to_create, to_update, to_delete = [], [], []
+        for variant_id, quantity in quantities.items():
+            item = items.get(variant_id)
+            if item is None:
+                if quantity:
+                    to_create.append(CartItem(cart=cart, variant_id=variant_id, quantity=quantity))
+            elif not quantity:
+                to_delete.append(item.pk)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        with deferred_cart_totals() as cart_ids:
+            CartItem.objects.bulk_create(to_create)
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+            CartItem.objects.filter(pk__in=to_delete).delete()
+            if to_create or to_update or to_delete:
+                cart_ids.add(cart.pk)
+
+        return Response(serialize_cart(cart))
+
+    @action(detail=False, methods=['post', 'delete'])
+    def reserve(self, request):
+        """
+        POST — зарезервировать остаток под позиции корзины на
+        STOCK_RESERVATION_MINUTES минут (повторный вызов продлевает резерв).
+        DELETE — снять резерв.
+        """
+        cart = self.get_cart(request, create=False)
+        if request.method == 'DELETE':
+            if cart is not None:
+                release_cart_reservations(cart)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        
+        if cart is None:
+            return Response(
+                {'error': 'Корзина пуста'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            expires_at = reserve_cart_stock(cart)
+        except CheckoutError as e:
+            return Response(
+                {'error': e.message, 'items': e.unavailable},
+                status=status.HTTP_409_CONFLICT if e.unavailable else status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'reserved_until': expires_at,
+            'items': [
+                {'variant': variant_id, 'quantity': quantity}
+                for variant_id, quantity in cart.reservations.order_by('variant_id').values_list('variant_id', 'quantity')
+            ],
+        })
+    
     @action(detail=False, methods=['delete'])
+    @transaction.atomic
     def clear(self, request):
         """Очистить корзину"""
-        cart = self.get_cart(request)
+        cart = self.get_cart(request, create=False)
+        if cart is None:
+            return Response(serialize_empty_cart())
         cart.items.all().delete()
         
-        cart_serializer = CartSerializer(cart)
-        return Response(cart_serializer.data)
+        return Response(serialize_cart(cart))
     
     @action(detail=False, methods=['post'])
     def checkout(self, request):
-        """Оформить заказ из корзины"""
-        cart = self.get_cart(request)
+        """
+        Оформить заказ из корзины.
+        Заголовок Idempotency-Key делает повтор запроса безопасным:
+        вернётся уже созданный заказ, а не новый.
+        """
+        cart = self.get_cart(request, create=False)
         
-        # Проверка наличия товаров в корзине
-        if not cart.items.exists():
+        # Пустую существующую корзину проверяет checkout_cart: повтор уже
+        # оформленного запроса должен найти заказ по ключу, а не получить ошибку
+        if cart is None:
             return Response(
                 {'error': 'Корзина пуста'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Логика создания заказа (будет реализована позже)
-        cart_serializer = CartSerializer(cart)
-        return Response({
-            'cart': cart_serializer.data,
-            'message': 'Переход к оформлению заказа',
-            'next_step': '/checkout'
-        })
\ No newline at end of file
+        serializer = CartCheckoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {'error': 'Слишком длинный Idempotency-Key'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            order, created = checkout_cart(
+                cart,
+                idempotency_key=idempotency_key or None,
+                **serializer.validated_data
+            )
+        except CheckoutError as e:
+            return Response(
+                {'error': e.message, 'items': e.unavailable},
+                status=status.HTTP_409_CONFLICT if e.unavailable else status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(
+            {
+                'order': OrderSerializer(order).data,
+                'cart': serialize_cart(cart),
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
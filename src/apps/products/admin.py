@@ -6,6 +6,7 @@ from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from decimal import Decimal
 from .models import Category, Brand, Product, ProductImage, ProductVariant, Attribute, Order, OrderItem, HeroBlock
+from .schema import attribute_schema
 
 
 SPEC_FIELD_PREFIX = 'spec__'
@@ -28,19 +29,14 @@ def build_attribute_form_field(attribute, required=None):
 
 
 def get_category_attributes(category, applies_to):
-    if not category:
-        return []
-    return list(category.attributes.filter(applies_to=applies_to).order_by('sort_order', 'name'))
+    return attribute_schema.get_attributes(category, applies_to)
 
 
 def get_category_color_attribute(category):
-    if not category:
+    color_attribute = attribute_schema.get_attribute_map(category, 'variant').get('color')
+    if color_attribute is None or color_attribute.type != 'enum':
         return None
-    return category.attributes.filter(
-        applies_to='variant',
-        slug='color',
-        type='enum',
-    ).first()
+    return color_attribute
 
 
 def get_color_value_choices(category, current_value=''):
@@ -124,7 +120,7 @@ class ProductAdminForm(forms.ModelForm):
 # =============== КАТЕГОРИИ ===============
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'is_header_menu', 'parent', 'created_at']
+    list_display = ['name', 'slug', 'is_header_menu', 'parent', 'depth', 'created_at']
     list_filter = ['parent', 'created_at']
     search_fields = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
@@ -486,10 +482,10 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'contact_name', 'contact_phone', 'user', 'created_at']
+    list_display = ['id', 'contact_name', 'contact_phone', 'user', 'total_price', 'created_at']
     list_filter = ['created_at', 'user']
     search_fields = ['contact_name', 'contact_phone', 'user__username']
-    readonly_fields = ['created_at']
+    readonly_fields = ['total_price', 'created_at']
     inlines = [OrderItemInline]
     
     # Запретить редактирование, если нужно (только просмотр)
@@ -500,7 +496,7 @@ class OrderAdmin(admin.ModelAdmin):
 
 @admin.register(HeroBlock)
 class HeroBlockAdmin(admin.ModelAdmin):
-    list_display = ['title', 'status', 'is_active', 'order', 'published_at']
+    list_display = ['title', 'status', 'is_active', 'order', 'published_at', 'publish_at', 'unpublish_at']
     list_filter = ['status', 'is_active', 'published_at']
     search_fields = ['title', 'subtitle', 'description']
     list_editable = ['order', 'is_active']
@@ -514,7 +510,7 @@ class HeroBlockAdmin(admin.ModelAdmin):
             'fields': ('background_color', 'text_color', 'button_text', 'button_link')
         }),
         ('Статус и публикация', {
-            'fields': ('status', 'is_active', 'order', 'published_at')
+            'fields': ('status', 'is_active', 'order', 'published_at', 'publish_at', 'unpublish_at')
         }),
         ('Связи', {
             'fields': ('product',)
@@ -4,3 +4,6 @@ class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.products'
     verbose_name = "Товары"
+
+    def ready(self):
+        from . import signals  # noqa: F401
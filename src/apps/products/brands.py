@@ -0,0 +1,63 @@
+"""
+Агрегаты брендов: число активных товаров, минимальная цена и категории.
+
+Хранятся прямо в Brand, чтобы шапка страницы бренда не сканировала товары.
+Пересчитываются сигналами при изменении товаров и вариантов (signals.py),
+после ключей сортировки — минимальная цена берётся из Product.min_price.
+
+Товары на странице бренда выводятся лёгкими карточками (brand_product_cards).
+"""
+from django.db.models import Count, Min, OuterRef, Subquery
+
+from .models import PRODUCT_VIDEO_EXTENSIONS, Brand, Product, ProductImage
+from .pagination import CURSOR_FIELDS
+
+# Поля товара, которые выводит ProductCardSerializer
+CARD_FIELDS = ('name', 'slug', 'is_preorder')
+
+
+def refresh_brand_aggregates(brand_ids):
+    """Пересчитывает агрегаты указанных брендов; bulk_update сигналов не шлёт."""
+    brand_ids = {brand_id for brand_id in brand_ids if brand_id is not None}
+    if not brand_ids:
+        return
+
+    products = Product.objects.filter(brand_id__in=brand_ids, is_active=True).order_by()
+    stats = {
+        row['brand_id']: row
+        for row in products.values('brand_id').annotate(count=Count('pk'), price=Min('min_price'))
+    }
+    categories = {}
+    for brand_id, category_id in products.values_list('brand_id', 'category_id').distinct().order_by(
+        'brand_id',
+        'category_id',
+    ):
+        categories.setdefault(brand_id, []).append(category_id)
+
+    brands = list(Brand.objects.filter(pk__in=brand_ids).only('pk'))
+    for brand in brands:
+        row = stats.get(brand.pk, {})
+        brand.product_count = row.get('count', 0)
+        brand.min_price = row.get('price')
+        brand.category_ids = categories.get(brand.pk, [])
+    Brand.objects.bulk_update(brands, ['product_count', 'min_price', 'category_ids'])
+
+
+def brand_ids_for_products(product_ids):
+    return Product.objects.filter(pk__in=product_ids, brand__isnull=False).values_list('brand_id', flat=True)
+
+
+def first_image_subquery(product_ref='pk'):
+    """Путь первого изображения товара (видео пропускаются) или NULL; product_ref — поле с id товара."""
+    images = ProductImage.objects.filter(product=OuterRef(product_ref))
+    for extension in PRODUCT_VIDEO_EXTENSIONS:
+        images = images.exclude(image__iendswith=extension)
+    return Subquery(images.order_by('order', 'pk').values('image')[:1])
+
+
+def brand_product_cards(brand):
+    """Активные товары бренда с полями карточки, без вариантов и характеристик."""
+    return Product.objects.filter(brand=brand, is_active=True).only(
+        *CURSOR_FIELDS,
+        *CARD_FIELDS,
+    ).annotate(card_image=first_image_subquery())
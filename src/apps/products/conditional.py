@@ -0,0 +1,93 @@
+"""
+Условные GET-запросы (ETag / Last-Modified / 304) для эндпоинтов каталога.
+
+Валидаторы считаются из версий областей каталога (versioning.py) — один
+запрос к кэшу, без обращения к БД и без сериализации. Если клиент прислал
+актуальные If-None-Match или If-Modified-Since, отвечаем 304 до вызова обработчика.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from .versioning import get_versions
+
+CATEGORIES_SCOPE = 'categories'
+BRANDS_SCOPE = 'brands'
+PRODUCTS_SCOPE = 'products'
+ATTRIBUTES_SCOPE = 'attributes'
+HERO_BLOCKS_SCOPE = 'hero-blocks'
+# Резервы корзин меняют доступный остаток, не трогая товары
+STOCK_SCOPE = 'stock'
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class NotModified(Exception):
+    pass
+
+
+class ConditionalGetMixin:
+    """
+    conditional_scopes — области, от которых зависит ответ viewset;
+    conditional_action_scopes — переопределение для отдельных действий.
+    Пустой набор областей отключает проверку.
+    """
+
+    conditional_scopes = ()
+    conditional_action_scopes = {}
+
+    def get_conditional_scopes(self):
+        return self.conditional_action_scopes.get(self.action, self.conditional_scopes)
+
+    def get_validators(self, request):
+        """(etag, last_modified) для текущего запроса или None, если проверка не нужна."""
+        scopes = self.get_conditional_scopes()
+        if request.method not in SAFE_METHODS or not scopes:
+            return None
+
+        versions = get_versions(*scopes)
+        # Ответ зависит ещё от адреса (хост, фильтры, страница), формата и того, вошёл ли пользователь
+        parts = [
+            self.__class__.__name__,
+            str(self.action),
+            request.build_absolute_uri(),
+            str(getattr(request, 'accepted_media_type', '')),
+            str(request.user.is_authenticated),
+        ]
+        parts.extend(f'{scope}={versions[scope]}' for scope in sorted(versions))
+        etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+        return f'"{etag}"', max(versions.values()) // 10 ** 9
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        self.conditional_headers = None
+        validators = self.get_validators(request)
+        if validators is None:
+            return
+
+        etag, last_modified = validators
+        self.conditional_headers = {'ETag': etag, 'Last-Modified': http_date(last_modified)}
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None and response.status_code == status.HTTP_304_NOT_MODIFIED:
+            raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        headers = getattr(self, 'conditional_headers', None)
+        if headers and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            for header, value in headers.items():
+                response[header] = value
+            # Браузер хранит ответ, но каждый раз переспрашивает сервер
+            patch_cache_control(response, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+        return response
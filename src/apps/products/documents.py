@@ -0,0 +1,133 @@
+"""
+Документы товаров — заранее собранный вывод ProductSerializer.
+
+Списки каталога отдают документы как есть, не прогоняя сериализатор
+на каждый запрос. Изменения каталога удаляют устаревшие документы сразу,
+а пересборка выполняется после коммита транзакции (см. signals.py).
+Остаток вариантов в документе — на момент сборки: при выдаче его заменяет
+текущий (stock.apply_available_stock), поэтому списание остатка документы
+не трогает.
+"""
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+from .models import Product, ProductDocument
+from .renderers import RawJSON
+from .serializers import ProductSerializer
+from .stock import document_stock_key
+
+DOCUMENT_CHUNK_SIZE = 200
+
+# Пересборка, запланированная текущей транзакцией потока (см. invalidate_product_documents)
+_pending = threading.local()
+
+
+def get_document_queryset():
+    return Product.objects.select_related(
+        'brand',
+        'category',
+    ).prefetch_related(
+        'images',
+        'variants',
+    )
+
+
+def build_product_document(product):
+    """Собирает документ товара без request; ссылки на медиа — от MEDIA_SITE_URL, как в детальном ответе."""
+    return ProductSerializer(product, context={'request': None}).data
+
+
+class ProductDocumentJSON(RawJSON):
+    """Готовый документ товара; stock_key — остатки вариантов на момент сборки (stock.py)."""
+
+    __slots__ = ('stock_key',)
+
+    def __init__(self, raw, pk=None, stock_key=None):
+        super().__init__(raw, pk=pk)
+        self.stock_key = stock_key
+
+
+def refresh_product_documents(product_ids):
+    """Пересобирает документы указанных товаров и возвращает {product_id: data}."""
+    product_ids = list(product_ids)
+    documents = {}
+
+    for start in range(0, len(product_ids), DOCUMENT_CHUNK_SIZE):
+        chunk = product_ids[start:start + DOCUMENT_CHUNK_SIZE]
+        batch = []
+        for product in get_document_queryset().filter(pk__in=chunk):
+            data = build_product_document(product)
+            batch.append(ProductDocument(product=product, data=data, stock_key=document_stock_key(data)))
+        ProductDocument.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['data', 'stock_key', 'updated_at'],
+        )
+        documents.update((document.product_id, document.data) for document in batch)
+
+    return documents
+
+
+def invalidate_product_documents(product_ids):
+    """Удаляет устаревшие документы и планирует их пересборку после коммита."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    ProductDocument.objects.filter(product_id__in=product_ids).delete()
+
+    # id копятся в наборе пересборки своей транзакции: пока её on_commit в очереди,
+    # новые id добавляются к нему. При откате колбэк пропадает вместе с набором,
+    # а чужие транзакции и потоки получают собственные наборы
+    connection = transaction.get_connection()
+    flush = getattr(_pending, 'flush', None)
+    if connection.in_atomic_block and flush is not None and any(
+        callback is flush for _, callback, *_ in connection.run_on_commit
+    ):
+        flush.args[0].update(product_ids)
+        return
+
+    _pending.flush = partial(refresh_product_documents, product_ids)
+    transaction.on_commit(_pending.flush)
+
+
+def get_product_documents(products):
+    """
+    Возвращает документы для товаров в исходном порядке.
+    Отсутствующие документы собираются на месте и сохраняются.
+    """
+    product_ids = [product.pk for product in products]
+    documents = dict(
+        ProductDocument.objects.filter(product_id__in=product_ids).values_list('product_id', 'data')
+    )
+
+    missing_ids = [product_id for product_id in product_ids if product_id not in documents]
+    if missing_ids:
+        documents.update(refresh_product_documents(missing_ids))
+
+    return [documents[product_id] for product_id in product_ids if product_id in documents]
+
+
+def get_encoded_product_documents(products):
+    """
+    То же, что get_product_documents, но сохранённые документы читаются
+    из БД текстом и отдаются как RawJSON — рендерер пишет их без перекодирования.
+    """
+    product_ids = [product.pk for product in products]
+    documents = {
+        product_id: ProductDocumentJSON(raw, pk=product_id, stock_key=stock_key)
+        for product_id, raw, stock_key in ProductDocument.objects.filter(product_id__in=product_ids).annotate(
+            raw=Cast('data', output_field=TextField()),
+        ).values_list('product_id', 'raw', 'stock_key')
+    }
+
+    missing_ids = [product_id for product_id in product_ids if product_id not in documents]
+    if missing_ids:
+        documents.update(refresh_product_documents(missing_ids))
+
+    return [documents[product_id] for product_id in product_ids if product_id in documents]
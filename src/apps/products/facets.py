@@ -0,0 +1,214 @@
+"""
+Фасеты каталога: плоская таблица «товар × значение характеристики».
+
+Строки ProductFacetValue собираются из Product.specifications и
+ProductVariant.attributes и хранятся только для активных товаров;
+сигналы пересобирают их при сохранении товара или его вариантов.
+
+По этой же таблице фильтруются списки товаров (spec__/attr__), поэтому
+счётчики фасетов всегда совпадают с тем, что вернёт список. Значения длиннее
+MAX_VALUE_LENGTH в таблицу не попадают: фильтр по ним ищет в JSON-полях.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Min
+
+from .models import Product, ProductFacetValue, ProductVariant
+from .schema import attribute_schema
+
+FACET_CHUNK_SIZE = 500
+FILTER_PREFIXES = {
+    'spec__': 'product',
+    'attr__': 'variant',
+}
+PARAM_PREFIXES = {applies_to: prefix for prefix, applies_to in FILTER_PREFIXES.items()}
+MAX_VALUE_LENGTH = 255
+
+
+def facet_display_value(value):
+    """Строковое представление значения или None, если по нему нельзя фильтровать."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, str):
+        value = value.strip()
+        if value and len(value) <= MAX_VALUE_LENGTH:
+            return value
+    return None
+
+
+def normalize_facet_value(value):
+    return value.strip().lower()
+
+
+def build_facet_rows(product):
+    """Строки фасетов товара. Ожидает товар с загруженными variants."""
+    sources = [('product', product.specifications or {})]
+    sources.extend(('variant', variant.attributes or {}) for variant in product.variants.all())
+
+    rows = {}
+    for applies_to, values in sources:
+        for slug, raw_value in values.items():
+            value = facet_display_value(raw_value)
+            if value is None:
+                continue
+            key = (applies_to, slug, normalize_facet_value(value))
+            rows.setdefault(key, ProductFacetValue(
+                product=product,
+                category_id=product.category_id,
+                applies_to=applies_to,
+                attribute_slug=slug,
+                value=value,
+                normalized=key[2],
+            ))
+    return list(rows.values())
+
+
+def refresh_product_facets(product_ids):
+    """Пересобирает строки фасетов товаров; у неактивных товаров строки удаляются."""
+    product_ids = list(product_ids)
+
+    for start in range(0, len(product_ids), FACET_CHUNK_SIZE):
+        chunk = product_ids[start:start + FACET_CHUNK_SIZE]
+        products = Product.objects.filter(pk__in=chunk, is_active=True).prefetch_related('variants')
+        rows = [row for product in products for row in build_facet_rows(product)]
+
+        ProductFacetValue.objects.filter(product_id__in=chunk).delete()
+        ProductFacetValue.objects.bulk_create(rows)
+
+
+def parse_facet_filters(query_params):
+    """Достаёт из запроса фильтры spec__/attr__: {(applies_to, slug): (value, normalized)}."""
+    filters = {}
+    for key, value in query_params.items():
+        value = value.strip()
+        if not value:
+            continue
+        for prefix, applies_to in FILTER_PREFIXES.items():
+            slug = key[len(prefix):]
+            if key.startswith(prefix) and slug:
+                filters[(applies_to, slug)] = (value, normalize_facet_value(value))
+    return filters
+
+
+def _json_matching(applies_to, slug, value):
+    """Товары со значением, которое не помещается в таблицу фасетов: поиск по JSON."""
+    if applies_to == 'product':
+        return Product.objects.filter(**{f'specifications__{slug}__iexact': value}).values('pk')
+    return ProductVariant.objects.filter(**{f'attributes__{slug}__iexact': value}).values('product_id')
+
+
+def filter_by_facets(queryset, filters, field='pk'):
+    """Оставляет в queryset товары (или строки по полю field), подходящие под все фильтры."""
+    for (applies_to, slug), (value, normalized) in filters.items():
+        if len(normalized) > MAX_VALUE_LENGTH:
+            matching = _json_matching(applies_to, slug, value)
+        else:
+            matching = ProductFacetValue.objects.filter(
+                applies_to=applies_to,
+                attribute_slug=slug,
+                normalized=normalized,
+            ).values('product_id')
+        queryset = queryset.filter(**{f'{field}__in': matching})
+    return queryset
+
+
+def _count_values(category, keys, filters):
+    """Один запрос: {(applies_to, slug): {normalized: (value, count)}} для набора ключей."""
+    if not keys:
+        return {}
+    rows = ProductFacetValue.objects.filter(category=category)
+    rows = filter_by_facets(rows, filters, field='product_id')
+    slugs = {slug for _, slug in keys}
+    rows = rows.filter(attribute_slug__in=slugs).values(
+        'applies_to',
+        'attribute_slug',
+        'normalized',
+    ).annotate(
+        count=Count('product_id'),
+        value=Min('value'),
+    ).order_by()
+
+    counts = {}
+    for row in rows:
+        key = (row['applies_to'], row['attribute_slug'])
+        if key in keys:
+            counts.setdefault(key, {})[row['normalized']] = (row['value'], row['count'])
+    return counts
+
+
+def _sort_key(attribute):
+    order = {}
+    if attribute.type == 'enum' and isinstance(attribute.values, list):
+        order = {normalize_facet_value(str(value)): index for index, value in enumerate(attribute.values)}
+
+    def key(item):
+        normalized, value = item['normalized'], item['value']
+        if normalized in order:
+            return (0, order[normalized], 0, '')
+        if attribute.type == 'number':
+            try:
+                return (1, 0, Decimal(value.replace(',', '.')), '')
+            except InvalidOperation:
+                pass
+        return (2, 0, 0, normalized)
+
+    return key
+
+
+def get_category_facets(category, filters):
+    """
+    Счётчики значений по всем атрибутам категории.
+
+    Счётчики дизъюнктивные: для атрибута, по которому уже выбран фильтр,
+    этот фильтр не учитывается — видно, сколько товаров даст другое значение.
+    Запросов: один на общее число, один на все атрибуты без фильтра
+    и по одному на каждый атрибут с выбранным фильтром.
+    """
+    attributes = sorted(
+        attribute_schema.get_attributes(category, 'product')
+        + attribute_schema.get_attributes(category, 'variant'),
+        key=lambda attribute: (attribute.sort_order, attribute.name),
+    )
+    keys = {(attribute.applies_to, attribute.slug) for attribute in attributes}
+
+    products = Product.objects.filter(category=category, is_active=True)
+    total = filter_by_facets(products, filters).count()
+
+    counts = _count_values(category, keys - filters.keys(), filters)
+    for key in keys & filters.keys():
+        other_filters = {other: value for other, value in filters.items() if other != key}
+        counts.update(_count_values(category, {key}, other_filters))
+
+    facets = []
+    for attribute in attributes:
+        key = (attribute.applies_to, attribute.slug)
+        selected = filters.get(key)
+        values = [
+            {
+                'value': value,
+                'normalized': normalized,
+                'count': count,
+                'selected': selected is not None and selected[1] == normalized,
+            }
+            for normalized, (value, count) in counts.get(key, {}).items()
+        ]
+        if selected is not None and not any(item['selected'] for item in values):
+            values.append({'value': selected[0], 'normalized': selected[1], 'count': 0, 'selected': True})
+        values.sort(key=_sort_key(attribute))
+
+        facets.append({
+            'slug': attribute.slug,
+            'name': attribute.name,
+            'type': attribute.type,
+            'unit': attribute.unit,
+            'applies_to': attribute.applies_to,
+            'param': f'{PARAM_PREFIXES[attribute.applies_to]}{attribute.slug}',
+            'values': [
+                {'value': item['value'], 'count': item['count'], 'selected': item['selected']}
+                for item in values
+            ],
+        })
+
+    return {'count': total, 'facets': facets}
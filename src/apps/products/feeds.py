@@ -0,0 +1,363 @@
+"""
+Фиды каталога для маркетплейсов и агрегаторов цен: YML (Яндекс Маркет),
+CSV и Google Merchant (RSS 2.0). Одна запись фида — активный вариант
+активного товара.
+
+Фид отдаётся генератором строк: варианты читаются .iterator(chunk_size=...)
+вместе с товаром, брендом и категорией, память не растёт с размером каталога.
+
+В инкрементальном режиме готовый текст записей хранится в FeedEntry, а в
+FeedState — начало последней завершённой выгрузки (watermark). Из БД
+читаются только варианты, изменившиеся после него: updated_at варианта
+(цена, остаток и прочие поля), товара, бренда или категории. Остальные
+записи берутся готовыми из FeedEntry и сливаются с перерисованными по id.
+Перерисованные записи сохраняются пачками по мере выдачи (upsert, повтор
+безопасен), так что память не растёт с размером каталога. Watermark и
+удаление записей ушедших вариантов сохраняются одной транзакцией, только
+когда фид выдан целиком: оборванная выгрузка watermark не сдвигает, и
+следующая перерисует те же варианты.
+"""
+import csv
+import hashlib
+import heapq
+import io
+from itertools import islice
+from operator import itemgetter
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .brands import first_image_subquery
+from .models import Category, FeedEntry, FeedState, ProductVariant
+
+FEED_CHUNK_SIZE = 2000
+FEED_MAX_CHUNK_SIZE = 10000
+# Увеличивается при изменении шаблонов записей: сохранённые записи перерисуются
+FEED_ENTRY_VERSION = 1
+
+VARIANT_FIELDS = ('pk', 'product_id', 'sku', 'attributes', 'price', 'old_price', 'stock')
+PRODUCT_FIELDS = (
+    'product__name', 'product__slug', 'product__short_description', 'product__is_preorder',
+    'product__brand_id', 'product__category_id', 'product__brand__name', 'product__category__name',
+)
+
+
+def active_variants():
+    return ProductVariant.objects.filter(is_active=True, product__is_active=True)
+
+
+def feed_variants():
+    """Варианты фида с полями товара, бренда, категории и первым изображением."""
+    return active_variants().select_related(
+        'product',
+        'product__brand',
+        'product__category',
+    ).only(*VARIANT_FIELDS, *PRODUCT_FIELDS).annotate(
+        feed_image=first_image_subquery('product_id'),
+    ).order_by('pk')
+
+
+def product_url(product):
+    return urljoin(settings.FEED_SITE_URL, settings.FEED_PRODUCT_PATH.format(slug=product.slug))
+
+
+def media_url(name):
+    if not name:
+        return ''
+    return urljoin(settings.FEED_MEDIA_URL, default_storage.url(name))
+
+
+def variant_title(variant):
+    """Название товара со значениями атрибутов варианта: «iPhone 15 Pro 256GB Black»."""
+    values = [str(value) for value in (variant.attributes or {}).values() if value not in (None, '')]
+    return ' '.join([variant.product.name, *values])
+
+
+def is_available(variant):
+    return variant.stock > 0 or variant.product.is_preorder
+
+
+def has_discount(variant):
+    return variant.old_price is not None and variant.old_price > variant.price
+
+
+def format_price(value):
+    return f'{value:.2f}'
+
+
+def feed_settings_fingerprint():
+    """Отпечаток шаблонов записей и настроек, из которых они рендерятся."""
+    parts = (
+        FEED_ENTRY_VERSION,
+        settings.FEED_SITE_URL,
+        settings.FEED_MEDIA_URL,
+        settings.FEED_PRODUCT_PATH,
+        settings.FEED_CURRENCY,
+    )
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def changed_since(feed_format, watermark):
+    """Условие на варианты: менялись после watermark или ещё не выгружались в этот фид."""
+    return (
+        Q(updated_at__gt=watermark)
+        | Q(product__updated_at__gt=watermark)
+        | Q(product__brand__updated_at__gt=watermark)
+        | Q(product__category__updated_at__gt=watermark)
+        | ~Exists(FeedEntry.objects.filter(format=feed_format, variant=OuterRef('pk')))
+    )
+
+
+def _element(name, value):
+    if value in (None, ''):
+        return ''
+    return f'<{name}>{escape(str(value))}</{name}>'
+
+
+class YMLFeed:
+    """Яндекс Маркет (YML): offers с group_id товара."""
+
+    content_type = 'application/xml; charset=utf-8'
+    extension = 'xml'
+
+    def header(self):
+        date = timezone.localtime().isoformat(timespec='minutes')
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            f'<yml_catalog date={quoteattr(date)}>',
+            '<shop>',
+            _element('name', settings.FEED_SHOP_NAME),
+            _element('company', settings.FEED_COMPANY_NAME),
+            _element('url', settings.FEED_SITE_URL),
+            '<currencies>',
+            f'<currency id={quoteattr(settings.FEED_CURRENCY)} rate="1"/>',
+            '</currencies>',
+            '<categories>',
+        ]
+        categories = Category.objects.order_by('path').values_list('pk', 'parent_id', 'name')
+        for pk, parent_id, name in categories.iterator():
+            parent = f' parentId="{parent_id}"' if parent_id else ''
+            lines.append(f'<category id="{pk}"{parent}>{escape(name)}</category>')
+        lines += ['</categories>', '<offers>']
+        return '\n'.join(lines) + '\n'
+
+    def entry(self, variant):
+        product = variant.product
+        available = 'true' if is_available(variant) else 'false'
+        parts = [
+            f'<offer id="{variant.pk}" available="{available}" group_id="{product.pk}">',
+            _element('name', variant_title(variant)),
+            _element('url', product_url(product)),
+            _element('price', format_price(variant.price)),
+            _element('oldprice', format_price(variant.old_price) if has_discount(variant) else None),
+            _element('currencyId', settings.FEED_CURRENCY),
+            _element('categoryId', product.category_id),
+            _element('picture', media_url(variant.feed_image)),
+            _element('vendor', product.brand.name if product.brand else None),
+            _element('vendorCode', variant.sku),
+            _element('description', product.short_description),
+            _element('count', variant.stock),
+            '</offer>',
+        ]
+        return ''.join(parts) + '\n'
+
+    def footer(self):
+        return '</offers>\n</shop>\n</yml_catalog>\n'
+
+
+class CSVFeed:
+    """Плоская таблица для агрегаторов цен: строка на вариант."""
+
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+    columns = (
+        'id', 'sku', 'product_id', 'title', 'url', 'price', 'old_price', 'currency',
+        'stock', 'available', 'brand', 'category', 'image',
+    )
+
+    def _row(self, values):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue()
+
+    def header(self):
+        return self._row(self.columns)
+
+    def entry(self, variant):
+        product = variant.product
+        return self._row([
+            variant.pk,
+            variant.sku or '',
+            product.pk,
+            variant_title(variant),
+            product_url(product),
+            format_price(variant.price),
+            format_price(variant.old_price) if has_discount(variant) else '',
+            settings.FEED_CURRENCY,
+            variant.stock,
+            int(is_available(variant)),
+            product.brand.name if product.brand else '',
+            product.category.name,
+            media_url(variant.feed_image),
+        ])
+
+    def footer(self):
+        return ''
+
+
+class MerchantFeed:
+    """Google Merchant Center: RSS 2.0 с пространством имён g:."""
+
+    content_type = 'application/xml; charset=utf-8'
+    extension = 'xml'
+
+    def header(self):
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">',
+            '<channel>',
+            _element('title', settings.FEED_SHOP_NAME),
+            _element('link', settings.FEED_SITE_URL),
+            _element('description', settings.FEED_SHOP_NAME),
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def entry(self, variant):
+        product = variant.product
+        currency = settings.FEED_CURRENCY
+        if has_discount(variant):
+            price = f'{format_price(variant.old_price)} {currency}'
+            sale_price = f'{format_price(variant.price)} {currency}'
+        else:
+            price, sale_price = f'{format_price(variant.price)} {currency}', None
+        if variant.stock > 0:
+            availability = 'in_stock'
+        else:
+            availability = 'preorder' if product.is_preorder else 'out_of_stock'
+        parts = [
+            '<item>',
+            _element('g:id', variant.sku or variant.pk),
+            _element('g:item_group_id', product.pk),
+            _element('g:title', variant_title(variant)),
+            _element('g:description', product.short_description or product.name),
+            _element('g:link', product_url(product)),
+            _element('g:image_link', media_url(variant.feed_image)),
+            _element('g:price', price),
+            _element('g:sale_price', sale_price),
+            _element('g:availability', availability),
+            _element('g:brand', product.brand.name if product.brand else None),
+            _element('g:product_type', product.category.name),
+            _element('g:condition', 'new'),
+            '</item>',
+        ]
+        return ''.join(parts) + '\n'
+
+    def footer(self):
+        return '</channel>\n</rss>\n'
+
+
+FEEDS = {
+    'yml': YMLFeed,
+    'csv': CSVFeed,
+    'merchant': MerchantFeed,
+}
+
+
+def feed_filename(feed_format):
+    return f'{feed_format}-feed.{FEEDS[feed_format].extension}'
+
+
+def _iter_incremental(feed, feed_format, watermark, chunk_size, rendered):
+    """
+    Пары (variant_id, запись) в порядке id: изменившиеся варианты рендерятся
+    и добавляются в rendered, остальные записи читаются из FeedEntry.
+    """
+    changed = feed_variants()
+    stored = FeedEntry.objects.none()
+    if watermark is not None:
+        condition = changed_since(feed_format, watermark)
+        changed = changed.filter(condition)
+        stored = FeedEntry.objects.filter(
+            format=feed_format,
+            variant__in=active_variants().exclude(condition).values('pk'),
+        )
+
+    def render(variants):
+        for variant in variants:
+            body = feed.entry(variant)
+            rendered.append(FeedEntry(format=feed_format, variant_id=variant.pk, body=body))
+            yield variant.pk, body
+
+    # Запрос изменившихся выполняется первым: вариант, изменённый между запросами,
+    # не попадёт в фид дважды, а попадёт в следующую выгрузку
+    return heapq.merge(
+        render(changed.iterator(chunk_size=chunk_size)),
+        stored.order_by('variant_id').values_list('variant_id', 'body').iterator(chunk_size=chunk_size),
+        key=itemgetter(0),
+    )
+
+
+def _save_entries(entries):
+    FeedEntry.objects.bulk_create(
+        entries,
+        batch_size=FEED_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['format', 'variant'],
+        update_fields=['body', 'updated_at'],
+    )
+
+
+def _save_incremental_state(feed_format, started, fingerprint):
+    """Удаление записей ушедших вариантов и watermark — одной транзакцией. Возвращает число удалённых."""
+    with transaction.atomic():
+        removed, _ = FeedEntry.objects.filter(format=feed_format).exclude(
+            variant__in=active_variants().values('pk'),
+        ).delete()
+        FeedState.objects.update_or_create(
+            format=feed_format,
+            defaults={'watermark': started, 'fingerprint': fingerprint},
+        )
+    return removed
+
+
+def iter_feed(feed_format, chunk_size=FEED_CHUNK_SIZE, incremental=False, stats=None):
+    """
+    Генератор текста фида: шапка, записи пачками по chunk_size, подвал.
+    stats (dict) заполняется счётчиками entries, rendered и removed.
+    """
+    feed = FEEDS[feed_format]()
+    stats = stats if stats is not None else {}
+    stats.update(entries=0, rendered=0, removed=0)
+
+    yield feed.header()
+    if not incremental:
+        variants = feed_variants().iterator(chunk_size=chunk_size)
+        while chunk := list(islice(variants, chunk_size)):
+            stats['entries'] += len(chunk)
+            stats['rendered'] += len(chunk)
+            yield ''.join(feed.entry(variant) for variant in chunk)
+        yield feed.footer()
+        return
+
+    started = timezone.now()
+    fingerprint = feed_settings_fingerprint()
+    state = FeedState.objects.filter(format=feed_format).first()
+    # Без завершённой выгрузки с теми же настройками перерисовывается всё
+    watermark = state.watermark if state is not None and state.fingerprint == fingerprint else None
+
+    rendered = []
+    entries = _iter_incremental(feed, feed_format, watermark, chunk_size, rendered)
+    while chunk := list(islice(entries, chunk_size)):
+        stats['entries'] += len(chunk)
+        stats['rendered'] += len(rendered)
+        _save_entries(rendered)
+        rendered.clear()
+        yield ''.join(body for _, body in chunk)
+    yield feed.footer()
+
+    stats['removed'] = _save_incremental_state(feed_format, started, fingerprint)
@@ -0,0 +1,144 @@
+"""
+Разреженные наборы полей (?fields=) и управление вложенностью (?expand=).
+
+fields — имена полей через запятую, поля вложенных объектов через точку:
+?fields=id,name,brand.name. expand — связи из expandable_fields, которые
+выводятся объектами: ?expand=brand,variants; остальные раскрываемые связи
+отдаются id (или списком id). Без параметров вывод не меняется.
+
+Форма запроса (shape) — пара (fields, expand), где каждый элемент — дерево
+{имя: поддерево | None} или None, если ограничения нет. Сериализаторы
+убирают невыводимые поля до сериализации, поэтому их SerializerMethodField
+не вызываются; представления по форме решают, что подгружать из БД,
+а готовые документы товаров обрезаются project_document.
+"""
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+FULL_SHAPE = (None, None)
+
+
+def parse_paths(value):
+    """'id,brand.name' -> {'id': None, 'brand': {'name': None}}; None, если параметра нет."""
+    if value is None:
+        return None
+
+    tree = {}
+    for path in value.split(','):
+        names = [name.strip() for name in path.split('.')]
+        if not all(names):
+            continue
+        node = tree
+        for name in names[:-1]:
+            if name in node and node[name] is None:
+                # Поле уже запрошено целиком
+                break
+            node = node.setdefault(name, {})
+        else:
+            node[names[-1]] = None
+    return tree
+
+
+def parse_shape(query_params):
+    return parse_paths(query_params.get(FIELDS_PARAM)), parse_paths(query_params.get(EXPAND_PARAM))
+
+
+def is_requested(shape, name):
+    fields, _ = shape
+    return fields is None or name in fields
+
+
+def is_expanded(shape, name):
+    _, expand = shape
+    return expand is None or name in expand
+
+
+def sub_shape(shape, name):
+    """Форма для вложенного объекта поля name."""
+    fields, expand = shape
+    return (
+        None if fields is None else fields.get(name),
+        None if expand is None else expand.get(name),
+    )
+
+
+def _collapse(value):
+    if isinstance(value, dict):
+        return value.get('id')
+    if isinstance(value, list):
+        return [item.get('id') for item in value]
+    return value
+
+
+def project_document(data, shape, expandable=()):
+    """Обрезает готовый документ (dict) по форме; исходный документ не меняется."""
+    if shape == FULL_SHAPE:
+        return data
+
+    result = {}
+    for name, value in data.items():
+        if not is_requested(shape, name):
+            continue
+        if name in expandable and not is_expanded(shape, name):
+            value = _collapse(value)
+        else:
+            child = sub_shape(shape, name)
+            if child != FULL_SHAPE:
+                if isinstance(value, dict):
+                    value = project_document(value, child)
+                elif isinstance(value, list):
+                    value = [project_document(item, child) if isinstance(item, dict) else item for item in value]
+        result[name] = value
+    return result
+
+
+class DynamicFieldsMixin:
+    """
+    Сериализатор с формой из context['shape'] (корневой) или от родителя
+    (вложенный). expandable_fields — связи, которые без expand сворачиваются в id.
+    """
+
+    expandable_fields = ()
+
+    def get_shape(self):
+        shape = getattr(self, '_shape', None)
+        if shape is not None:
+            return shape
+        return self.context.get('shape', FULL_SHAPE)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        shape = self.get_shape()
+        if shape == FULL_SHAPE:
+            return fields
+
+        shaped = {}
+        for name, field in fields.items():
+            if not is_requested(shape, name):
+                continue
+            if name in self.expandable_fields and not is_expanded(shape, name):
+                many = isinstance(field, serializers.ListSerializer)
+                source = {'source': field.source} if field.source else {}
+                field = serializers.PrimaryKeyRelatedField(read_only=True, many=many, **source)
+            else:
+                nested = getattr(field, 'child', field)
+                if isinstance(nested, DynamicFieldsMixin):
+                    nested._shape = sub_shape(shape, name)
+            shaped[name] = field
+        return shaped
+
+
+class DynamicFieldsViewMixin:
+    """Передаёт форму запроса сериализаторам и представлению (self.shape)."""
+
+    @property
+    def shape(self):
+        if not hasattr(self, '_shape'):
+            self._shape = parse_shape(self.request.query_params)
+        return self._shape
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['shape'] = self.shape
+        return context
@@ -0,0 +1,100 @@
+"""
+Публичная лента герой-блоков для главной страницы.
+
+Лента — готовый вывод HeroBlockSerializer для блоков, которые сейчас в окне
+показа, вместе со slug, названием и минимальной ценой связанного товара.
+Она лежит в кэше Django под ключом из версий областей HERO_BLOCKS_SCOPE и
+PRODUCTS_SCOPE, так что изменения блоков, товаров и вариантов (signals.py)
+сразу дают новый ключ, а анонимный запрос обходится без обращений к БД.
+
+Окна publish_at/unpublish_at версий не меняют, поэтому при сборке ленты
+запоминается ближайшая граница окна; первый запрос после неё меняет версию
+HERO_BLOCKS_SCOPE — вместе с лентой обновляется и ETag.
+"""
+import math
+
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .conditional import HERO_BLOCKS_SCOPE, PRODUCTS_SCOPE
+from .models import HeroBlock
+from .serializers import HeroBlockSerializer
+from .versioning import bump_version, get_versions
+
+HERO_FEED_KEY_PREFIX = 'hero-feed:'
+HERO_BOUNDARY_KEY = 'hero-feed-boundary'
+# Без границ окон лента живёт, пока не сменится версия
+HERO_FEED_TIMEOUT = 24 * 60 * 60
+
+
+def published_hero_blocks():
+    return HeroBlock.objects.filter(status='published', is_active=True)
+
+
+def live_hero_blocks(now=None):
+    """Опубликованные активные блоки, окно показа которых включает now."""
+    now = now or timezone.now()
+    return published_hero_blocks().filter(
+        Q(publish_at__isnull=True) | Q(publish_at__lte=now),
+        Q(unpublish_at__isnull=True) | Q(unpublish_at__gt=now),
+    )
+
+
+def next_window_boundary(now=None):
+    """Ближайшие после now начало или конец окна показа, None если их нет."""
+    now = now or timezone.now()
+    bounds = published_hero_blocks().aggregate(
+        next_publish=Min('publish_at', filter=Q(publish_at__gt=now)),
+        next_unpublish=Min('unpublish_at', filter=Q(unpublish_at__gt=now)),
+    )
+    upcoming = [value for value in bounds.values() if value is not None]
+    return min(upcoming) if upcoming else None
+
+
+def build_hero_feed(now=None):
+    """Возвращает (блоки, ближайшая граница окна). Ссылки на медиа — от MEDIA_SITE_URL."""
+    now = now or timezone.now()
+    blocks = live_hero_blocks(now).select_related('product')
+    data = HeroBlockSerializer(blocks, many=True, context={'request': None}).data
+    return [dict(block) for block in data], next_window_boundary(now)
+
+
+def _feed_key(versions):
+    return f'{HERO_FEED_KEY_PREFIX}{versions[HERO_BLOCKS_SCOPE]}:{versions[PRODUCTS_SCOPE]}'
+
+
+def expire_hero_window(now=None):
+    """Если ближайшая граница окна уже прошла, меняет версию блоков."""
+    boundary = cache.get(HERO_BOUNDARY_KEY)
+    if boundary is None:
+        return False
+    now = now or timezone.now()
+    if now.timestamp() < boundary:
+        return False
+    cache.delete(HERO_BOUNDARY_KEY)
+    bump_version(HERO_BLOCKS_SCOPE)
+    return True
+
+
+def get_hero_feed(now=None):
+    """
+    Лента из кэша; при смене версий собирается заново за два запроса.
+    Перед ней стоит вызвать expire_hero_window(), как делает HeroBlockViewSet.
+    """
+    now = now or timezone.now()
+    key = _feed_key(get_versions(HERO_BLOCKS_SCOPE, PRODUCTS_SCOPE))
+    feed = cache.get(key)
+    if feed is not None:
+        return feed
+
+    feed, boundary = build_hero_feed(now)
+    timeout = HERO_FEED_TIMEOUT
+    if boundary is None:
+        cache.delete(HERO_BOUNDARY_KEY)
+    else:
+        timeout = max(min(math.ceil((boundary - now).total_seconds()), timeout), 1)
+        # Граница хранится без срока: ETag должен смениться, даже если лента уже истекла
+        cache.set(HERO_BOUNDARY_KEY, boundary.timestamp(), None)
+    cache.set(key, feed, timeout)
+    return feed
@@ -0,0 +1,576 @@
+"""
+Массовый импорт каталога из CSV, JSON и JSON Lines (команда import_catalog).
+
+Строка файла — вариант товара. Вариант ищется по sku, товар — по
+product_slug, бренд — по brand_slug или названию, категория — по слагу.
+Пустое значение означает «не менять». Характеристики товара задаются
+колонками spec.<slug>, атрибуты варианта — attr.<slug> (в JSON — объектами
+specifications и attributes).
+
+Колонки: sku, product_slug, product_name, brand, brand_slug, category,
+category_name и category_parent (для новой категории), short_description,
+description, product_is_active, is_preorder, price, old_price, stock, is_active.
+
+Строки обрабатываются пачками, каждая пачка — своя транзакция. Товары,
+варианты и бренды создаются bulk_create и обновляются bulk_update только
+при реальных изменениях. Категорий мало, они сохраняются через save(),
+который поддерживает материализованный путь дерева.
+
+Значения проверяются по схеме атрибутов категории из attribute_schema
+(в памяти процесса) теми же полями форм, что и в админке.
+
+bulk-операции не шлют сигналов, поэтому документы, ключи сортировки,
+фасеты, поисковый индекс, агрегаты брендов, версии ETag и снимок overview
+затронутых товаров, а также итоги корзин с вариантами, у которых сменилась
+цена, пересчитываются явно после каждой пачки.
+"""
+import csv
+import json
+import os
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from apps.cart.models import Cart
+from apps.cart.totals import recalculate_cart_totals
+
+from .admin import build_attribute_form_field, normalize_attribute_value
+from .brands import brand_ids_for_products, refresh_brand_aggregates
+from .conditional import BRANDS_SCOPE, PRODUCTS_SCOPE
+from .documents import invalidate_product_documents
+from .facets import refresh_product_facets
+from .models import Brand, Category, Product, ProductVariant
+from .schema import attribute_schema
+from .search import index_products
+from .snapshots import mark_overview_stale
+from .sorting import refresh_product_sort_keys
+from .versioning import invalidate_versions
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+SPEC_PREFIX = 'spec.'
+ATTR_PREFIX = 'attr.'
+BOOLEAN_VALUES = {
+    '1': True, 'true': True, 'yes': True, 'да': True,
+    '0': False, 'false': False, 'no': False, 'нет': False,
+}
+
+PRODUCT_FIELDS = ('name', 'short_description', 'description', 'is_active', 'is_preorder')
+PRODUCT_UPDATE_FIELDS = [
+    'name', 'brand', 'category', 'short_description', 'description', 'is_active', 'is_preorder',
+    'specifications', 'updated_at',
+]
+VARIANT_UPDATE_FIELDS = ['product', 'attributes', 'price', 'old_price', 'stock', 'is_active', 'updated_at']
+
+
+class RowError(Exception):
+    """Строка не прошла проверку и пропускается."""
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return 'jsonl' if extension == 'ndjson' else extension
+
+
+def _nest_columns(row):
+    """Колонки spec.<slug> и attr.<slug> CSV -> specifications и attributes."""
+    nested = {'specifications': {}, 'attributes': {}}
+    for name, value in row.items():
+        if name is None:
+            continue
+        if name.startswith(SPEC_PREFIX):
+            nested['specifications'][name[len(SPEC_PREFIX):]] = value
+        elif name.startswith(ATTR_PREFIX):
+            nested['attributes'][name[len(ATTR_PREFIX):]] = value
+        else:
+            nested[name] = value
+    return nested
+
+
+def read_rows(path, file_format):
+    """
+    Генератор (номер строки, dict | None, ошибка | None). CSV и JSON Lines
+    читаются построчно; JSON — список объектов, номер — позиция в списке.
+    """
+    with open(path, encoding='utf-8-sig', newline='') as source:
+        if file_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, _nest_columns(row), None
+            return
+
+        if file_format == 'jsonl':
+            items = enumerate(source, start=1)
+        else:
+            data = json.load(source)
+            if not isinstance(data, list):
+                raise ValueError('JSON-файл должен содержать список объектов')
+            items = enumerate(data, start=1)
+
+        for number, item in items:
+            if isinstance(item, str):
+                if not item.strip():
+                    continue
+                try:
+                    item = json.loads(item)
+                except ValueError as error:
+                    yield number, None, f'некорректный JSON: {error}'
+                    continue
+            if not isinstance(item, dict):
+                yield number, None, 'ожидался объект'
+                continue
+            yield number, item, None
+
+
+def _text(row, name):
+    value = row.get(name)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _decimal(row, name):
+    value = _text(row, name)
+    if value is None:
+        return None
+    try:
+        value = Decimal(value.replace(',', '.'))
+    except InvalidOperation:
+        raise RowError(f'{name}: не число')
+    if not value.is_finite() or value < 0:
+        raise RowError(f'{name}: ожидается неотрицательное число')
+    if value.as_tuple().exponent < -2 or value >= 10 ** 8:
+        raise RowError(f'{name}: не больше 8 цифр до запятой и 2 после')
+    return value
+
+
+def _integer(row, name):
+    value = _text(row, name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise RowError(f'{name}: не целое число')
+    if value < 0:
+        raise RowError(f'{name}: ожидается неотрицательное число')
+    return value
+
+
+def _boolean(row, name):
+    value = row.get(name)
+    if value is None or isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if not value:
+        return None
+    if value not in BOOLEAN_VALUES:
+        raise RowError(f'{name}: ожидается да/нет')
+    return BOOLEAN_VALUES[value]
+
+
+def _values(row, name):
+    values = row.get(name) or {}
+    if not isinstance(values, dict):
+        raise RowError(f'{name}: ожидается объект')
+    return {slug: value for slug, value in values.items() if value not in (None, '')}
+
+
+def parse_row(row):
+    """Приводит строку файла к типам модели; None — значение не задано."""
+    sku = _text(row, 'sku')
+    if sku is None:
+        raise RowError('не указан sku')
+    product_slug = _text(row, 'product_slug')
+    if product_slug is None:
+        raise RowError('не указан product_slug')
+
+    return {
+        'sku': sku,
+        'product_slug': product_slug,
+        'name': _text(row, 'product_name'),
+        'brand': _text(row, 'brand'),
+        'brand_slug': _text(row, 'brand_slug'),
+        'category': _text(row, 'category'),
+        'category_name': _text(row, 'category_name'),
+        'category_parent': _text(row, 'category_parent'),
+        'short_description': _text(row, 'short_description'),
+        'description': _text(row, 'description'),
+        'is_active': _boolean(row, 'product_is_active'),
+        'is_preorder': _boolean(row, 'is_preorder'),
+        'specifications': _values(row, 'specifications'),
+        'price': _decimal(row, 'price'),
+        'old_price': _decimal(row, 'old_price'),
+        'stock': _integer(row, 'stock'),
+        'variant_is_active': _boolean(row, 'is_active'),
+        'attributes': _values(row, 'attributes'),
+    }
+
+
+class CatalogImporter:
+    """
+    Импортирует строки read_rows пачками по chunk_size. С dry_run пачка
+    проходит все проверки и запись, но её транзакция откатывается.
+    """
+
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+        self.chunk_size = max(chunk_size, 1)
+        self.dry_run = dry_run
+        self.stats = {
+            'rows': 0,
+            'imported': 0,
+            'failed': 0,
+            'brands_created': 0,
+            'categories_created': 0,
+            'products_created': 0,
+            'products_updated': 0,
+            'variants_created': 0,
+            'variants_updated': 0,
+        }
+        self.errors = []
+
+    def run(self, rows):
+        """Импортирует строки, после каждой пачки отдаёт накопленную статистику."""
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.chunk_size)):
+            self.import_chunk(chunk)
+            yield self.stats
+
+    def _fail(self, line, message):
+        self.errors.append((line, message))
+        self.stats['failed'] += 1
+
+    def import_chunk(self, chunk):
+        parsed = []
+        for line, row, error in chunk:
+            self.stats['rows'] += 1
+            if error is None:
+                try:
+                    parsed.append((line, parse_row(row)))
+                    continue
+                except RowError as row_error:
+                    error = str(row_error)
+            self._fail(line, error)
+        if not parsed:
+            return
+
+        chunk_import = _ChunkImport(parsed)
+        try:
+            with transaction.atomic():
+                chunk_import.write()
+                if self.dry_run:
+                    transaction.set_rollback(True)
+                elif chunk_import.touched_product_ids:
+                    refresh_imported_products(
+                        chunk_import.touched_product_ids,
+                        chunk_import.previous_brand_ids,
+                        chunk_import.repriced_variant_ids,
+                    )
+        except DatabaseError as error:
+            # Пачка откатилась целиком, строки без собственных ошибок помечаются ошибкой пачки
+            failed_lines = {line for line, _ in chunk_import.errors}
+            chunk_import.errors += [
+                (line, f'пачка строк {parsed[0][0]}-{parsed[-1][0]} не записана: {error}')
+                for line, _ in parsed
+                if line not in failed_lines
+            ]
+        else:
+            for name, value in chunk_import.stats.items():
+                self.stats[name] += value
+
+        for line, message in chunk_import.errors:
+            self._fail(line, message)
+
+
+class _ChunkImport:
+    """Запись одной пачки строк; вызывается внутри транзакции."""
+
+    def __init__(self, parsed):
+        self.parsed = parsed
+        self.errors = []
+        self.stats = {
+            'imported': 0,
+            'brands_created': 0,
+            'categories_created': 0,
+        }
+        self.touched_product_ids = set()
+        self.previous_brand_ids = set()
+        self.repriced_variant_ids = set()
+        # Поля форм для проверки значений атрибутов, по id атрибута
+        self.fields = {}
+
+    def write(self):
+        rows = [row for _, row in self.parsed]
+        brands = self._load_brands(rows)
+        categories = Category.objects.in_bulk(
+            {row[name] for row in rows for name in ('category', 'category_parent') if row[name]},
+            field_name='slug',
+        )
+        products = {
+            product.slug: product
+            for product in Product.objects.filter(slug__in={row['product_slug'] for row in rows})
+        }
+        variants = ProductVariant.objects.in_bulk({row['sku'] for row in rows}, field_name='sku')
+        new_products, changed_products = {}, {}
+        new_variants, changed_variants = {}, {}
+
+        for line, row in self.parsed:
+            product = products.get(row['product_slug'])
+            variant = variants.get(row['sku'])
+            try:
+                category = self._resolve_category(row, categories)
+                product_changes = self._product_changes(row, product, brands, category)
+                variant_changes = self._variant_changes(
+                    row,
+                    variant,
+                    product_changes.get('category_id') or product.category_id,
+                )
+            except (RowError, ValidationError) as error:
+                message = ' '.join(error.messages) if isinstance(error, ValidationError) else str(error)
+                self.errors.append((line, message))
+                continue
+
+            if product is None:
+                product = Product(slug=row['product_slug'])
+                products[product.slug] = new_products[product.slug] = product
+                _apply(product, product_changes)
+            else:
+                brand_id = product.brand_id
+                if _apply(product, product_changes) and product.pk:
+                    changed_products.setdefault(product.pk, product)
+                    self.previous_brand_ids.add(brand_id)
+
+            if variant is None:
+                variant = ProductVariant(sku=row['sku'], product=product)
+                variants[variant.sku] = new_variants[variant.sku] = variant
+                _apply(variant, variant_changes)
+            else:
+                moved = variant.product_id != product.pk
+                if moved:
+                    # Вариант перенесён в другой товар: прежний тоже пересчитывается
+                    self.touched_product_ids.add(variant.product_id)
+                    variant.product = product
+                price = variant.price
+                if (_apply(variant, variant_changes) or moved) and variant.pk:
+                    changed_variants.setdefault(variant.pk, variant)
+                    if variant.price != price:
+                        self.repriced_variant_ids.add(variant.pk)
+            self.stats['imported'] += 1
+
+        now = timezone.now()
+        for instance in [*changed_products.values(), *changed_variants.values()]:
+            instance.updated_at = now
+        Product.objects.bulk_create(new_products.values())
+        Product.objects.bulk_update(changed_products.values(), PRODUCT_UPDATE_FIELDS)
+        ProductVariant.objects.bulk_create(new_variants.values())
+        ProductVariant.objects.bulk_update(changed_variants.values(), VARIANT_UPDATE_FIELDS)
+
+        self.touched_product_ids.update(product.pk for product in new_products.values())
+        self.touched_product_ids.update(changed_products)
+        self.touched_product_ids.update(variant.product_id for variant in changed_variants.values())
+        self.touched_product_ids.update(variant.product_id for variant in new_variants.values())
+        self.stats.update(
+            products_created=len(new_products),
+            products_updated=len(changed_products),
+            variants_created=len(new_variants),
+            variants_updated=len(changed_variants),
+        )
+
+    def _load_brands(self, rows):
+        """
+        Бренды пачки по ключу строки ('slug', …) или ('name', …). Недостающие
+        создаются, при заданных brand_slug и brand обновляется название.
+        """
+        for row in rows:
+            if row['brand_slug']:
+                row['brand_key'] = ('slug', row['brand_slug'])
+            elif row['brand']:
+                row['brand_key'] = ('name', row['brand'])
+            else:
+                row['brand_key'] = None
+        keys = {row['brand_key'] for row in rows if row['brand_key']}
+        if not keys:
+            return {}
+
+        existing = Brand.objects.filter(
+            Q(slug__in=[value for kind, value in keys if kind == 'slug'])
+            | Q(name__in=[value for kind, value in keys if kind == 'name'])
+        )
+        brands = {}
+        for brand in existing:
+            brands[('slug', brand.slug)] = brands[('name', brand.name)] = brand
+
+        new_brands, renamed = {}, {}
+        now = timezone.now()
+        for row in rows:
+            key, name = row['brand_key'], row['brand']
+            if key is None or name is None:
+                continue
+            brand = brands.get(key)
+            if brand is None:
+                slug = row['brand_slug'] or slugify(name)
+                if not slug or ('slug', slug) in brands:
+                    # Без слага (или с занятым) строка получит ошибку при разборе товара
+                    continue
+                brand = Brand(name=name, slug=slug)
+                new_brands[slug] = brands[key] = brands[('slug', slug)] = brands[('name', name)] = brand
+            elif brand.name != name and brand.pk:
+                brand.name, brand.updated_at = name, now
+                renamed[brand.pk] = brands[('name', name)] = brand
+
+        Brand.objects.bulk_create(new_brands.values())
+        Brand.objects.bulk_update(renamed.values(), ['name', 'updated_at'])
+        self.stats['brands_created'] = len(new_brands)
+        if renamed:
+            # Название бренда входит в документы и поисковые записи его товаров
+            self.touched_product_ids.update(
+                Product.objects.filter(brand__in=renamed).values_list('pk', flat=True)
+            )
+        return brands
+
+    def _resolve_category(self, row, categories):
+        """Категория строки: отсутствующая создаётся, название и родитель обновляются через save()."""
+        slug = row['category']
+        if slug is None:
+            return None
+
+        parent = None
+        if row['category_parent']:
+            parent = categories.get(row['category_parent'])
+            if parent is None:
+                raise RowError(f'category_parent: категория «{row["category_parent"]}» не найдена')
+
+        category = categories.get(slug)
+        if category is None:
+            if row['category_name'] is None:
+                raise RowError(f'category: категория «{slug}» не найдена, укажите category_name')
+            category = Category(slug=slug, name=row['category_name'], parent=parent)
+            _save_category(category)
+            categories[slug] = category
+            self.stats['categories_created'] += 1
+            return category
+
+        changes = {}
+        if row['category_name']:
+            changes['name'] = row['category_name']
+        if parent is not None:
+            changes['parent_id'] = parent.pk
+        if _apply(category, changes):
+            _save_category(category)
+        return category
+
+    def _product_changes(self, row, product, brands, category):
+        """Новые значения полей товара; RowError, если товар не проходит проверку."""
+        if product is None:
+            if row['name'] is None:
+                raise RowError('product_name: обязательно для нового товара')
+            if category is None:
+                raise RowError('category: обязательна для нового товара')
+
+        changes = {name: row[name] for name in PRODUCT_FIELDS if row[name] is not None}
+        if category is not None:
+            changes['category_id'] = category.pk
+        if row['brand_key'] is not None:
+            brand = brands.get(row['brand_key'])
+            if brand is None:
+                kind, value = row['brand_key']
+                if kind == 'slug' and row['brand'] is None:
+                    raise RowError(f'brand_slug: бренд «{value}» не найден, укажите brand')
+                raise RowError(f'brand: не удалось создать бренд «{row["brand"]}», укажите brand_slug')
+            changes['brand_id'] = brand.pk
+
+        current = product.specifications if product is not None else None
+        changes['specifications'] = clean_attribute_values(
+            attribute_schema.get_attribute_map(changes.get('category_id') or product.category_id, 'product'),
+            row['specifications'],
+            current or {},
+            self.fields,
+        )
+        return changes
+
+    def _variant_changes(self, row, variant, category_id):
+        """Новые значения полей варианта; атрибуты — по схеме категории товара."""
+        if variant is None and row['price'] is None:
+            raise RowError('price: обязательна для нового варианта')
+
+        changes = {name: row[name] for name in ('price', 'old_price', 'stock') if row[name] is not None}
+        if row['variant_is_active'] is not None:
+            changes['is_active'] = row['variant_is_active']
+        current = variant.attributes if variant is not None else None
+        changes['attributes'] = clean_attribute_values(
+            attribute_schema.get_attribute_map(category_id, 'variant'),
+            row['attributes'],
+            current or {},
+            self.fields,
+        )
+        return changes
+
+
+def _save_category(category):
+    """save() поддерживает путь дерева; ошибка откатывает только эту категорию."""
+    try:
+        with transaction.atomic():
+            category.save()
+    except DatabaseError as error:
+        raise RowError(f'category: {error}')
+
+
+def _apply(instance, changes):
+    """Записывает изменившиеся значения в экземпляр; True, если что-то изменилось."""
+    changed = False
+    for name, value in changes.items():
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed = True
+    return changed
+
+
+def clean_attribute_values(attributes, provided, current, fields):
+    """
+    Значения атрибутов по схеме категории: из строки, иначе прежние.
+    Прежние ключи вне схемы сохраняются как есть. Неизвестные атрибуты в строке
+    и пустые обязательные — ошибка строки. fields — кэш полей форм по id
+    атрибута на время пачки.
+    """
+    unknown = set(provided) - set(attributes)
+    if unknown:
+        raise RowError(f'неизвестные атрибуты: {", ".join(sorted(unknown))}')
+
+    cleaned = dict(current)
+    for slug, attribute in attributes.items():
+        value = provided.get(slug, current.get(slug))
+        if value in (None, ''):
+            if attribute.is_required:
+                raise RowError(f'{slug}: обязательное значение')
+            cleaned.pop(slug, None)
+            continue
+        if attribute.pk not in fields:
+            fields[attribute.pk] = build_attribute_form_field(attribute, required=False)
+        try:
+            value = fields[attribute.pk].clean(value)
+        except ValidationError as error:
+            raise RowError(f'{slug}: {" ".join(error.messages)}')
+        cleaned[slug] = normalize_attribute_value(value)
+    return cleaned
+
+
+def refresh_imported_products(product_ids, previous_brand_ids, repriced_variant_ids=()):
+    """Производные данные товаров и итоги корзин, которые bulk-операции импорта обошли мимо сигналов."""
+    product_ids = set(product_ids)
+    invalidate_product_documents(product_ids)
+    refresh_product_sort_keys(product_ids)
+    refresh_product_facets(product_ids)
+    index_products(product_ids)
+    # Агрегаты брендов читают Product.min_price, поэтому идут после ключей сортировки
+    refresh_brand_aggregates({*brand_ids_for_products(product_ids), *previous_brand_ids})
+    invalidate_versions(PRODUCTS_SCOPE, BRANDS_SCOPE)
+    mark_overview_stale()
+    if repriced_variant_ids:
+        # Цена варианта входит в итоги корзин (как cart.signals.variant_price_changed)
+        recalculate_cart_totals(Cart.objects.filter(items__variant__in=repriced_variant_ids))
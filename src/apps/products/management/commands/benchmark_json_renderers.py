@@ -0,0 +1,57 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from apps.products.renderers import FastJSONRenderer, RawJSON, fast_json_available
+from apps.products.snapshots import get_overview_snapshot, rebuild_overview_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает JSONRenderer и FastJSONRenderer на ответе /api/v1/overview/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Сколько раз рендерить ответ в каждом варианте',
+        )
+
+    def handle(self, *args, **options):
+        iterations = max(options['iterations'], 1)
+        if not fast_json_available():
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен или CATALOG_FAST_JSON=false: FastJSONRenderer работает как JSONRenderer'
+            ))
+
+        snapshot = get_overview_snapshot()
+        if snapshot is None or not snapshot.is_built:
+            rebuild_overview_snapshot()
+            snapshot = get_overview_snapshot()
+        raw = snapshot.raw_payload
+        payload = json.loads(raw)
+
+        cases = [
+            ('JSONRenderer', JSONRenderer(), payload),
+            ('FastJSONRenderer', FastJSONRenderer(), payload),
+            ('FastJSONRenderer + RawJSON', FastJSONRenderer(), RawJSON(raw)),
+        ]
+        baseline = None
+        for name, renderer, data in cases:
+            content = renderer.render(data)
+            if json.loads(content) != payload:
+                self.stderr.write(self.style.ERROR(f'{name}: ответ отличается от исходного'))
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                renderer.render(data)
+            seconds = (time.perf_counter() - started) / iterations
+            baseline = baseline or seconds
+
+            self.stdout.write(
+                f'{name}: {seconds * 1000:.3f} мс на ответ, '
+                f'{len(content) / seconds / 2 ** 20:.1f} МБ/с, '
+                f'{len(content)} байт, x{baseline / seconds:.2f}'
+            )
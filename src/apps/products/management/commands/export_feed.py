@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.products.feeds import FEED_CHUNK_SIZE, FEEDS, iter_feed
+
+
+class Command(BaseCommand):
+    help = 'Выгружает фид каталога для маркетплейсов: YML, CSV или Google Merchant XML'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            dest='feed_format',
+            choices=sorted(FEEDS),
+            default='yml',
+            help='Формат фида',
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для записи; без него фид пишется в stdout',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=FEED_CHUNK_SIZE,
+            help='Сколько вариантов читать из БД за один проход',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Перерисовать только записи изменившихся товаров и вариантов',
+        )
+
+    def handle(self, *args, **options):
+        stats = {}
+        parts = iter_feed(
+            options['feed_format'],
+            chunk_size=max(options['chunk_size'], 1),
+            incremental=options['incremental'],
+            stats=stats,
+        )
+
+        started = time.perf_counter()
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(parts)
+            report = self.stdout
+        else:
+            for part in parts:
+                self.stdout.write(part, ending='')
+            report = self.stderr
+        seconds = time.perf_counter() - started
+
+        report.write(self.style.SUCCESS(
+            f'Записей: {stats["entries"]}, перерисовано: {stats["rendered"]}, '
+            f'удалено: {stats["removed"]}, {seconds:.2f} с'
+        ))
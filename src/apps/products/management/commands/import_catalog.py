@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.importer import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, CatalogImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Импортирует бренды, категории, товары и варианты из CSV, JSON или JSON Lines (upsert по sku)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с каталогом: строка — вариант товара')
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=IMPORT_FORMATS,
+            help='Формат файла; по умолчанию — по расширению',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help='Сколько строк записывать в одной транзакции',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Проверить и записать пачки, но откатить транзакции',
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or detect_format(options['path'])
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}. Укажите --format')
+
+        importer = CatalogImporter(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        started = time.perf_counter()
+        try:
+            for stats in importer.run(read_rows(options['path'], file_format)):
+                seconds = time.perf_counter() - started
+                self.stdout.write(f'Обработано строк: {stats["rows"]}, {stats["rows"] / seconds:.0f} строк/с')
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {options["path"]}: {error}')
+        seconds = time.perf_counter() - started
+
+        for line, message in importer.errors:
+            self.stderr.write(f'Строка {line}: {message}')
+
+        stats = importer.stats
+        summary = (
+            f'Строк: {stats["rows"]}, импортировано: {stats["imported"]}, с ошибками: {stats["failed"]}. '
+            f'Брендов создано: {stats["brands_created"]}, категорий: {stats["categories_created"]}. '
+            f'Товаров создано: {stats["products_created"]}, обновлено: {stats["products_updated"]}. '
+            f'Вариантов создано: {stats["variants_created"]}, обновлено: {stats["variants_updated"]}. '
+            f'{seconds:.2f} с, {stats["rows"] / seconds if seconds else 0:.0f} строк/с'
+        )
+        if options['dry_run']:
+            summary = f'Пробный запуск, изменения отменены. {summary}'
+        style = self.style.WARNING if stats['failed'] else self.style.SUCCESS
+        self.stdout.write(style(summary))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.snapshots import rebuild_overview_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает снимок /api/v1/overview/'
+
+    def handle(self, *args, **options):
+        version = rebuild_overview_snapshot()
+        self.stdout.write(self.style.SUCCESS(f'Снимок overview собран, версия {version}'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.documents import DOCUMENT_CHUNK_SIZE, refresh_product_documents
+from apps.products.models import Product, ProductDocument
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает документы товаров для списков каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DOCUMENT_CHUNK_SIZE,
+            help='Сколько товаров собирать за один проход',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Удалить все документы перед пересборкой',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        if options['prune']:
+            deleted, _ = ProductDocument.objects.all().delete()
+            self.stdout.write(f'Удалено документов: {deleted}')
+
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        chunk = []
+        total = 0
+        for product_id in product_ids.iterator(chunk_size=chunk_size):
+            chunk.append(product_id)
+            if len(chunk) >= chunk_size:
+                total += len(refresh_product_documents(chunk))
+                chunk = []
+        if chunk:
+            total += len(refresh_product_documents(chunk))
+
+        self.stdout.write(self.style.SUCCESS(f'Пересобрано документов: {total}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.facets import FACET_CHUNK_SIZE, refresh_product_facets
+from apps.products.models import Product, ProductFacetValue
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает таблицу фасетов (значения характеристик для фильтров)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=FACET_CHUNK_SIZE,
+            help='Сколько товаров собирать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        chunk = []
+        total = 0
+        for product_id in product_ids.iterator(chunk_size=chunk_size):
+            chunk.append(product_id)
+            if len(chunk) >= chunk_size:
+                refresh_product_facets(chunk)
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            refresh_product_facets(chunk)
+            total += len(chunk)
+
+        rows = ProductFacetValue.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Обработано товаров: {total}, строк фасетов: {rows}'))
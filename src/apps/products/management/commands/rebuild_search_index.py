@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import Product
+from apps.products.search import INDEX_CHUNK_SIZE, get_search_backend, index_products
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=INDEX_CHUNK_SIZE,
+            help='Сколько товаров индексировать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        get_search_backend().clear()
+
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(product_ids), chunk_size):
+            index_products(product_ids[start:start + chunk_size])
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано товаров: {len(product_ids)}'))
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.27 on 2026-10-18 07:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_productimage_color_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='products.product', verbose_name='Товар')),
+                ('data', models.JSONField(default=dict, verbose_name='Документ')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Документ товара',
+                'verbose_name_plural': 'Документы товаров',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.27 on 2026-10-18 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_productdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Версия данных')),
+                ('built_version', models.PositiveIntegerField(blank=True, null=True, verbose_name='Собранная версия')),
+                ('etag', models.CharField(blank=True, max_length=64, verbose_name='ETag')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Данные')),
+                ('built_at', models.DateTimeField(blank=True, null=True, verbose_name='Собран')),
+            ],
+            options={
+                'verbose_name': 'Снимок каталога',
+                'verbose_name_plural': 'Снимки каталога',
+            },
+        ),
+    ]
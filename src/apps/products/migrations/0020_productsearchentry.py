@@ -0,0 +1,55 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+SQLITE_FTS_TABLE = 'products_search_fts'
+POSTGRES_INDEX = 'products_search_document_gin'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+            f"USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON products_productsearchentry USING GIN ("
+            "(setweight(to_tsvector('russian', title), 'A') || setweight(to_tsvector('russian', body), 'B'))"
+            ")"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {POSTGRES_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_catalogsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='products.product', verbose_name='Товар')),
+                ('title', models.TextField(blank=True, verbose_name='Заголовок')),
+                ('body', models.TextField(blank=True, verbose_name='Текст')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Поисковая запись товара',
+                'verbose_name_plural': 'Поисковые записи товаров',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
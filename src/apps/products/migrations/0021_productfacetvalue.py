@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_productsearchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('applies_to', models.CharField(choices=[('product', 'Товар'), ('variant', 'Вариант')], max_length=20, verbose_name='Источник')),
+                ('attribute_slug', models.SlugField(db_index=False, verbose_name='Атрибут')),
+                ('value', models.CharField(max_length=255, verbose_name='Значение')),
+                ('normalized', models.CharField(max_length=255, verbose_name='Значение для сравнения')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.category', verbose_name='Категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_values', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Значение фильтра',
+                'verbose_name_plural': 'Значения фильтров',
+                'indexes': [models.Index(fields=['category', 'attribute_slug', 'normalized'], name='products_facet_category_idx'), models.Index(fields=['attribute_slug', 'normalized', 'applies_to'], name='products_facet_value_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productfacetvalue',
+            constraint=models.UniqueConstraint(fields=('product', 'applies_to', 'attribute_slug', 'normalized'), name='products_facet_value_unique'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:08
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_sort_keys(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    OrderItem = apps.get_model('products', 'OrderItem')
+
+    Product.objects.update(
+        min_price=Subquery(
+            ProductVariant.objects.filter(product=OuterRef('pk'), is_active=True)
+            .values('product').annotate(value=Min('price')).values('value')
+        ),
+        popularity=Coalesce(
+            Subquery(
+                OrderItem.objects.filter(variant__product=OuterRef('pk'))
+                .values('variant__product').annotate(value=Sum('quantity')).values('value')
+            ),
+            0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_productfacetvalue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Минимальная цена'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Продано, шт.'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='products_product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['min_price', 'id'], name='products_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['popularity', 'id'], name='products_product_popular_idx'),
+        ),
+        migrations.RunPython(fill_sort_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+def delete_product_documents(apps, schema_editor):
+    # Документы собраны со старой формой медиа у вариантов; списки пересоберут их при первом обращении
+    apps.get_model('products', 'ProductDocument').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_product_sort_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_product_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:21
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('products', 'Order')
+    OrderItem = apps.get_model('products', 'OrderItem')
+    price_field = DecimalField(max_digits=12, decimal_places=2)
+
+    Order.objects.update(
+        total_price=Coalesce(
+            Subquery(
+                OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(
+                    value=Sum(F('quantity') * F('price_at_time'), output_field=price_field),
+                ).values('value')
+            ),
+            Value(Decimal('0'), output_field=price_field),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_reset_product_documents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Сумма'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
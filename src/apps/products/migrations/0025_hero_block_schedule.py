@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0024_order_checkout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='heroblock',
+            name='publish_at',
+            field=models.DateTimeField(blank=True, help_text='Блок появится на сайте в это время', null=True, verbose_name='Показывать с'),
+        ),
+        migrations.AddField(
+            model_name='heroblock',
+            name='unpublish_at',
+            field=models.DateTimeField(blank=True, help_text='Блок скроется с сайта в это время', null=True, verbose_name='Показывать до'),
+        ),
+    ]
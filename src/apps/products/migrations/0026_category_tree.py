@@ -0,0 +1,42 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def build_path(category_id):
+        if category_id not in paths:
+            parent_id = parents[category_id]
+            paths[category_id] = (build_path(parent_id) if parent_id else '') + f'{category_id}/'
+        return paths[category_id]
+
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = build_path(category.pk)
+        category.depth = category.path.count('/') - 1
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0025_hero_block_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def fill_brand_aggregates(apps, schema_editor):
+    Brand = apps.get_model('products', 'Brand')
+    Product = apps.get_model('products', 'Product')
+    products = Product.objects.filter(brand__isnull=False, is_active=True).order_by()
+
+    stats = {
+        row['brand_id']: row
+        for row in products.values('brand_id').annotate(count=Count('pk'), price=Min('min_price'))
+    }
+    categories = {}
+    for brand_id, category_id in products.values_list('brand_id', 'category_id').distinct().order_by(
+        'brand_id',
+        'category_id',
+    ):
+        categories.setdefault(brand_id, []).append(category_id)
+
+    brands = list(Brand.objects.all())
+    for brand in brands:
+        row = stats.get(brand.pk, {})
+        brand.product_count = row.get('count', 0)
+        brand.min_price = row.get('price')
+        brand.category_ids = categories.get(brand.pk, [])
+    Brand.objects.bulk_update(brands, ['product_count', 'min_price', 'category_ids'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0026_category_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brand',
+            name='category_ids',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Категории товаров'),
+        ),
+        migrations.AddField(
+            model_name='brand',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Минимальная цена'),
+        ),
+        migrations.AddField(
+            model_name='brand',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных товаров'),
+        ),
+        migrations.RunPython(fill_brand_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0027_brand_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('yml', 'YML'), ('csv', 'CSV'), ('merchant', 'Google Merchant')], max_length=20, verbose_name='Формат')),
+                ('fingerprint', models.CharField(max_length=40, verbose_name='Отпечаток')),
+                ('body', models.TextField(verbose_name='Запись')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='products.productvariant', verbose_name='Вариант')),
+            ],
+            options={
+                'verbose_name': 'Запись фида',
+                'verbose_name_plural': 'Записи фидов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('format', 'variant'), name='products_feed_entry_unique'),
+        ),
+    ]
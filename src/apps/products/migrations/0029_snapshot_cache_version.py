@@ -0,0 +1,22 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0028_feed_entry'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='catalogsnapshot',
+            name='version',
+        ),
+        migrations.AlterField(
+            model_name='catalogsnapshot',
+            name='built_version',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Собранная версия'),
+        ),
+    ]
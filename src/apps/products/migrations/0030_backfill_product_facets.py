@@ -0,0 +1,74 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+CHUNK_SIZE = 500
+MAX_VALUE_LENGTH = 255
+
+
+# Копия правил facets.facet_display_value на момент миграции
+def display_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, str):
+        value = value.strip()
+        if value and len(value) <= MAX_VALUE_LENGTH:
+            return value
+    return None
+
+
+def fill_facet_values(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    ProductFacetValue = apps.get_model('products', 'ProductFacetValue')
+
+    ProductFacetValue.objects.all().delete()
+    products = Product.objects.filter(is_active=True).order_by('pk').values_list('pk', 'category_id', 'specifications')
+    chunk = []
+    for product in products.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(product)
+        if len(chunk) >= CHUNK_SIZE:
+            _fill_chunk(ProductVariant, ProductFacetValue, chunk)
+            chunk = []
+    if chunk:
+        _fill_chunk(ProductVariant, ProductFacetValue, chunk)
+
+
+def _fill_chunk(ProductVariant, ProductFacetValue, products):
+    sources = {}
+    for product_id, category_id, specifications in products:
+        sources[product_id] = (category_id, [('product', specifications or {})])
+    variants = ProductVariant.objects.filter(product_id__in=sources).values_list('product_id', 'attributes')
+    for product_id, attributes in variants:
+        sources[product_id][1].append(('variant', attributes or {}))
+
+    rows = {}
+    for product_id, (category_id, values_list) in sources.items():
+        for applies_to, values in values_list:
+            for slug, raw_value in values.items():
+                value = display_value(raw_value)
+                if value is None:
+                    continue
+                key = (product_id, applies_to, slug, value.strip().lower())
+                rows.setdefault(key, ProductFacetValue(
+                    product_id=product_id,
+                    category_id=category_id,
+                    applies_to=applies_to,
+                    attribute_slug=slug,
+                    value=value,
+                    normalized=key[3],
+                ))
+    ProductFacetValue.objects.bulk_create(rows.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0029_snapshot_cache_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_facet_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0030_backfill_product_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productdocument',
+            name='stock_key',
+            field=models.TextField(blank=True, default='', verbose_name='Остатки вариантов при сборке'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0031_product_document_stock_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('yml', 'YML'), ('csv', 'CSV'), ('merchant', 'Google Merchant')], max_length=20, unique=True, verbose_name='Формат')),
+                ('watermark', models.DateTimeField(verbose_name='Изменения учтены до')),
+                ('fingerprint', models.CharField(max_length=40, verbose_name='Отпечаток настроек')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Состояние фида',
+                'verbose_name_plural': 'Состояния фидов',
+            },
+        ),
+        migrations.RemoveField(
+            model_name='feedentry',
+            name='fingerprint',
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
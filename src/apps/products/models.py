@@ -1,5 +1,7 @@
 import os
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
@@ -36,6 +38,18 @@ class Brand(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Агрегаты по активным товарам для шапки страницы бренда (см. brands.py)
+    product_count = models.PositiveIntegerField("Активных товаров", default=0, editable=False)
+    min_price = models.DecimalField(
+        "Минимальная цена",
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False
+    )
+    category_ids = models.JSONField("Категории товаров", default=list, blank=True, editable=False)
+
     class Meta:
         verbose_name = "Брэнд"
         verbose_name_plural = "Брэнды"
@@ -93,6 +107,11 @@ class Category(models.Model):
 
     attributes = models.ManyToManyField(Attribute, blank=True, related_name='categories')
 
+    # Материализованный путь «1/4/9/» из id предков и самой категории.
+    # Поддерево — path__startswith, пересчитывается в save() при создании и переносе.
+    path = models.CharField("Путь в дереве", max_length=255, editable=False, db_index=True, default='')
+    depth = models.PositiveSmallIntegerField("Уровень вложенности", default=0, editable=False)
+
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
@@ -101,6 +120,51 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def _parent_path(self):
+        if not self.parent_id:
+            return ''
+        return Category.objects.values_list('path', flat=True).get(pk=self.parent_id)
+
+    @staticmethod
+    def _check_parent(old_path, parent_path):
+        if old_path and parent_path.startswith(old_path):
+            raise ValidationError({
+                'parent': 'Категорию нельзя вложить в неё саму или в её подкатегорию'
+            })
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id:
+            old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first()
+            self._check_parent(old_path, self._parent_path())
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        # Пути читаются из БД: экземпляр мог быть загружен до переноса предка
+        old_path, old_depth = Category.objects.values_list('path', 'depth').get(pk=self.pk)
+        parent_path = self._parent_path()
+        self._check_parent(old_path, parent_path)
+        path = f'{parent_path}{self.pk}/'
+        depth = path.count('/') - 1
+        if path != old_path:
+            Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+            if old_path:
+                # Перенос: всё поддерево получает новый префикс одним UPDATE
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (depth - old_depth),
+                )
+        self.path, self.depth = path, depth
+
+    def get_descendants(self, include_self=True):
+        """Поддерево категории одним запросом по индексу path."""
+        descendants = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
 class Product(models.Model):
     name = models.CharField("Название", max_length=200)
     slug = models.SlugField("Слаг", max_length=200, unique=True)
@@ -119,6 +183,17 @@ class Product(models.Model):
     is_popular = models.BooleanField("Отображать в популярных", default=False)
     delivery_text = models.TextField("Текст доставки", blank=True)
     warranty_months = models.PositiveSmallIntegerField("Гарантия (мес)", default=12)
+
+    # Ключи сортировки списков, пересчитываются сигналами (см. sorting.py)
+    min_price = models.DecimalField(
+        "Минимальная цена",
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False
+    )
+    popularity = models.PositiveIntegerField("Продано, шт.", default=0, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -127,6 +202,11 @@ class Product(models.Model):
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='products_product_created_idx'),
+            models.Index(fields=['min_price', 'id'], name='products_product_price_idx'),
+            models.Index(fields=['popularity', 'id'], name='products_product_popular_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -220,6 +300,8 @@ class ProductVariant(models.Model):
     )
     is_active = models.BooleanField("Активен", default=True)
     stock = models.PositiveIntegerField("Остаток", default=0)
+    # Массовые UPDATE цены и остатка выставляют его сами: по нему инкрементальные фиды ищут изменения
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Вариант товара"
@@ -230,6 +312,160 @@ class ProductVariant(models.Model):
         return f"{self.product.name} — {attrs}"
 
 
+class ProductDocument(models.Model):
+    """Денормализованная карточка товара, готовая к отдаче в списках каталога"""
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='document',
+        verbose_name="Товар"
+    )
+    data = models.JSONField("Документ", default=dict)
+    # Остатки вариантов из data строкой «id:остаток,...»: изменение видно без декодирования data
+    stock_key = models.TextField("Остатки вариантов при сборке", blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Документ товара"
+        verbose_name_plural = "Документы товаров"
+
+    def __str__(self):
+        return f"Документ: {self.product_id}"
+
+
+
+class ProductSearchEntry(models.Model):
+    """Исходный текст товара для поискового индекса (см. search/)"""
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_entry',
+        verbose_name="Товар"
+    )
+    title = models.TextField("Заголовок", blank=True)
+    body = models.TextField("Текст", blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Поисковая запись товара"
+        verbose_name_plural = "Поисковые записи товаров"
+
+    def __str__(self):
+        return f"Поиск: {self.product_id}"
+
+
+class ProductFacetValue(models.Model):
+    """Значение характеристики активного товара для фильтров и счётчиков (см. facets.py)"""
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='facet_values',
+        verbose_name="Товар"
+    )
+    # Копия Product.category: счётчики категории считаются по одной таблице
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Категория"
+    )
+    applies_to = models.CharField("Источник", max_length=20, choices=Attribute.APPLIES_TO_CHOICES)
+    attribute_slug = models.SlugField("Атрибут", db_index=False)
+    value = models.CharField("Значение", max_length=255)
+    normalized = models.CharField("Значение для сравнения", max_length=255)
+
+    class Meta:
+        verbose_name = "Значение фильтра"
+        verbose_name_plural = "Значения фильтров"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'applies_to', 'attribute_slug', 'normalized'],
+                name='products_facet_value_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'attribute_slug', 'normalized'], name='products_facet_category_idx'),
+            models.Index(fields=['attribute_slug', 'normalized', 'applies_to'], name='products_facet_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.attribute_slug}: {self.value}"
+
+class FeedEntry(models.Model):
+    """Готовая запись варианта в фиде выгрузки; перерисовывается, только если вариант изменился (см. feeds.py)"""
+
+    FORMAT_CHOICES = [
+        ('yml', 'YML'),
+        ('csv', 'CSV'),
+        ('merchant', 'Google Merchant'),
+    ]
+
+    format = models.CharField("Формат", max_length=20, choices=FORMAT_CHOICES)
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name="Вариант"
+    )
+    body = models.TextField("Запись")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Запись фида"
+        verbose_name_plural = "Записи фидов"
+        constraints = [
+            models.UniqueConstraint(fields=['format', 'variant'], name='products_feed_entry_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.format}: {self.variant_id}"
+
+
+class FeedState(models.Model):
+    """Последняя завершённая инкрементальная выгрузка фида (см. feeds.py)"""
+
+    format = models.CharField("Формат", max_length=20, choices=FeedEntry.FORMAT_CHOICES, unique=True)
+    # Начало выгрузки: следующая перерисует варианты, изменившиеся после него
+    watermark = models.DateTimeField("Изменения учтены до")
+    # Версия шаблонов и настройки фида: при их смене записи перерисовываются все
+    fingerprint = models.CharField("Отпечаток настроек", max_length=40)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Состояние фида"
+        verbose_name_plural = "Состояния фидов"
+
+    def __str__(self):
+        return f"{self.format}: {self.watermark}"
+
+
+class CatalogSnapshot(models.Model):
+    """Заранее собранный ответ агрегированного эндпоинта (например, overview)"""
+
+    name = models.CharField("Название", max_length=50, unique=True)
+    # Версия области кэша (см. snapshots.py), из которой собран payload
+    built_version = models.PositiveBigIntegerField("Собранная версия", null=True, blank=True)
+    etag = models.CharField("ETag", max_length=64, blank=True)
+    payload = models.JSONField("Данные", default=dict, blank=True)
+    built_at = models.DateTimeField("Собран", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Снимок каталога"
+        verbose_name_plural = "Снимки каталога"
+
+    def __str__(self):
+        return f"{self.name} v{self.built_version}"
+
+    @property
+    def is_built(self):
+        return self.built_version is not None
+
+
 class Order(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
@@ -240,6 +476,22 @@ class Order(models.Model):
     )
     contact_phone = models.CharField("Контактный телефон", max_length=20)
     contact_name = models.CharField("Контактное имя", max_length=255)
+    total_price = models.DecimalField(
+        "Сумма",
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False
+    )
+    # sha256 от владельца и ключа из заголовка Idempotency-Key (см. cart/checkout.py)
+    idempotency_key = models.CharField(
+        "Ключ идемпотентности",
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -316,6 +568,21 @@ class HeroBlock(models.Model):
         blank=True,
         verbose_name=_('Дата публикации')
     )
+
+    # Окно показа: пустая граница окно не ограничивает
+    publish_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Показывать с'),
+        help_text=_('Блок появится на сайте в это время')
+    )
+
+    unpublish_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Показывать до'),
+        help_text=_('Блок скроется с сайта в это время')
+    )
     
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -397,6 +664,13 @@ class HeroBlock(models.Model):
     
     def __str__(self):
         return self.title
+
+    def clean(self):
+        super().clean()
+        if self.publish_at and self.unpublish_at and self.unpublish_at <= self.publish_at:
+            raise ValidationError({
+                'unpublish_at': _('Время окончания показа должно быть позже времени начала')
+            })
     
     def save(self, *args, **kwargs):
         if self.status == 'published' and not self.published_at:
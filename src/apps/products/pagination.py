@@ -0,0 +1,209 @@
+"""
+Курсорная (keyset) пагинация списков товаров.
+
+Страница выбирается условием WHERE по ключу сортировки и id последней
+строки предыдущей страницы, поэтому глубокие страницы стоят столько же,
+сколько первая, COUNT(*) не выполняется, а новые товары не сдвигают ленту.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Product
+
+# Значение параметра ordering -> (поле Product, по убыванию)
+PRODUCT_ORDERINGS = {
+    '-created_at': ('created_at', True),
+    'created_at': ('created_at', False),
+    'price': ('min_price', False),
+    '-price': ('min_price', True),
+    'popularity': ('popularity', False),
+    '-popularity': ('popularity', True),
+}
+DEFAULT_PRODUCT_ORDERING = '-created_at'
+# Поля, которые нужны пагинатору; остальное списки берут из документов
+CURSOR_FIELDS = ('pk', 'created_at', 'min_price', 'popularity')
+
+
+def get_product_ordering(request):
+    ordering = request.query_params.get('ordering', '').strip()
+    return ordering if ordering in PRODUCT_ORDERINGS else DEFAULT_PRODUCT_ORDERING
+
+
+def order_products(queryset, ordering, reverse=False):
+    """
+    Сортирует по ключу и id. Товары без цены всегда в конце списка,
+    поэтому при обратном проходе они идут первыми.
+    """
+    field, descending = PRODUCT_ORDERINGS[ordering]
+    if reverse:
+        descending = not descending
+
+    nulls = {}
+    if Product._meta.get_field(field).null:
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+    expression = F(field).desc(**nulls) if descending else F(field).asc(**nulls)
+    return queryset.order_by(expression, '-pk' if descending else 'pk')
+
+
+def _rows_after(field, descending, nulls_last, value, pk):
+    """
+    Условие «строго после строки (value, pk)» в заданном порядке.
+    nulls_last — где стоят NULL для nullable-поля, None — поле без NULL.
+    """
+    lookup = 'lt' if descending else 'gt'
+    if value is None:
+        condition = Q(**{f'{field}__isnull': True, f'pk__{lookup}': pk})
+        if nulls_last is False:
+            condition |= Q(**{f'{field}__isnull': False})
+        return condition
+
+    condition = Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+    if nulls_last:
+        condition |= Q(**{f'{field}__isnull': True})
+    return condition
+
+
+def wants_cursor_pagination(request):
+    return 'cursor' in request.query_params or request.query_params.get('pagination') == 'cursor'
+
+
+class ProductCursorPagination(BasePagination):
+    """
+    Ответ: {"next": url|null, "previous": url|null, "results": [...]}.
+    Курсор хранит сортировку, ключ и id крайней строки страницы.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            self.ordering = get_product_ordering(request)
+            reverse = False
+        else:
+            self.ordering, reverse = cursor['o'], cursor['r']
+
+        field, descending = PRODUCT_ORDERINGS[self.ordering]
+        queryset = order_products(queryset, self.ordering, reverse=reverse)
+        if cursor is not None:
+            model_field = Product._meta.get_field(field)
+            queryset = queryset.filter(_rows_after(
+                field,
+                descending != reverse,
+                (not reverse) if model_field.null else None,
+                cursor['v'],
+                cursor['id'],
+            ))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        self.has_next = has_more if not reverse else cursor is not None
+        self.has_previous = cursor is not None if not reverse else has_more
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['o'] not in PRODUCT_ORDERINGS or not isinstance(cursor['id'], int):
+                raise ValueError
+            cursor['r'] = bool(cursor.get('r'))
+            if cursor.get('v') is not None:
+                field, _ = PRODUCT_ORDERINGS[cursor['o']]
+                cursor['v'] = Product._meta.get_field(field).to_python(cursor['v'])
+            else:
+                cursor['v'] = None
+        except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, row, reverse):
+        field, _ = PRODUCT_ORDERINGS[self.ordering]
+        value = getattr(row, field)
+        payload = {
+            'o': self.ordering,
+            'v': None if value is None else Product._meta.get_field(field).value_to_string(row),
+            'id': row.pk,
+            'r': reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CursorPaginationMixin:
+    """
+    Для действий из cursor_actions включает курсорную пагинацию
+    по ?cursor=... или ?pagination=cursor; иначе работает пагинатор по умолчанию.
+    """
+
+    cursor_actions = ()
+    cursor_pagination_class = ProductCursorPagination
+
+    @property
+    def paginator(self):
+        if (
+            not hasattr(self, '_paginator')
+            and self.action in self.cursor_actions
+            and wants_cursor_pagination(self.request)
+        ):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
@@ -0,0 +1,107 @@
+"""
+Быстрый JSON-рендерер для эндпоинтов каталога.
+
+FastJSONRenderer кодирует ответ через orjson: даты и время — нативно,
+Decimal и прочие типы — так же, как стандартный JSONEncoder DRF. Готовый
+JSON-текст (RawJSON — документы товаров и снимок overview прямо из БД)
+вставляется в ответ байтами, без декодирования и повторного кодирования.
+Без orjson, при CATALOG_FAST_JSON=False или при запросе с отступами
+работает обычный JSONRenderer; RawJSON для него выглядит как dict.
+"""
+import json
+import re
+import secrets
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RawJSON(Mapping):
+    """
+    Готовый JSON-текст объекта. Рендерер пишет его как есть, остальной код
+    (сериализация, тесты, обычный рендерер) читает как dict — текст
+    декодируется при первом обращении. pk — id товара документа, если есть.
+    """
+
+    __slots__ = ('raw', 'pk', '_data')
+
+    def __init__(self, raw, pk=None):
+        self.raw = raw.encode('utf-8') if isinstance(raw, str) else raw
+        self.pk = pk
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.raw)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f'RawJSON({self.raw[:60]!r})'
+
+
+_drf_encoder = JSONEncoder()
+
+
+def fast_json_available():
+    return orjson is not None and settings.CATALOG_FAST_JSON
+
+
+def encode_fast_json(data):
+    """
+    Кодирует data через orjson. RawJSON вставляются байтами: через
+    orjson.Fragment, а в старых версиях orjson — заменой меток со случайным
+    ключом, который не может совпасть с данными.
+    """
+    fragments = []
+    nonce = secrets.token_hex(8)
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def default(obj):
+        if isinstance(obj, RawJSON):
+            if hasattr(orjson, 'Fragment'):
+                return orjson.Fragment(obj.raw)
+            fragments.append(obj.raw)
+            return f'\x00{nonce}:{len(fragments) - 1}\x00'
+        return _drf_encoder.default(obj)
+
+    content = orjson.dumps(data, default=default, option=options)
+    if not fragments:
+        return content
+    marker = re.compile(rb'"\\u0000' + nonce.encode('ascii') + rb':(\d+)\\u0000"')
+    return marker.sub(lambda match: fragments[int(match.group(1))], content)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson; при недоступности откатывается на стандартный."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not fast_json_available() or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return encode_fast_json(data)
+
+
+class CatalogRenderersMixin:
+    """Рендереры каталога из настройки CATALOG_RENDERER_CLASSES."""
+
+    def get_renderers(self):
+        return [import_string(path)() for path in settings.CATALOG_RENDERER_CLASSES]
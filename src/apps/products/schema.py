@@ -0,0 +1,81 @@
+"""
+Реестр схем атрибутов категорий на уровне процесса.
+
+Загружает связи категория→атрибуты одним запросом и держит их в памяти,
+пока не сменится версия области ATTRIBUTE_SCHEMA_SCOPE (см. versioning.py).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Category
+from .versioning import bump_version, get_version
+
+ATTRIBUTE_SCHEMA_SCOPE = 'attribute-schema'
+APPLIES_TO_VALUES = ('product', 'variant')
+
+
+class AttributeSchemaRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _load(self):
+        schemas = {}
+        links = Category.attributes.through.objects.select_related('attribute').order_by(
+            'attribute__sort_order',
+            'attribute__name',
+        )
+        for link in links:
+            category_schema = schemas.setdefault(
+                link.category_id,
+                {applies_to: [] for applies_to in APPLIES_TO_VALUES},
+            )
+            category_schema.setdefault(link.attribute.applies_to, []).append(link.attribute)
+        return schemas
+
+    def _get_schemas(self):
+        now = time.monotonic()
+        schemas = self._schemas
+        if schemas is not None and now - self._checked_at < settings.ATTRIBUTE_SCHEMA_CHECK_INTERVAL:
+            return schemas
+
+        version = get_version(ATTRIBUTE_SCHEMA_SCOPE)
+        with self._lock:
+            if self._schemas is None or self._version != version:
+                self._schemas = self._load()
+                self._version = version
+            self._checked_at = now
+            return self._schemas
+
+    def get_attributes(self, category, applies_to):
+        """Атрибуты категории нужного типа, отсортированные по sort_order и имени."""
+        if not category:
+            return []
+        category_id = getattr(category, 'pk', category)
+        return list(self._get_schemas().get(category_id, {}).get(applies_to, []))
+
+    def get_attribute_map(self, category, applies_to):
+        return {attribute.slug: attribute for attribute in self.get_attributes(category, applies_to)}
+
+    def invalidate(self):
+        """
+        Сбрасывает реестр в текущем процессе и меняет общую версию для остальных.
+        После коммита версия меняется ещё раз: другой процесс мог успеть
+        загрузить схему до коммита и запомнить её под новой версией.
+        """
+        self._reset()
+        transaction.on_commit(self._reset)
+
+    def _reset(self):
+        bump_version(ATTRIBUTE_SCHEMA_SCOPE)
+        with self._lock:
+            self._schemas = None
+            self._version = None
+
+
+attribute_schema = AttributeSchemaRegistry()
@@ -0,0 +1,82 @@
+"""
+Полнотекстовый поиск по товарам.
+
+Бэкенд выбирается настройкой PRODUCT_SEARCH_BACKEND: 'memory', 'sqlite',
+'postgres', путь к классу или 'auto' (по движку БД по умолчанию).
+MemorySearchBackend держит индекс в памяти процесса и годится только для
+разработки: если 'auto' не нашёл бэкенд для движка БД при DEBUG = False,
+get_search_backend падает с ImproperlyConfigured.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from ..models import Product, ProductSearchEntry
+from .backends import MemorySearchBackend, PostgresSearchBackend, SQLiteSearchBackend
+from .text import build_search_fields
+
+BACKEND_ALIASES = {
+    'memory': MemorySearchBackend,
+    'sqlite': SQLiteSearchBackend,
+    'postgres': PostgresSearchBackend,
+}
+VENDOR_BACKENDS = {
+    'sqlite': 'sqlite',
+    'postgresql': 'postgres',
+}
+INDEX_CHUNK_SIZE = 500
+
+_backends = {}
+
+
+def get_search_backend():
+    name = settings.PRODUCT_SEARCH_BACKEND
+    if name == 'auto':
+        name = VENDOR_BACKENDS.get(connection.vendor)
+        if name is None:
+            if not settings.DEBUG:
+                raise ImproperlyConfigured(
+                    f'Нет поискового бэкенда для БД {connection.vendor}: укажите PRODUCT_SEARCH_BACKEND явно'
+                )
+            name = 'memory'
+
+    if name not in _backends:
+        backend_class = BACKEND_ALIASES.get(name) or import_string(name)
+        _backends[name] = backend_class()
+    return _backends[name]
+
+
+def index_products(product_ids):
+    """Пересобирает поисковые записи товаров и обновляет индекс."""
+    product_ids = list(product_ids)
+    backend = get_search_backend()
+
+    for start in range(0, len(product_ids), INDEX_CHUNK_SIZE):
+        chunk = product_ids[start:start + INDEX_CHUNK_SIZE]
+        products = Product.objects.filter(pk__in=chunk).select_related(
+            'brand',
+            'category',
+        ).prefetch_related('variants')
+        entries = [
+            ProductSearchEntry(product=product, **build_search_fields(product))
+            for product in products
+        ]
+        ProductSearchEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['title', 'body', 'updated_at'],
+        )
+        backend.index(entries)
+
+        found_ids = {entry.product_id for entry in entries}
+        backend.remove([product_id for product_id in chunk if product_id not in found_ids])
+
+
+def remove_products(product_ids):
+    get_search_backend().remove(list(product_ids))
+
+
+def search_product_ids(query, limit=None):
+    return get_search_backend().search(query, limit or settings.PRODUCT_SEARCH_MAX_RESULTS)
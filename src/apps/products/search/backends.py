@@ -0,0 +1,226 @@
+"""
+Поисковые бэкенды.
+
+Все бэкенды индексируют одни и те же записи ProductSearchEntry (title/body)
+и возвращают id товаров, отсортированные по релевантности.
+
+- MemorySearchBackend — инвертированный индекс в памяти процесса (тесты, dev);
+- SQLiteSearchBackend — таблица FTS5 с заранее стеммированным текстом;
+- PostgresSearchBackend — tsvector с конфигурацией russian (латиница стеммится english_stem).
+"""
+import bisect
+import math
+import threading
+from collections import defaultdict
+
+from django.db import connection
+
+from ..models import ProductSearchEntry
+from .text import stem_tokens, tokenize
+
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+
+
+class BaseSearchBackend:
+    def index(self, entries):
+        """Добавляет или обновляет записи ProductSearchEntry в индексе."""
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        """Возвращает id товаров по убыванию релевантности."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemorySearchBackend(BaseSearchBackend):
+    """
+    Инвертированный индекс в памяти процесса. При первом обращении
+    загружается из ProductSearchEntry.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._postings = defaultdict(dict)  # term -> {product_id: вес}
+        self._document_terms = {}  # product_id -> set(term)
+        self._vocabulary = []  # отсортированные термы для поиска по префиксу
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                self._index_entries(ProductSearchEntry.objects.all().iterator())
+
+    def _index_entries(self, entries):
+        for entry in entries:
+            self._remove_one(entry.product_id)
+            weights = defaultdict(float)
+            for term in stem_tokens(entry.title):
+                weights[term] += TITLE_WEIGHT
+            for term in stem_tokens(entry.body):
+                weights[term] += BODY_WEIGHT
+            for term, weight in weights.items():
+                if term not in self._postings:
+                    bisect.insort(self._vocabulary, term)
+                self._postings[term][entry.product_id] = weight
+            self._document_terms[entry.product_id] = set(weights)
+
+    def _remove_one(self, product_id):
+        for term in self._document_terms.pop(product_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                position = bisect.bisect_left(self._vocabulary, term)
+                if position < len(self._vocabulary) and self._vocabulary[position] == term:
+                    del self._vocabulary[position]
+
+    def _expand_prefix(self, prefix):
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            terms.append(self._vocabulary[position])
+            position += 1
+        return terms
+
+    def index(self, entries):
+        self._ensure_loaded()
+        with self._lock:
+            self._index_entries(entries)
+
+    def remove(self, product_ids):
+        self._ensure_loaded()
+        with self._lock:
+            for product_id in product_ids:
+                self._remove_one(product_id)
+
+    def search(self, query, limit):
+        terms = stem_tokens(query)
+        if not terms:
+            return []
+
+        self._ensure_loaded()
+        with self._lock:
+            total = max(len(self._document_terms), 1)
+            scores = None
+            for position, term in enumerate(terms):
+                is_last = position == len(terms) - 1
+                expanded = self._expand_prefix(term) if is_last else [term]
+
+                term_scores = defaultdict(float)
+                for expanded_term in expanded:
+                    postings = self._postings.get(expanded_term, {})
+                    idf = math.log(1 + total / (1 + len(postings)))
+                    for product_id, weight in postings.items():
+                        term_scores[product_id] = max(term_scores[product_id], weight * idf)
+
+                if scores is None:
+                    scores = dict(term_scores)
+                else:
+                    scores = {
+                        product_id: score + term_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in term_scores
+                    }
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, _ in ranked[:limit]]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._document_terms.clear()
+            self._vocabulary.clear()
+            self._loaded = False
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5: стемминг делается в Python, таблица хранит уже нормализованные токены."""
+
+    table = 'products_search_fts'
+
+    def index(self, entries):
+        rows = [
+            (entry.product_id, ' '.join(stem_tokens(entry.title)), ' '.join(stem_tokens(entry.body)))
+            for entry in entries
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {self.table} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def search(self, query, limit):
+        terms = stem_tokens(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, %s, %s), rowid LIMIT %s',
+                [match, TITLE_WEIGHT, BODY_WEIGHT, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Ищет прямо по ProductSearchEntry. Выражение ниже совпадает с GIN-индексом
+    из миграции, поэтому индексировать отдельно ничего не нужно.
+    """
+
+    document_sql = (
+        "setweight(to_tsvector('russian', title), 'A') || "
+        "setweight(to_tsvector('russian', body), 'B')"
+    )
+
+    def index(self, entries):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def search(self, query, limit):
+        lexemes = tokenize(query)
+        if not lexemes:
+            return []
+        tsquery = ' & '.join(lexemes[:-1] + [f'{lexemes[-1]}:*'])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT product_id FROM {ProductSearchEntry._meta.db_table}, '
+                f"to_tsquery('russian', %s) query "
+                f'WHERE ({self.document_sql}) @@ query '
+                f'ORDER BY ts_rank({self.document_sql}, query) DESC, product_id LIMIT %s',
+                [tsquery, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def clear(self):
+        pass
@@ -0,0 +1,40 @@
+"""
+Стеммеры для русского и английского языков: алгоритмы Snowball
+из пакета snowballstemmer.
+
+Объекты стеммеров хранят состояние между вызовами, поэтому у каждого
+потока свои экземпляры.
+"""
+import re
+import threading
+
+import snowballstemmer
+
+CYRILLIC_RE = re.compile('[а-яё]')
+
+_stemmers = threading.local()
+
+
+def _stemmer(language):
+    stemmer = getattr(_stemmers, language, None)
+    if stemmer is None:
+        stemmer = snowballstemmer.stemmer(language)
+        setattr(_stemmers, language, stemmer)
+    return stemmer
+
+
+def stem_russian(word):
+    return _stemmer('russian').stemWord(word)
+
+
+def stem_english(word):
+    return _stemmer('english').stemWord(word)
+
+
+def stem(token):
+    """Стемминг одного токена в нижнем регистре. Токены с цифрами не трогаем."""
+    if not token.isalpha():
+        return token
+    if CYRILLIC_RE.search(token):
+        return stem_russian(token)
+    return stem_english(token)
@@ -0,0 +1,39 @@
+import re
+
+from .stemmers import stem
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text or '').lower().replace('ё', 'е'))
+
+
+def stem_tokens(text):
+    return [stem(token) for token in tokenize(text)]
+
+
+def _join(values):
+    return ' '.join(str(value) for value in values if value not in (None, ''))
+
+
+def build_search_fields(product):
+    """
+    Текст товара для индекса: title весит больше body при ранжировании.
+    Ожидает товар с загруженными brand, category и variants.
+    """
+    variants = list(product.variants.all())
+    title = _join([
+        product.name,
+        getattr(product.brand, 'name', ''),
+        getattr(product.category, 'name', ''),
+        *(variant.sku for variant in variants),
+    ])
+    body = _join([
+        product.short_description,
+        product.description,
+        *(product.specifications or {}).values(),
+        *(value for variant in variants for value in (variant.attributes or {}).values()),
+    ])
+    return {'title': title, 'body': body}
+
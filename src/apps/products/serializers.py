@@ -1,5 +1,11 @@
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
-from .models import Category, Brand, Product, ProductImage, ProductVariant, Attribute, Order, HeroBlock
+from .fieldsets import DynamicFieldsMixin
+from .models import Category, Brand, Product, ProductImage, ProductVariant, Attribute, Order, OrderItem, HeroBlock
+from .schema import attribute_schema
 
 
 def serialize_attribute_value(attribute, value):
@@ -17,26 +23,106 @@ def serialize_attribute_value(attribute, value):
 
 
 def get_category_attribute_map(category, applies_to):
-    if not category:
-        return {}
-    return {
-        attribute.slug: attribute
-        for attribute in category.attributes.filter(applies_to=applies_to).order_by('sort_order', 'name')
+    return attribute_schema.get_attribute_map(category, applies_to)
+
+
+def normalize_color(value):
+    return str(value).strip().lower()
+
+
+def get_product_media_index(product):
+    """
+    Медиа товара в порядке (order, id) и индекс «цвет → id медиа».
+    Строится один раз на экземпляр товара из уже загруженных images,
+    варианты товара берут из него готовые списки.
+    """
+    index = getattr(product, '_media_index', None)
+    if index is not None:
+        return index
+
+    media = sorted(product.images.all(), key=lambda item: (item.order, item.pk))
+    common = [item.pk for item in media if not item.color_value]
+    by_color = {}
+    for item in media:
+        if item.color_value:
+            by_color.setdefault(normalize_color(item.color_value), set()).add(item.pk)
+
+    index = {
+        'media': {item.pk: item for item in media},
+        'common': common,
+        # Для каждого цвета: общие медиа и медиа этого цвета в исходном порядке
+        'colors': {
+            color: [item.pk for item in media if not item.color_value or item.pk in color_ids]
+            for color, color_ids in by_color.items()
+        },
     }
+    product._media_index = index
+    return index
+
+
+def get_variant_media_ids(variant):
+    product = getattr(variant, 'product', None)
+    if product is None:
+        return []
+
+    index = get_product_media_index(product)
+    color_value = (variant.attributes or {}).get('color')
+    if not color_value:
+        return index['common']
+    return index['colors'].get(normalize_color(color_value), index['common'])
+
 
+def absolute_media_url(url):
+    """
+    Ссылка на медиа от MEDIA_SITE_URL, а не от хоста запроса: документы,
+    снимки и кеш собираются без запроса, и ссылки в них должны совпадать
+    со ссылками в ответах.
+    """
+    return urljoin(settings.MEDIA_SITE_URL, url)
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class MediaURLMixin:
+    def to_representation(self, value):
+        if not value:
+            return None
+        return absolute_media_url(value.url)
+
+
+class MediaFileField(MediaURLMixin, serializers.FileField):
+    pass
+
+
+class MediaImageField(MediaURLMixin, serializers.ImageField):
+    pass
+
+
+class MediaFieldsMixin:
+    """Файловые поля модели отдаются абсолютными ссылками (absolute_media_url)"""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FileField: MediaFileField,
+        models.ImageField: MediaImageField,
+    }
+
+
+class CategorySerializer(MediaFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'parent', 'description', 'image', 'created_at', 'updated_at']
 
-class BrandSerializer(serializers.ModelSerializer):
+class CategoryTreeSerializer(MediaFieldsMixin, serializers.ModelSerializer):
+    """Узел дерева категорий; children добавляет tree.build_category_tree"""
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'parent', 'depth', 'order', 'is_header_menu', 'image']
+
+class BrandSerializer(MediaFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Brand
         fields = ['id', 'name', 'slug', 'logo', 'created_at', 'updated_at']
 
 class ProductImageSerializer(serializers.ModelSerializer):
-    image = serializers.FileField(use_url=True)
+    image = MediaFileField()
     media_type = serializers.ReadOnlyField()
 
     class Meta:
@@ -51,9 +137,10 @@ class AttributeSerializer(serializers.ModelSerializer):
             'sort_order', 'unit', 'group_name', 'values',
         ]
 
-class ProductVariantSerializer(serializers.ModelSerializer):
+class ProductVariantSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     attribute_values = serializers.SerializerMethodField()
     media = serializers.SerializerMethodField()
+    stock = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductVariant
@@ -86,31 +173,46 @@ class ProductVariantSerializer(serializers.ModelSerializer):
             resolved_values.append(serialize_attribute_value(attribute, value))
         return resolved_values
 
+    def get_stock(self, obj):
+        # Доступный остаток (stock.with_available_stock); документы хранят складской,
+        # его заменяет apply_available_stock при выдаче
+        return getattr(obj, 'available_stock', obj.stock)
+
     def get_media(self, obj):
-        product = getattr(obj, 'product', None)
-        if product is None:
+        media_ids = get_variant_media_ids(obj)
+        if not media_ids:
             return []
 
-        color_value = (obj.attributes or {}).get('color')
-        product_media = product.images.all().order_by('order', 'id')
+        media = get_product_media_index(obj.product)['media']
+        return ProductImageSerializer(
+            [media[media_id] for media_id in media_ids],
+            many=True,
+            context=self.context,
+        ).data
+
+
+class NestedProductVariantSerializer(ProductVariantSerializer):
+    """
+    Вариант внутри товара: вместо копий медиа отдаёт id из images товара.
+    """
+    media_ids = serializers.SerializerMethodField()
 
-        if color_value:
-            normalized_color_values = {str(color_value).strip().lower()}
-            filtered_media = [
-                media
-                for media in product_media
-                if not media.color_value or media.color_value.strip().lower() in normalized_color_values
-            ]
-        else:
-            filtered_media = [media for media in product_media if not media.color_value]
+    class Meta(ProductVariantSerializer.Meta):
+        fields = [
+            'id', 'sku', 'attributes', 'price', 'old_price',
+            'is_active', 'stock', 'attribute_values', 'media_ids',
+        ]
 
-        return ProductImageSerializer(filtered_media, many=True, context=self.context).data
+    def get_media_ids(self, obj):
+        return list(get_variant_media_ids(obj))
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('brand', 'category', 'images', 'variants')
 
-class ProductSerializer(serializers.ModelSerializer):
     brand = BrandSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
-    variants = ProductVariantSerializer(many=True, read_only=True)
+    variants = NestedProductVariantSerializer(many=True, read_only=True)
     specifications = serializers.SerializerMethodField()
     specifications_map = serializers.JSONField(source='specifications', read_only=True)
 
@@ -150,50 +252,76 @@ class ProductSerializer(serializers.ModelSerializer):
         return resolved_values
 
 
-class BrandDetailSerializer(serializers.ModelSerializer):
-    products = serializers.SerializerMethodField()
+class ProductCardSerializer(serializers.ModelSerializer):
+    """Лёгкая карточка товара; image — ссылка на файл из аннотации card_image (brands.py)"""
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'min_price', 'is_preorder', 'image']
+
+    def get_image(self, obj):
+        name = getattr(obj, 'card_image', None)
+        if not name:
+            return None
+        return absolute_media_url(ProductImage._meta.get_field('image').storage.url(name))
+
+class BrandDetailSerializer(MediaFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    """Шапка страницы бренда; первую страницу карточек добавляет BrandViewSet.retrieve"""
+    categories = serializers.SerializerMethodField()
 
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'slug', 'logo', 'created_at', 'updated_at', 'products']
-
-    def get_products(self, obj):
-        request = self.context.get('request')
-        products = obj.products.filter(is_active=True).select_related(
-            'brand',
-            'category',
-        ).prefetch_related(
-            'images',
-            'variants',
-        )
-        return ProductSerializer(products, many=True, context={'request': request}).data
+        fields = [
+            'id', 'name', 'slug', 'logo', 'created_at', 'updated_at',
+            'product_count', 'min_price', 'categories',
+        ]
+
+    def get_categories(self, obj):
+        if not obj.category_ids:
+            return []
+        return list(Category.objects.filter(pk__in=obj.category_ids).order_by('name').values('id', 'name', 'slug'))
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'variant', 'quantity', 'price_at_time']
+        read_only_fields = fields
 
 class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
     class Meta:
         model = Order
         fields = [
             'id', 'user', 'contact_phone', 'contact_name',
-            'contact_dob', 'created_at', 'updated_at'
+            'items', 'total_price', 'created_at'
         ]
-        read_only_fields = ['user'] 
+        read_only_fields = ['user', 'total_price', 'created_at']
 
-class HeroBlockSerializer(serializers.ModelSerializer):
+class HeroBlockSerializer(MediaFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для герой-блоков"""
     
-    # Опционально: вложенный сериализатор для связанного продукта
+    # Данные связанного продукта; без продукта поля равны null
     product_slug = serializers.CharField(
         source='product.slug',
-        read_only=True
+        read_only=True,
+        default=None
     )
 
     product_name = serializers.CharField(
         source='product.name',
-        read_only=True
+        read_only=True,
+        default=None
     )
     
-    product_price = serializers.CharField(
-        source='product.price',
-        read_only=True
+    # Минимальная цена активных вариантов (ключ сортировки Product.min_price)
+    product_price = serializers.DecimalField(
+        source='product.min_price',
+        max_digits=10,
+        decimal_places=2,
+        read_only=True,
+        default=None
     )
     
     class Meta:
@@ -207,6 +335,8 @@ class HeroBlockSerializer(serializers.ModelSerializer):
             'is_active',
             'order',
             'published_at',
+            'publish_at',
+            'unpublish_at',
             'created_at',
             'updated_at',
             'product',
@@ -222,3 +352,12 @@ class HeroBlockSerializer(serializers.ModelSerializer):
             'button_link',
         ]
         read_only_fields = ['created_at', 'updated_at', 'published_at']
+
+    def validate(self, attrs):
+        publish_at = attrs.get('publish_at', getattr(self.instance, 'publish_at', None))
+        unpublish_at = attrs.get('unpublish_at', getattr(self.instance, 'unpublish_at', None))
+        if publish_at and unpublish_at and unpublish_at <= publish_at:
+            raise serializers.ValidationError({
+                'unpublish_at': 'Время окончания показа должно быть позже времени начала'
+            })
+        return attrs
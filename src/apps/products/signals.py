@@ -0,0 +1,243 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .brands import brand_ids_for_products, refresh_brand_aggregates
+from .conditional import ATTRIBUTES_SCOPE, BRANDS_SCOPE, CATEGORIES_SCOPE, HERO_BLOCKS_SCOPE, PRODUCTS_SCOPE
+from .documents import invalidate_product_documents
+from .facets import refresh_product_facets
+from .models import Attribute, Brand, Category, HeroBlock, OrderItem, Product, ProductImage, ProductVariant
+from .schema import attribute_schema
+from .search import index_products, remove_products
+from .snapshots import mark_overview_stale
+from .sorting import refresh_product_sort_keys
+from .versioning import invalidate_versions
+
+CATALOG_MODELS = (Product, ProductVariant, ProductImage, Brand, Category, Attribute)
+
+
+def product_ids_for(**lookup):
+    return Product.objects.filter(**lookup).values_list('pk', flat=True)
+
+
+# Схема атрибутов подключается первой: её сброс после коммита должен
+# выполниться раньше пересборки документов и снимков.
+def attribute_schema_changed(sender, **kwargs):
+    attribute_schema.invalidate()
+
+
+def attribute_schema_relations_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        attribute_schema.invalidate()
+
+
+for model in (Attribute, Category):
+    post_save.connect(attribute_schema_changed, sender=model, dispatch_uid=f'schema_{model.__name__}_saved')
+    post_delete.connect(attribute_schema_changed, sender=model, dispatch_uid=f'schema_{model.__name__}_deleted')
+m2m_changed.connect(
+    attribute_schema_relations_changed,
+    sender=Category.attributes.through,
+    dispatch_uid='schema_category_attributes_changed',
+)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    invalidate_product_documents([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_child_changed(sender, instance, **kwargs):
+    invalidate_product_documents([instance.product_id])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(pre_delete, sender=Brand)
+def brand_changed(sender, instance, **kwargs):
+    invalidate_product_documents(product_ids_for(brand=instance))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    invalidate_product_documents(product_ids_for(category=instance))
+
+
+@receiver(post_save, sender=Attribute)
+@receiver(pre_delete, sender=Attribute)
+def attribute_changed(sender, instance, **kwargs):
+    invalidate_product_documents(product_ids_for(category__attributes=instance))
+
+
+@receiver(m2m_changed, sender=Category.attributes.through)
+def category_attributes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # При clear связи нужно прочитать до удаления, поэтому ловим pre_clear
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        invalidate_product_documents(product_ids_for(category=instance))
+    elif pk_set:
+        invalidate_product_documents(product_ids_for(category__in=pk_set))
+    else:
+        invalidate_product_documents(product_ids_for(category__attributes=instance))
+
+
+def catalog_changed(sender, **kwargs):
+    mark_overview_stale()
+
+
+def catalog_relations_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        mark_overview_stale()
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=model, dispatch_uid=f'overview_{model.__name__}_saved')
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'overview_{model.__name__}_deleted')
+m2m_changed.connect(
+    catalog_relations_changed,
+    sender=Category.attributes.through,
+    dispatch_uid='overview_category_attributes_changed',
+)
+
+
+
+def deleted_with_product(origin):
+    # Удаление каскадом от товара: варианты и медиа не должны заново создавать его поисковую запись и фасеты
+    return isinstance(origin, Product) or getattr(origin, 'model', None) is Product
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def index_variant_product(sender, instance, origin=None, **kwargs):
+    if not deleted_with_product(origin):
+        index_products([instance.product_id])
+
+
+@receiver(post_save, sender=Brand)
+def index_brand_products(sender, instance, **kwargs):
+    index_products(product_ids_for(brand=instance))
+
+
+@receiver(pre_delete, sender=Brand)
+def brand_deleting(sender, instance, **kwargs):
+    instance._search_product_ids = list(product_ids_for(brand=instance))
+
+
+@receiver(post_delete, sender=Brand)
+def index_former_brand_products(sender, instance, **kwargs):
+    index_products(getattr(instance, '_search_product_ids', []))
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, **kwargs):
+    index_products(product_ids_for(category=instance))
+
+
+@receiver(post_save, sender=Product)
+def refresh_saved_product_facets(sender, instance, **kwargs):
+    refresh_product_facets([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def refresh_variant_product_facets(sender, instance, origin=None, **kwargs):
+    # При удалении товара его строки фасетов удалит каскад
+    if not deleted_with_product(origin):
+        refresh_product_facets([instance.product_id])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def refresh_variant_product_sort_keys(sender, instance, origin=None, **kwargs):
+    if not deleted_with_product(origin):
+        refresh_product_sort_keys([instance.product_id])
+
+
+# Агрегаты брендов читают Product.min_price, поэтому идут после ключей сортировки
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def refresh_variant_brand_aggregates(sender, instance, origin=None, **kwargs):
+    if not deleted_with_product(origin):
+        refresh_brand_aggregates(brand_ids_for_products([instance.product_id]))
+
+
+@receiver(pre_save, sender=Product)
+def product_brand_changing(sender, instance, **kwargs):
+    # Товар, перенесённый в другой бренд, меняет агрегаты и прежнего бренда
+    instance._previous_brand_id = None
+    if instance.pk:
+        instance._previous_brand_id = Product.objects.filter(pk=instance.pk).values_list(
+            'brand_id',
+            flat=True,
+        ).first()
+
+
+@receiver(post_save, sender=Product)
+def refresh_saved_product_brand_aggregates(sender, instance, **kwargs):
+    refresh_brand_aggregates([instance.brand_id, getattr(instance, '_previous_brand_id', None)])
+
+
+@receiver(post_delete, sender=Product)
+def refresh_deleted_product_brand_aggregates(sender, instance, **kwargs):
+    refresh_brand_aggregates([instance.brand_id])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_ordered_product_sort_keys(sender, instance, **kwargs):
+    refresh_product_sort_keys(product_ids_for(variants=instance.variant_id))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_image_product(sender, instance, origin=None, **kwargs):
+    # Медиа — часть товара: инкрементальные фиды (feeds.py) находят изменения по Product.updated_at
+    if not deleted_with_product(origin):
+        Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# Области версий для ETag эндпоинтов каталога (см. conditional.py)
+CONDITIONAL_SCOPES = {
+    Category: (CATEGORIES_SCOPE, PRODUCTS_SCOPE),
+    Brand: (BRANDS_SCOPE, PRODUCTS_SCOPE),
+    Attribute: (ATTRIBUTES_SCOPE, PRODUCTS_SCOPE),
+    Product: (PRODUCTS_SCOPE,),
+    ProductVariant: (PRODUCTS_SCOPE,),
+    ProductImage: (PRODUCTS_SCOPE,),
+    # Продажи меняют сортировку по популярности
+    OrderItem: (PRODUCTS_SCOPE,),
+    HeroBlock: (HERO_BLOCKS_SCOPE,),
+}
+
+
+def conditional_scopes_changed(sender, **kwargs):
+    invalidate_versions(*CONDITIONAL_SCOPES[sender])
+
+
+def conditional_relations_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_versions(ATTRIBUTES_SCOPE, PRODUCTS_SCOPE)
+
+
+for model in CONDITIONAL_SCOPES:
+    post_save.connect(conditional_scopes_changed, sender=model, dispatch_uid=f'conditional_{model.__name__}_saved')
+    post_delete.connect(conditional_scopes_changed, sender=model, dispatch_uid=f'conditional_{model.__name__}_deleted')
+m2m_changed.connect(
+    conditional_relations_changed,
+    sender=Category.attributes.through,
+    dispatch_uid='conditional_category_attributes_changed',
+)
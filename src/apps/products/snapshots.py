@@ -0,0 +1,144 @@
+"""
+Версионированные снимки агрегированных ответов каталога.
+
+Изменение каталога меняет версию области OVERVIEW_SCOPE в кэше (versioning.py),
+не трогая строку снимка, а после коммита ставит пересборку. Снимок устарел,
+если собран не из текущей версии. Пересборку ведёт одно фоновое задание на
+все процессы (блокировка в кэше): оно ждёт CATALOG_SNAPSHOT_DEBOUNCE секунд,
+чтобы собрать серию изменений за один проход. Запрос отдаёт готовую строку
+снимка и собирает его сам только при первом обращении, если деплой этого не сделал.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .documents import get_product_documents
+from .models import Brand, CatalogSnapshot, Category, Product
+from .serializers import BrandSerializer, CategorySerializer
+from .stock import apply_variant_stock
+from .versioning import get_version, invalidate_versions
+
+logger = logging.getLogger(__name__)
+
+OVERVIEW_SNAPSHOT = 'overview'
+OVERVIEW_SCOPE = 'overview-snapshot'
+REBUILD_LOCK_KEY = 'catalog-snapshot-rebuild:overview'
+# Блокировка истекает сама, если процесс с заданием упал
+REBUILD_LOCK_TIMEOUT = 10 * 60
+
+
+def build_overview_payload():
+    brands = Brand.objects.all()
+    categories = list(Category.objects.all().order_by('id'))
+    products = Product.objects.filter(is_active=True).order_by('category_id', '-created_at').only('pk', 'category_id')
+
+    products_by_category = {category.id: [] for category in categories}
+    product_list = list(products)
+    # Документы не пересобираются при списании остатка заказом: берём текущий складской
+    documents = apply_variant_stock(get_product_documents(product_list), available=False)
+    for product, document in zip(product_list, documents):
+        products_by_category[product.category_id].append(document)
+
+    return {
+        'brands': BrandSerializer(brands, many=True, context={'request': None}).data,
+        'categories': CategorySerializer(categories, many=True, context={'request': None}).data,
+        'catalog': [
+            {
+                'id': category.id,
+                'name': category.name,
+                'slug': category.slug,
+                'products': products_by_category[category.id],
+            }
+            for category in categories
+        ],
+    }
+
+
+def rebuild_overview_snapshot():
+    snapshot, _ = CatalogSnapshot.objects.get_or_create(name=OVERVIEW_SNAPSHOT)
+    # Версия читается до сборки: изменения во время сборки снова сделают снимок устаревшим
+    version = get_version(OVERVIEW_SCOPE)
+
+    payload = json.loads(json.dumps(build_overview_payload(), cls=DjangoJSONEncoder))
+    etag = hashlib.sha1(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+
+    CatalogSnapshot.objects.filter(pk=snapshot.pk).update(
+        built_version=version,
+        etag=etag,
+        payload=payload,
+        built_at=timezone.now(),
+    )
+    return version
+
+
+def get_overview_snapshot():
+    """Снимок overview; payload читается текстом в raw_payload — для отдачи без перекодирования."""
+    return CatalogSnapshot.objects.filter(name=OVERVIEW_SNAPSHOT).defer('payload').annotate(
+        raw_payload=Cast('payload', output_field=TextField()),
+    ).first()
+
+
+def is_overview_stale(snapshot):
+    return snapshot is None or not snapshot.is_built or snapshot.built_version != get_version(OVERVIEW_SCOPE)
+
+
+def _overview_is_stale():
+    built_version = CatalogSnapshot.objects.filter(name=OVERVIEW_SNAPSHOT).values_list(
+        'built_version',
+        flat=True,
+    ).first()
+    return built_version is None or built_version != get_version(OVERVIEW_SCOPE)
+
+
+def mark_overview_stale():
+    """Помечает снимок устаревшим (версия в кэше) и ставит пересборку после коммита."""
+    invalidate_versions(OVERVIEW_SCOPE)
+    transaction.on_commit(schedule_overview_rebuild)
+
+
+def schedule_overview_rebuild():
+    """
+    Ставит отложенную пересборку снимка. Задание одно на все процессы:
+    если блокировку держит другое, оно само увидит новую версию.
+    """
+    if not settings.CATALOG_SNAPSHOT_ASYNC:
+        rebuild_overview_snapshot()
+        return
+
+    if cache.add(REBUILD_LOCK_KEY, True, REBUILD_LOCK_TIMEOUT):
+        threading.Thread(target=_rebuild_worker, name='overview-snapshot', daemon=True).start()
+
+
+def _rebuild_worker():
+    try:
+        while True:
+            time.sleep(settings.CATALOG_SNAPSHOT_DEBOUNCE)
+            try:
+                if _overview_is_stale():
+                    rebuild_overview_snapshot()
+            except Exception:
+                logger.exception('Не удалось пересобрать снимок overview')
+                cache.delete(REBUILD_LOCK_KEY)
+                return
+            if _overview_is_stale():
+                # Каталог менялся во время сборки — ещё один проход
+                continue
+
+            cache.delete(REBUILD_LOCK_KEY)
+            # Изменение между проверкой и снятием блокировки могло не получить её
+            if not _overview_is_stale() or not cache.add(REBUILD_LOCK_KEY, True, REBUILD_LOCK_TIMEOUT):
+                return
+    finally:
+        connections.close_all()
@@ -0,0 +1,39 @@
+"""
+Ключи сортировки товаров.
+
+Минимальная цена активных вариантов и число проданных единиц хранятся
+прямо в Product, чтобы списки сортировались и листались курсором по индексу,
+а не агрегатом по вариантам и заказам на каждый запрос.
+"""
+from django.db.models import Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import OrderItem, Product, ProductVariant
+
+
+def min_price_subquery():
+    return Subquery(
+        ProductVariant.objects.filter(
+            product=OuterRef('pk'),
+            is_active=True,
+        ).values('product').annotate(value=Min('price')).values('value')
+    )
+
+
+def popularity_subquery():
+    return Coalesce(
+        Subquery(
+            OrderItem.objects.filter(
+                variant__product=OuterRef('pk'),
+            ).values('variant__product').annotate(value=Sum('quantity')).values('value')
+        ),
+        0,
+    )
+
+
+def refresh_product_sort_keys(product_ids):
+    """Пересчитывает min_price и popularity одним UPDATE (сигналы не вызываются)."""
+    Product.objects.filter(pk__in=product_ids).update(
+        min_price=min_price_subquery(),
+        popularity=popularity_subquery(),
+    )
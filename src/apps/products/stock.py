@@ -0,0 +1,123 @@
+"""
+Доступный остаток вариантов: ProductVariant.stock минус живые резервы корзин
+(cart.StockReservation с expires_at в будущем).
+
+Документы товаров хранят складской остаток на момент сборки; в ответах он
+заменяется текущим доступным одним запросом на страницу (apply_available_stock).
+Поэтому ни резервы, ни списание остатка при оформлении заказа не требуют
+пересборки документов, а документы с неизменившимся остатком отдаются
+готовым JSON-текстом.
+"""
+from django.apps import apps
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+
+def get_reservation_model():
+    return apps.get_model('cart', 'StockReservation')
+
+
+def get_product_variant_model():
+    return apps.get_model('products', 'ProductVariant')
+
+
+def live_reservations(exclude_cart=None):
+    reservations = get_reservation_model().objects.filter(expires_at__gt=timezone.now())
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart=exclude_cart)
+    return reservations
+
+
+def reserved_stock_expression(exclude_cart=None, variant_ref='pk'):
+    """Сумма живых резервов варианта (OuterRef на variant_ref), 0 если их нет."""
+    reserved = live_reservations(exclude_cart).filter(
+        variant=OuterRef(variant_ref),
+    ).order_by().values('variant').annotate(value=Sum('quantity')).values('value')
+    return Coalesce(Subquery(reserved, output_field=IntegerField()), 0)
+
+
+def available_stock_expression():
+    return Greatest(F('stock') - reserved_stock_expression(), Value(0), output_field=IntegerField())
+
+
+def with_available_stock(variants):
+    """Добавляет вариантам аннотацию available_stock — её выводят сериализаторы."""
+    return variants.annotate(available_stock=available_stock_expression())
+
+
+def get_reserved_quantities(variant_ids, exclude_cart=None):
+    """Один запрос: {variant_id: зарезервировано} для вариантов с живыми резервами."""
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return {}
+    return dict(
+        live_reservations(exclude_cart).filter(variant_id__in=variant_ids).order_by().values(
+            'variant_id',
+        ).annotate(value=Sum('quantity')).values_list('variant_id', 'value')
+    )
+
+
+def get_variant_stock_by_product(product_ids, available=True):
+    """Один запрос: {product_id: {variant_id: остаток}}, доступный или складской."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    stock = available_stock_expression() if available else F('stock')
+    rows = get_product_variant_model().objects.filter(product_id__in=product_ids).order_by().annotate(
+        value=stock,
+    ).values_list('product_id', 'pk', 'value')
+    result = {}
+    for product_id, variant_id, value in rows:
+        result.setdefault(product_id, {})[variant_id] = value
+    return result
+
+
+def document_product_id(document):
+    # У готовых документов (renderers.RawJSON) id известен без декодирования
+    return getattr(document, 'pk', None) or document['id']
+
+
+def variant_stock_key(stock):
+    """Строка «id:остаток,...» из {variant_id: остаток} — для сравнения без декодирования документа."""
+    return ','.join(f'{variant_id}:{value}' for variant_id, value in sorted(stock.items()))
+
+
+def document_stock_key(document):
+    """Остатки, с которыми собран документ; у готовых документов — без декодирования."""
+    stock_key = getattr(document, 'stock_key', None)
+    if stock_key is not None:
+        return stock_key
+    return variant_stock_key({variant['id']: variant['stock'] for variant in document.get('variants', ())})
+
+
+def apply_variant_stock(documents, available=True):
+    """
+    Подставляет в stock вариантов документов текущий остаток (доступный
+    или складской). Документы не изменяет; готовые документы, остаток
+    которых совпадает с текущим, не декодируются.
+    """
+    documents = list(documents)
+    current = get_variant_stock_by_product(
+        (document_product_id(document) for document in documents),
+        available=available,
+    )
+
+    result = []
+    for document in documents:
+        product_stock = current.get(document_product_id(document), {})
+        if variant_stock_key(product_stock) != document_stock_key(document):
+            document = {
+                **document,
+                'variants': [
+                    {**variant, 'stock': product_stock[variant['id']]}
+                    if variant['id'] in product_stock else variant
+                    for variant in document.get('variants', ())
+                ],
+            }
+        result.append(document)
+    return result
+
+
+def apply_available_stock(documents):
+    return apply_variant_stock(documents, available=True)
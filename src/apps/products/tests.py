@@ -1,15 +1,48 @@
-from django.test import TestCase
-from django.core.exceptions import ValidationError
+import csv
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
-from .admin import ProductAdminForm, ProductImageAdminForm, ProductVariantAdminForm
-from .models import Attribute, Brand, Category, Product, ProductImage, ProductVariant
-
+from apps.cart.models import Cart, CartItem
 
+from .admin import ProductAdminForm, ProductImageAdminForm, ProductVariantAdminForm
+from .models import (
+    Attribute, Brand, CatalogSnapshot, Category, FeedEntry, FeedState, HeroBlock, Order, OrderItem, Product,
+    ProductDocument, ProductFacetValue, ProductImage, ProductVariant,
+)
+from .documents import invalidate_product_documents
+from .feeds import FEED_MAX_CHUNK_SIZE, iter_feed
+from .renderers import FastJSONRenderer, RawJSON
+from .schema import attribute_schema
+from .search import get_search_backend, search_product_ids
+from .search.backends import MemorySearchBackend
+from .serializers import ProductSerializer
+from .search.stemmers import stem
+from .snapshots import REBUILD_LOCK_KEY, is_overview_stale, rebuild_overview_snapshot, schedule_overview_rebuild
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='memory')
 class ProductSearchAPITests(APITestCase):
     def setUp(self):
+        get_search_backend().clear()
         self.category = Category.objects.create(
             name='Смартфоны',
             slug='smartphones',
@@ -126,6 +159,78 @@ class ProductSearchAPITests(APITestCase):
         self.assertEqual(response.data['results'][0]['slug'], self.matching_product.slug)
 
 
+    def test_search_uses_russian_stemming(self):
+        response = self.client.get('/api/v1/products/search/', {'q': 'флагманские смартфоны'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['slug'], self.matching_product.slug)
+
+    def test_search_matches_last_term_by_prefix(self):
+        response = self.client.get('/api/v1/products/search/', {'q': 'macb'})
+
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['slug'], self.second_matching_product.slug)
+
+    def test_search_ranks_title_matches_above_description_matches(self):
+        Product.objects.create(
+            name='Чехол',
+            slug='case',
+            category=self.category,
+            description='Подходит для Apple iPhone и MacBook',
+            is_active=True,
+        )
+
+        response = self.client.get('/api/v1/products/search/', {'q': 'macbook'})
+
+        self.assertEqual(
+            [item['slug'] for item in response.data['results']],
+            [self.second_matching_product.slug, 'case'],
+        )
+
+    def test_index_follows_variant_and_product_changes(self):
+        variant = self.matching_product.variants.get()
+        variant.sku = 'APL-NEW-SKU'
+        variant.save()
+
+        response = self.client.get('/api/v1/products/search/', {'q': 'APL-NEW-SKU'})
+        self.assertEqual(response.data['count'], 1)
+
+        self.matching_product.delete()
+
+        response = self.client.get('/api/v1/products/search/', {'q': 'APL-NEW-SKU'})
+        self.assertEqual(response.data['count'], 0)
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='sqlite')
+class SQLiteProductSearchAPITests(ProductSearchAPITests):
+    """Те же сценарии поиска на бэкенде SQLite FTS5."""
+
+
+class SearchStemmerTests(TestCase):
+    def test_russian_and_english_word_forms_share_stems(self):
+        self.assertEqual(stem('смартфоны'), stem('смартфонов'))
+        self.assertEqual(stem('беспроводные'), stem('беспроводной'))
+        self.assertEqual(stem('laptops'), stem('laptop'))
+        self.assertEqual(stem('charging'), stem('charged'))
+
+    def test_tokens_with_digits_are_not_stemmed(self):
+        self.assertEqual(stem('256gb'), '256gb')
+
+
+class SearchBackendSettingsTests(TestCase):
+    @override_settings(PRODUCT_SEARCH_BACKEND='auto', DEBUG=False)
+    def test_auto_does_not_fall_back_to_memory_in_production(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            with self.assertRaises(ImproperlyConfigured):
+                get_search_backend()
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='auto', DEBUG=True)
+    def test_auto_falls_back_to_memory_in_development(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.assertIsInstance(get_search_backend(), MemorySearchBackend)
+
+
 class BrandDetailAPITests(APITestCase):
     def setUp(self):
         self.category = Category.objects.create(
@@ -169,6 +274,62 @@ class BrandDetailAPITests(APITestCase):
         self.assertEqual(len(response.data['products']), 1)
         self.assertEqual(response.data['products'][0]['slug'], self.active_product.slug)
 
+    def test_brand_detail_returns_aggregates_and_light_cards(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/v1/brands/{self.brand.slug}/')
+
+        self.assertEqual(response.data['product_count'], 1)
+        self.assertEqual(response.data['min_price'], '999.00')
+        self.assertEqual(response.data['categories'], [{'id': self.category.pk, 'name': 'Смартфоны', 'slug': 'smartphones'}])
+        card = response.data['products'][0]
+        self.assertEqual(set(card), {'id', 'name', 'slug', 'min_price', 'is_preorder', 'image'})
+        self.assertEqual(card['min_price'], '999.00')
+        self.assertIsNone(response.data['products_next'])
+
+    def test_brand_detail_pages_products_with_cursor(self):
+        for index in range(3):
+            Product.objects.create(name=f'iPad {index}', slug=f'ipad-{index}', brand=self.brand, category=self.category)
+
+        response = self.client.get(f'/api/v1/brands/{self.brand.slug}/', {'page_size': 2})
+        slugs = [card['slug'] for card in response.data['products']]
+        response = self.client.get(response.data['products_next'])
+        slugs += [card['slug'] for card in response.data['products']]
+
+        self.assertEqual(response.data['product_count'], 4)
+        self.assertIsNone(response.data['products_next'])
+        self.assertEqual(slugs, ['ipad-2', 'ipad-1', 'ipad-0', 'iphone-15-pro'])
+
+    def test_aggregates_follow_product_and_variant_changes(self):
+        other_brand = Brand.objects.create(name='Samsung', slug='samsung')
+        ProductVariant.objects.create(product=self.active_product, sku='APL-IP15PRO-128', price='899.00')
+        self.brand.refresh_from_db()
+        self.assertEqual(str(self.brand.min_price), '899.00')
+
+        self.active_product.brand = other_brand
+        self.active_product.save()
+
+        self.brand.refresh_from_db()
+        other_brand.refresh_from_db()
+        self.assertEqual((self.brand.product_count, self.brand.min_price, self.brand.category_ids), (0, None, []))
+        self.assertEqual(other_brand.product_count, 1)
+        self.assertEqual(other_brand.category_ids, [self.category.pk])
+
+    def test_rolled_back_product_delete_keeps_variant_refreshes(self):
+        def fail(sender, **kwargs):
+            raise DatabaseError('delete failed')
+
+        post_delete.connect(fail, sender=ProductVariant)
+        try:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                self.active_product.delete()
+        finally:
+            post_delete.disconnect(fail, sender=ProductVariant)
+
+        ProductVariant.objects.create(product=self.active_product, sku='APL-IP15PRO-128', price='899.00')
+
+        self.brand.refresh_from_db()
+        self.assertEqual(str(self.brand.min_price), '899.00')
+
 
 class ProductAdminFormTests(TestCase):
     def setUp(self):
@@ -446,11 +607,16 @@ class ProductCharacteristicsAPITests(APITestCase):
         response = self.client.get(f'/api/v1/products/{self.product.slug}/')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        media = response.data['variants'][0]['media']
+        images = {item['id']: item for item in response.data['images']}
+        media = [images[media_id] for media_id in response.data['variants'][0]['media_ids']]
         self.assertEqual(len(media), 2)
         self.assertEqual(media[0]['alt_text'], 'common')
         self.assertEqual(media[1]['alt_text'], 'black')
         self.assertEqual(media[1]['media_type'], 'video')
+        self.assertNotIn('media', response.data['variants'][0])
+
+        response = self.client.get('/api/v1/variants/APL-IP15PRO-256/')
+        self.assertEqual([item['alt_text'] for item in response.data['media']], ['common', 'black'])
 
     def test_variant_without_color_receives_only_common_media(self):
         ProductImage.objects.create(
@@ -478,8 +644,32 @@ class ProductCharacteristicsAPITests(APITestCase):
         response = self.client.get(f'/api/v1/products/{self.product.slug}/')
 
         variant = next(item for item in response.data['variants'] if item['sku'] == 'APL-IP15PRO-128')
-        self.assertEqual(len(variant['media']), 1)
-        self.assertEqual(variant['media'][0]['alt_text'], 'common')
+        common = next(item for item in response.data['images'] if item['alt_text'] == 'common')
+        self.assertEqual(variant['media_ids'], [common['id']])
+
+    def test_product_detail_media_queries_do_not_grow_with_variants(self):
+        for color in ('Black', 'White'):
+            ProductImage.objects.create(
+                product=self.product,
+                image=SimpleUploadedFile(f'{color}.jpg', b'fake-image-content', content_type='image/jpeg'),
+                color_value=color,
+            )
+        url = f'/api/v1/products/{self.product.slug}/'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as one_variant:
+            self.client.get(url)
+
+        for index in range(5):
+            ProductVariant.objects.create(
+                product=self.product,
+                sku=f'APL-IP15PRO-{index}',
+                attributes={'color': 'White' if index % 2 else 'Black'},
+            )
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as many_variants:
+            self.client.get(url)
+
+        self.assertEqual(len(many_variants), len(one_variant))
 
 
 class ProductMediaTests(TestCase):
@@ -525,3 +715,1116 @@ class ProductMediaTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['images'][0]['media_type'], 'video')
         self.assertTrue(response.data['images'][0]['image'].endswith('.mp4'))
+
+
+class ProductDocumentTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Смартфоны',
+            slug='smartphones',
+        )
+        self.brand = Brand.objects.create(
+            name='Apple',
+            slug='apple',
+        )
+        self.product = Product.objects.create(
+            name='iPhone 15 Pro',
+            slug='iphone-15-pro',
+            brand=self.brand,
+            category=self.category,
+            is_active=True,
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product,
+            sku='APL-IP15PRO-256',
+            price='999.00',
+            stock=5,
+            is_active=True,
+        )
+
+    def test_list_builds_and_stores_missing_documents(self):
+        self.assertFalse(ProductDocument.objects.filter(product=self.product).exists())
+
+        response = self.client.get('/api/v1/products/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['slug'], self.product.slug)
+        self.assertEqual(response.data['results'][0]['variants'][0]['sku'], 'APL-IP15PRO-256')
+        document = ProductDocument.objects.get(product=self.product)
+        self.assertEqual(document.data['brand']['slug'], 'apple')
+
+    def test_list_serves_stored_documents_without_serializing(self):
+        self.client.get('/api/v1/products/')
+
+        # count, страница, документы и живые резервы для доступного остатка
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/v1/products/')
+
+        self.assertEqual(response.data['count'], 1)
+
+    @override_settings(MEDIA_SITE_URL='https://cdn.example.com')
+    def test_list_and_detail_media_urls_match(self):
+        ProductImage.objects.create(
+            product=self.product,
+            image=SimpleUploadedFile('front.jpg', b'fake-image-content', content_type='image/jpeg'),
+        )
+
+        listed = json.loads(self.client.get('/api/v1/products/').content)['results'][0]
+        detail = self.client.get(f'/api/v1/products/{self.product.slug}/').data
+
+        self.assertTrue(listed['images'][0]['image'].startswith('https://cdn.example.com/media/'))
+        self.assertEqual(listed['images'][0]['image'], detail['images'][0]['image'])
+
+    def test_related_changes_invalidate_documents(self):
+        self.client.get('/api/v1/products/')
+
+        self.variant.price = '899.00'
+        self.variant.save()
+        self.assertFalse(ProductDocument.objects.filter(product=self.product).exists())
+
+        response = self.client.get(f'/api/v1/categories/{self.category.slug}/products/')
+        self.assertEqual(response.data['results'][0]['variants'][0]['price'], '899.00')
+
+        self.brand.name = 'Apple Inc.'
+        self.brand.save()
+
+        response = self.client.get(f'/api/v1/brands/{self.brand.slug}/products/')
+        self.assertEqual(response.data['results'][0]['brand']['name'], 'Apple Inc.')
+
+    def test_rebuild_command_creates_documents_for_all_products(self):
+        call_command('rebuild_product_documents', stdout=StringIO())
+
+        self.assertTrue(ProductDocument.objects.filter(product=self.product).exists())
+
+
+class ProductDocumentTransactionTests(TransactionTestCase):
+    def test_pending_rebuild_belongs_to_its_transaction(self):
+        with mock.patch('apps.products.documents.refresh_product_documents') as refresh:
+            try:
+                with transaction.atomic():
+                    invalidate_product_documents([100])
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            with transaction.atomic():
+                invalidate_product_documents([1])
+                invalidate_product_documents([2])
+
+        # id откаченной транзакции не попадают в пересборку, одна транзакция — одна пересборка
+        refresh.assert_called_once_with({1, 2})
+
+
+@override_settings(CATALOG_SNAPSHOT_ASYNC=False)
+class OverviewSnapshotTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Смартфоны',
+            slug='smartphones',
+        )
+        self.brand = Brand.objects.create(
+            name='Apple',
+            slug='apple',
+        )
+        self.product = Product.objects.create(
+            name='iPhone 15 Pro',
+            slug='iphone-15-pro',
+            brand=self.brand,
+            category=self.category,
+            is_active=True,
+        )
+
+    def test_overview_is_served_from_snapshot_in_one_query(self):
+        rebuild_overview_snapshot()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/overview/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['catalog'][0]['products'][0]['slug'], self.product.slug)
+        self.assertEqual(response.data['brands'][0]['slug'], self.brand.slug)
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_overview_answers_not_modified_for_matching_etag(self):
+        rebuild_overview_snapshot()
+        etag = self.client.get('/api/v1/overview/')['ETag']
+
+        response = self.client.get('/api/v1/overview/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_overview_without_snapshot_builds_it_in_request(self):
+        response = self.client.get('/api/v1/overview/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['catalog'][0]['products'][0]['slug'], self.product.slug)
+        self.assertTrue(CatalogSnapshot.objects.get(name='overview').is_built)
+
+    def test_catalog_change_marks_snapshot_stale_and_rebuilds_after_commit(self):
+        rebuild_overview_snapshot()
+        old_etag = CatalogSnapshot.objects.get(name='overview').etag
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'iPhone 15 Pro Max'
+            self.product.save()
+            self.assertTrue(is_overview_stale(CatalogSnapshot.objects.get(name='overview')))
+
+        snapshot = CatalogSnapshot.objects.get(name='overview')
+        self.assertFalse(is_overview_stale(snapshot))
+        self.assertNotEqual(snapshot.etag, old_etag)
+        self.assertEqual(snapshot.payload['catalog'][0]['products'][0]['name'], 'iPhone 15 Pro Max')
+
+    @override_settings(CATALOG_SNAPSHOT_ASYNC=True)
+    def test_rebuild_runs_as_one_job_across_processes(self):
+        with mock.patch('apps.products.snapshots.threading.Thread') as thread:
+            schedule_overview_rebuild()
+            schedule_overview_rebuild()
+
+        # Второй вызов застаёт блокировку задания и поток не запускает
+        self.assertEqual(thread.call_count, 1)
+        cache.delete(REBUILD_LOCK_KEY)
+
+
+class AttributeSchemaRegistryTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Смартфоны',
+            slug='smartphones',
+        )
+        self.storage = Attribute.objects.create(
+            name='Память',
+            slug='storage',
+            applies_to='variant',
+            type='enum',
+            values=['128GB', '256GB'],
+            sort_order=2,
+        )
+        self.color = Attribute.objects.create(
+            name='Цвет',
+            slug='color',
+            applies_to='variant',
+            type='enum',
+            values=['Black'],
+            sort_order=1,
+        )
+        self.screen_size = Attribute.objects.create(
+            name='Диагональ экрана',
+            slug='screen-size',
+            applies_to='product',
+            type='number',
+        )
+        self.category.attributes.add(self.storage, self.color, self.screen_size)
+
+    def test_schema_lookups_are_split_sorted_and_cost_no_queries(self):
+        attribute_schema.get_attributes(self.category, 'product')
+
+        with self.assertNumQueries(0):
+            variant_attributes = attribute_schema.get_attributes(self.category, 'variant')
+            product_attributes = attribute_schema.get_attributes(self.category, 'product')
+
+        self.assertEqual([attribute.slug for attribute in variant_attributes], ['color', 'storage'])
+        self.assertEqual([attribute.slug for attribute in product_attributes], ['screen-size'])
+
+    def test_schema_is_invalidated_by_attribute_and_relation_changes(self):
+        attribute_schema.get_attributes(self.category, 'variant')
+
+        self.category.attributes.remove(self.color)
+        self.assertEqual(
+            [attribute.slug for attribute in attribute_schema.get_attributes(self.category, 'variant')],
+            ['storage'],
+        )
+
+        self.storage.unit = 'ГБ'
+        self.storage.save()
+        self.assertEqual(attribute_schema.get_attributes(self.category, 'variant')[0].unit, 'ГБ')
+
+    def test_product_detail_does_not_query_attribute_schema_per_variant(self):
+        product = Product.objects.create(
+            name='iPhone 15 Pro',
+            slug='iphone-15-pro',
+            category=self.category,
+            specifications={'screen-size': '6.1'},
+        )
+        for index in range(5):
+            ProductVariant.objects.create(
+                product=product,
+                sku=f'APL-IP15PRO-{index}',
+                attributes={'storage': '256GB', 'color': 'Black'},
+            )
+        attribute_schema.get_attributes(self.category, 'variant')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/v1/products/{product.slug}/')
+
+        schema_queries = [query for query in queries if 'products_category_attributes' in query['sql']]
+        self.assertEqual(schema_queries, [])
+        self.assertEqual(response.data['variants'][0]['attribute_values'][0]['slug'], 'storage')
+
+
+class CategoryFacetsAPITests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.other_category = Category.objects.create(name='Ноутбуки', slug='laptops')
+        self.color = Attribute.objects.create(
+            name='Цвет',
+            slug='color',
+            applies_to='variant',
+            type='enum',
+            values=['White', 'Black', 'Blue'],
+            sort_order=1,
+        )
+        self.storage = Attribute.objects.create(
+            name='Память',
+            slug='storage',
+            applies_to='variant',
+            type='enum',
+            sort_order=2,
+        )
+        self.screen_size = Attribute.objects.create(
+            name='Диагональ экрана',
+            slug='screen-size',
+            applies_to='product',
+            type='number',
+            sort_order=3,
+        )
+        self.category.attributes.add(self.color, self.storage, self.screen_size)
+
+        self.first = self.create_product('first', '6.1', [('Black', '128GB'), ('White', '256GB')])
+        self.second = self.create_product('second', '6.7', [('Black', '256GB')])
+        self.third = self.create_product('third', '6.1', [('Blue', '128GB')])
+        self.create_product('inactive', '6.1', [('Black', '128GB')], is_active=False)
+        self.create_product('laptop', '13.6', [('Black', '512GB')], category=self.other_category)
+
+    def create_product(self, slug, screen_size, variants, category=None, is_active=True):
+        product = Product.objects.create(
+            name=slug,
+            slug=slug,
+            category=category or self.category,
+            specifications={'screen-size': screen_size},
+            is_active=is_active,
+        )
+        for index, (color, storage) in enumerate(variants):
+            ProductVariant.objects.create(
+                product=product,
+                sku=f'{slug}-{index}',
+                attributes={'color': color, 'storage': storage},
+            )
+        return product
+
+    def get_facets(self, **params):
+        response = self.client.get(f'/api/v1/categories/{self.category.slug}/facets/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        facets = {
+            facet['slug']: [(item['value'], item['count'], item['selected']) for item in facet['values']]
+            for facet in response.data['facets']
+        }
+        return response.data['count'], facets
+
+    def test_facets_count_active_products_of_category(self):
+        count, facets = self.get_facets()
+
+        self.assertEqual(count, 3)
+        self.assertEqual(list(facets), ['color', 'storage', 'screen-size'])
+        self.assertEqual(facets['color'], [('White', 1, False), ('Black', 2, False), ('Blue', 1, False)])
+        self.assertEqual(facets['storage'], [('128GB', 2, False), ('256GB', 2, False)])
+        self.assertEqual(facets['screen-size'], [('6.1', 2, False), ('6.7', 1, False)])
+
+    def test_selected_facet_keeps_counts_of_its_other_values(self):
+        count, facets = self.get_facets(**{'attr__color': 'black'})
+
+        self.assertEqual(count, 2)
+        self.assertEqual(facets['color'], [('White', 1, False), ('Black', 2, True), ('Blue', 1, False)])
+        self.assertEqual(facets['storage'], [('128GB', 1, False), ('256GB', 2, False)])
+        self.assertEqual(facets['screen-size'], [('6.1', 1, False), ('6.7', 1, False)])
+
+        params = {'attr__color': 'black', 'spec__screen-size': '6.7'}
+        response = self.client.get('/api/v1/products/', params)
+        self.assertEqual(response.data['count'], self.get_facets(**params)[0])
+
+    def test_selected_value_without_products_is_returned_with_zero_count(self):
+        count, facets = self.get_facets(**{'attr__color': 'Blue', 'spec__screen-size': '6.7'})
+
+        self.assertEqual(count, 0)
+        self.assertIn(('Blue', 0, True), facets['color'])
+        self.assertEqual(facets['screen-size'], [('6.1', 1, False), ('6.7', 0, True)])
+
+    def test_query_count_does_not_depend_on_catalog_size(self):
+        params = {'attr__color': 'Black', 'spec__screen-size': '6.1'}
+        url = f'/api/v1/categories/{self.category.slug}/facets/'
+        self.client.get(url, params)
+
+        with CaptureQueriesContext(connection) as small_catalog:
+            self.client.get(url, params)
+
+        for index in range(10):
+            self.create_product(f'extra-{index}', '6.1', [('Black', '128GB'), ('Blue', '512GB')])
+
+        with CaptureQueriesContext(connection) as large_catalog:
+            self.client.get(url, params)
+
+        self.assertEqual(len(large_catalog), len(small_catalog))
+
+    def test_facet_rows_follow_product_and_variant_changes(self):
+        variant = self.third.variants.get()
+        variant.attributes = {'color': 'Black', 'storage': '128GB'}
+        variant.save()
+
+        _, facets = self.get_facets()
+        self.assertEqual(facets['color'], [('White', 1, False), ('Black', 3, False)])
+
+        self.second.is_active = False
+        self.second.save()
+
+        self.assertFalse(ProductFacetValue.objects.filter(product=self.second).exists())
+        count, facets = self.get_facets()
+        self.assertEqual(count, 2)
+        self.assertEqual(facets['screen-size'], [('6.1', 2, False)])
+
+        self.first.delete()
+        self.assertFalse(ProductFacetValue.objects.filter(product_id__isnull=True).exists())
+        self.assertEqual(self.get_facets()[0], 1)
+
+    def test_rebuild_command_restores_facet_rows(self):
+        ProductFacetValue.objects.all().delete()
+
+        call_command('rebuild_product_facets', stdout=StringIO())
+
+        self.assertEqual(self.get_facets()[1]['storage'], [('128GB', 2, False), ('256GB', 2, False)])
+
+    def test_values_longer_than_facet_column_are_filtered_by_json(self):
+        long_value = 'Compatible with ' + ', '.join(f'model {index}' for index in range(40))
+        self.first.specifications = {'screen-size': '6.1', 'compatibility': long_value}
+        self.first.save()
+        variant = self.third.variants.get()
+        variant.attributes = {'color': 'Blue', 'storage': '128GB', 'bundle': long_value}
+        variant.save()
+
+        self.assertFalse(ProductFacetValue.objects.filter(attribute_slug__in=['compatibility', 'bundle']).exists())
+        response = self.client.get('/api/v1/products/', {'spec__compatibility': long_value.lower()})
+        self.assertEqual([item['slug'] for item in response.data['results']], ['first'])
+        response = self.client.get('/api/v1/products/', {'attr__bundle': long_value})
+        self.assertEqual([item['slug'] for item in response.data['results']], ['third'])
+
+
+class ProductCursorPaginationTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.brand = Brand.objects.create(name='Apple', slug='apple')
+        self.products = [self.create_product(index) for index in range(7)]
+
+    def create_product(self, index, price=None):
+        product = Product.objects.create(
+            name=f'Товар {index}',
+            slug=f'product-{index}',
+            brand=self.brand,
+            category=self.category,
+        )
+        if price is not None:
+            ProductVariant.objects.create(product=product, sku=f'SKU-{index}', price=price)
+        return product
+
+    def collect(self, url, params):
+        slugs = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            slugs.extend(item['slug'] for item in response.data['results'])
+            if response.data['next'] is None:
+                return slugs, response
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_walks_newest_first_without_gaps(self):
+        slugs, _ = self.collect('/api/v1/products/', {'pagination': 'cursor', 'page_size': 3})
+
+        self.assertEqual(slugs, [product.slug for product in reversed(self.products)])
+
+    def test_products_added_while_scrolling_do_not_shift_pages(self):
+        first_page = self.client.get('/api/v1/products/', {'pagination': 'cursor', 'page_size': 3})
+        self.create_product('new')
+
+        second_page = self.client.get(first_page.data['next'])
+
+        self.assertEqual(
+            [item['slug'] for item in second_page.data['results']],
+            ['product-3', 'product-2', 'product-1'],
+        )
+
+    def test_price_ordering_puts_products_without_price_last(self):
+        for index, price in enumerate(['300.00', '100.00', '200.00', '100.00']):
+            variant = ProductVariant.objects.create(product=self.products[index], sku=f'SKU-{index}', price=price)
+        ProductVariant.objects.create(product=self.products[0], sku='SKU-cheap-inactive', price='1.00', is_active=False)
+        variant.price = '50.00'
+        variant.save()
+
+        slugs, last_page = self.collect(
+            '/api/v1/products/',
+            {'pagination': 'cursor', 'ordering': 'price', 'page_size': 2},
+        )
+
+        self.assertEqual(slugs[:4], ['product-3', 'product-1', 'product-2', 'product-0'])
+        self.assertEqual(sorted(slugs[4:]), ['product-4', 'product-5', 'product-6'])
+
+        previous_page = self.client.get(last_page.data['previous'])
+        self.assertEqual([item['slug'] for item in previous_page.data['results']], slugs[-3:-1])
+
+    def test_popularity_follows_order_items(self):
+        variant = ProductVariant.objects.create(product=self.products[2], sku='SKU-2', price='10.00')
+        order = Order.objects.create(contact_phone='+70000000000', contact_name='Иван')
+        OrderItem.objects.create(order=order, variant=variant, quantity=3, price_at_time='10.00')
+
+        self.products[2].refresh_from_db()
+        self.assertEqual(self.products[2].popularity, 3)
+
+        response = self.client.get('/api/v1/products/', {'ordering': '-popularity'})
+        self.assertEqual(response.data['results'][0]['slug'], 'product-2')
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        for index in range(7, 30):
+            self.create_product(index)
+        params = {'pagination': 'cursor', 'page_size': 5}
+        self.collect('/api/v1/products/', params)
+
+        with CaptureQueriesContext(connection) as first_page:
+            response = self.client.get('/api/v1/products/', params)
+        for _ in range(4):
+            response = self.client.get(response.data['next'])
+        with CaptureQueriesContext(connection) as deep_page:
+            self.client.get(response.data['next'])
+
+        self.assertEqual(len(deep_page), len(first_page))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in deep_page))
+
+    def test_category_and_brand_products_are_paginated(self):
+        response = self.client.get(f'/api/v1/categories/{self.category.slug}/products/', {'page_size': 5})
+
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['slug'] for item in response.data['results']], ['product-1', 'product-0'])
+        self.assertIsNotNone(response.data['previous'])
+
+        response = self.client.get(f'/api/v1/brands/{self.brand.slug}/products/')
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get('/api/v1/products/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.product = Product.objects.create(
+            name='iPhone 15 Pro',
+            slug='iphone-15-pro',
+            category=self.category,
+        )
+        self.variant = ProductVariant.objects.create(product=self.product, sku='APL-IP15PRO', price='999.00')
+
+    def test_unchanged_resource_returns_304_without_queries(self):
+        response = self.client.get('/api/v1/categories/')
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/categories/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_if_modified_since_is_honoured(self):
+        response = self.client.get(f'/api/v1/products/{self.product.slug}/')
+
+        response = self.client.get(
+            f'/api/v1/products/{self.product.slug}/',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_related_change_produces_new_etag(self):
+        url = f'/api/v1/products/{self.product.slug}/'
+        etag = self.client.get(url)['ETag']
+
+        self.variant.price = '899.00'
+        self.variant.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['variants'][0]['price'], '899.00')
+
+    def test_etag_depends_on_query_string(self):
+        etag = self.client.get('/api/v1/products/')['ETag']
+
+        response = self.client.get('/api/v1/products/', {'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_category_change_invalidates_category_and_product_endpoints(self):
+        category_etag = self.client.get('/api/v1/categories/header-menu/')['ETag']
+        product_etag = self.client.get('/api/v1/products/')['ETag']
+
+        self.category.is_header_menu = True
+        self.category.save()
+
+        response = self.client.get('/api/v1/categories/header-menu/', HTTP_IF_NONE_MATCH=category_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        response = self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=product_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class HeroFeedTests(APITestCase):
+    url = '/api/v1/hero-blocks/'
+
+    def setUp(self):
+        category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.product = Product.objects.create(name='iPhone 15 Pro', slug='iphone-15-pro', category=category)
+        self.variant = ProductVariant.objects.create(product=self.product, sku='APL-IP15PRO', price='999.00')
+        ProductVariant.objects.create(product=self.product, sku='APL-IP15PRO-1TB', price='1299.00')
+        self.block = HeroBlock.objects.create(title='iPhone 15 Pro', status='published', product=self.product)
+
+    def test_feed_embeds_product_and_min_price(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        block = response.data['results'][0]
+        self.assertEqual(block['product_slug'], 'iphone-15-pro')
+        self.assertEqual(block['product_name'], 'iPhone 15 Pro')
+        self.assertEqual(block['product_price'], '999.00')
+
+    def test_cached_feed_costs_no_queries(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data['count'], 1)
+
+    def test_variant_change_rebuilds_feed(self):
+        self.client.get(self.url)
+
+        self.variant.price = '899.00'
+        self.variant.save()
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data['results'][0]['product_price'], '899.00')
+
+    def test_block_outside_window_is_hidden(self):
+        now = timezone.now()
+        HeroBlock.objects.create(title='Скоро', status='published', publish_at=now + timedelta(hours=1))
+        HeroBlock.objects.create(title='Прошло', status='published', unpublish_at=now - timedelta(hours=1))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual([block['title'] for block in response.data['results']], ['iPhone 15 Pro'])
+
+    def test_window_boundary_refreshes_feed_and_etag(self):
+        now = timezone.now()
+        HeroBlock.objects.create(title='Скоро', status='published', order=1, publish_at=now + timedelta(hours=1))
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(response.data['count'], 1)
+
+        with mock.patch('apps.products.hero.timezone.now', return_value=now + timedelta(hours=2)):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([block['title'] for block in response.data['results']], ['iPhone 15 Pro', 'Скоро'])
+
+    def test_window_must_end_after_start(self):
+        now = timezone.now()
+        block = HeroBlock(title='Окно', publish_at=now, unpublish_at=now - timedelta(hours=1))
+
+        with self.assertRaises(ValidationError):
+            block.full_clean()
+
+
+class CategoryTreeTests(APITestCase):
+    url = '/api/v1/categories/tree/'
+
+    def setUp(self):
+        self.electronics = Category.objects.create(name='Электроника', slug='electronics')
+        self.phones = Category.objects.create(name='Смартфоны', slug='smartphones', parent=self.electronics)
+        self.apple = Category.objects.create(name='Apple', slug='apple', parent=self.phones)
+        self.audio = Category.objects.create(name='Аудио', slug='audio')
+
+    def test_path_and_depth_are_maintained_on_save(self):
+        self.apple.refresh_from_db()
+
+        self.assertEqual(self.apple.path, f'{self.electronics.pk}/{self.phones.pk}/{self.apple.pk}/')
+        self.assertEqual(self.apple.depth, 2)
+        self.assertEqual(set(self.electronics.get_descendants()), {self.electronics, self.phones, self.apple})
+
+    def test_move_rewrites_subtree(self):
+        self.phones.parent = self.audio
+        self.phones.save()
+
+        self.apple.refresh_from_db()
+        self.assertEqual(self.apple.path, f'{self.audio.pk}/{self.phones.pk}/{self.apple.pk}/')
+        self.assertEqual(self.apple.depth, 2)
+        self.assertEqual(set(self.electronics.get_descendants()), {self.electronics})
+
+    def test_move_into_own_subtree_is_rejected(self):
+        self.electronics.parent = self.apple
+
+        with self.assertRaises(ValidationError):
+            self.electronics.full_clean()
+        with self.assertRaises(ValidationError):
+            self.electronics.save()
+
+        self.apple.refresh_from_db()
+        self.assertEqual(self.apple.depth, 2)
+
+    def test_tree_is_nested_and_cached(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([node['slug'] for node in response.data], ['audio', 'electronics'])
+        phones = response.data[1]['children'][0]
+        self.assertEqual(phones['slug'], 'smartphones')
+        self.assertEqual(phones['depth'], 1)
+        self.assertEqual([node['slug'] for node in phones['children']], ['apple'])
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_category_change_rebuilds_tree(self):
+        self.client.get(self.url)
+
+        Category.objects.create(name='Samsung', slug='samsung', parent=self.phones)
+        response = self.client.get(self.url)
+
+        phones = response.data[1]['children'][0]
+        self.assertEqual([node['slug'] for node in phones['children']], ['apple', 'samsung'])
+
+
+class CategoryDescendantProductsTests(APITestCase):
+    def setUp(self):
+        self.phones = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.apple = Category.objects.create(name='Apple', slug='apple', parent=self.phones)
+        self.laptops = Category.objects.create(name='Ноутбуки', slug='laptops')
+        self.screen_size = Attribute.objects.create(
+            name='Диагональ экрана',
+            slug='screen-size',
+            applies_to='product',
+            type='number',
+        )
+        self.apple.attributes.add(self.screen_size)
+
+        self.create_product('iphone-15', self.apple, '6.1')
+        self.create_product('iphone-15-plus', self.apple, '6.7')
+        self.create_product('basic-phone', self.phones)
+        self.create_product('macbook', self.laptops)
+
+    def create_product(self, slug, category, screen_size=None):
+        return Product.objects.create(
+            name=slug,
+            slug=slug,
+            category=category,
+            specifications={'screen-size': screen_size} if screen_size else {},
+        )
+
+    def slugs(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {item['slug'] for item in response.data['results']}
+
+    def test_category_products_include_descendants(self):
+        url = '/api/v1/categories/smartphones/products/'
+
+        self.assertEqual(self.slugs(self.client.get(url)), {'basic-phone'})
+        self.assertEqual(
+            self.slugs(self.client.get(url, {'include_descendants': '1'})),
+            {'basic-phone', 'iphone-15', 'iphone-15-plus'},
+        )
+
+    def test_descendants_combine_with_facet_filters(self):
+        response = self.client.get(
+            '/api/v1/categories/smartphones/products/',
+            {'include_descendants': '1', 'spec__screen-size': '6.7'},
+        )
+
+        self.assertEqual(self.slugs(response), {'iphone-15-plus'})
+
+    def test_product_list_filters_by_category_subtree(self):
+        self.assertEqual(self.slugs(self.client.get('/api/v1/products/', {'category': 'smartphones'})), {'basic-phone'})
+        self.assertEqual(
+            self.slugs(self.client.get('/api/v1/products/', {'category': 'smartphones', 'include_descendants': '1'})),
+            {'basic-phone', 'iphone-15', 'iphone-15-plus'},
+        )
+        self.assertEqual(self.slugs(self.client.get('/api/v1/products/', {'category': 'missing'})), set())
+
+    def test_moved_subcategory_leaves_the_subtree(self):
+        self.apple.parent = self.laptops
+        self.apple.save()
+
+        response = self.client.get('/api/v1/products/', {'category': 'laptops', 'include_descendants': '1'})
+
+        self.assertEqual(self.slugs(response), {'macbook', 'iphone-15', 'iphone-15-plus'})
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.brand = Brand.objects.create(name='Apple', slug='apple')
+        self.product = Product.objects.create(
+            name='iPhone 15 Pro',
+            slug='iphone-15-pro',
+            brand=self.brand,
+            category=self.category,
+            description='Описание',
+        )
+        self.variant = ProductVariant.objects.create(product=self.product, sku='APL-IP15PRO', price='999.00')
+
+    def test_product_detail_returns_only_requested_fields(self):
+        url = f'/api/v1/products/{self.product.slug}/'
+
+        with mock.patch.object(ProductSerializer, 'get_specifications') as get_specifications:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {'fields': 'id,name,slug'})
+
+        get_specifications.assert_not_called()
+        self.assertEqual(response.data, {'id': self.product.pk, 'name': 'iPhone 15 Pro', 'slug': 'iphone-15-pro'})
+
+    def test_expand_collapses_other_relations_to_ids(self):
+        response = self.client.get(
+            f'/api/v1/products/{self.product.slug}/',
+            {'fields': 'id,brand.name,category,variants', 'expand': 'brand'},
+        )
+
+        self.assertEqual(response.data['brand'], {'name': 'Apple'})
+        self.assertEqual(response.data['category'], self.category.pk)
+        self.assertEqual(response.data['variants'], [self.variant.pk])
+
+    def test_nested_fields_shape_variants(self):
+        response = self.client.get(f'/api/v1/products/{self.product.slug}/', {'fields': 'slug,variants.sku,variants.price'})
+
+        self.assertEqual(response.data, {'slug': 'iphone-15-pro', 'variants': [{'sku': 'APL-IP15PRO', 'price': '999.00'}]})
+
+    def test_product_documents_are_projected(self):
+        response = self.client.get('/api/v1/products/', {'fields': 'slug,brand', 'expand': ''})
+
+        self.assertEqual(response.data['results'], [{'slug': 'iphone-15-pro', 'brand': self.brand.pk}])
+
+        response = self.client.get(f'/api/v1/categories/{self.category.slug}/products/', {'fields': 'slug,variants.sku'})
+        self.assertEqual(response.data['results'], [{'slug': 'iphone-15-pro', 'variants': [{'sku': 'APL-IP15PRO'}]}])
+
+    def test_variant_brand_and_category_fields(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/variants/{self.variant.sku}/', {'fields': 'sku,price'})
+        self.assertEqual(response.data, {'sku': 'APL-IP15PRO', 'price': '999.00'})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/brands/{self.brand.slug}/', {'fields': 'name,product_count'})
+        self.assertEqual(response.data, {'name': 'Apple', 'product_count': 1})
+
+        response = self.client.get('/api/v1/categories/', {'fields': 'slug'})
+        self.assertEqual(response.data['results'], [{'slug': 'smartphones'}])
+
+    def test_without_parameters_output_is_unchanged(self):
+        response = self.client.get(f'/api/v1/products/{self.product.slug}/')
+
+        self.assertEqual(response.data['brand']['slug'], 'apple')
+        self.assertEqual(response.data['variants'][0]['sku'], 'APL-IP15PRO')
+        self.assertIn('specifications_map', response.data)
+
+
+class FastJSONRendererTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.product = Product.objects.create(name='iPhone 15 Pro', slug='iphone-15-pro', category=self.category)
+        ProductVariant.objects.create(product=self.product, sku='APL-IP15PRO', price='999.00', stock=3)
+
+    def test_matches_default_renderer_and_embeds_raw_json(self):
+        data = {
+            'price': Decimal('999.50'),
+            'created_at': timezone.now(),
+            'documents': [RawJSON('{"id": 1, "name": "Документ"}')],
+        }
+
+        content = FastJSONRenderer().render(data)
+
+        self.assertIn('{"id": 1, "name": "Документ"}'.encode(), content)
+        self.assertEqual(json.loads(content), json.loads(JSONRenderer().render(data)))
+
+    @override_settings(CATALOG_FAST_JSON=False)
+    def test_falls_back_to_default_renderer(self):
+        data = {'documents': [RawJSON('{"id": 1}')], 'price': Decimal('1.50')}
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_product_list_sends_stored_documents_without_decoding(self):
+        self.client.get('/api/v1/products/')
+
+        with mock.patch('apps.products.renderers.json.loads', side_effect=AssertionError('decoded')):
+            response = self.client.get('/api/v1/products/', HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['results'][0]['variants'][0]['stock'], 3)
+
+    @override_settings(CATALOG_SNAPSHOT_ASYNC=False)
+    def test_benchmark_command_reports_each_renderer(self):
+        out = StringIO()
+
+        call_command('benchmark_json_renderers', iterations=1, stdout=out)
+
+        self.assertIn('JSONRenderer:', out.getvalue())
+        self.assertIn('FastJSONRenderer + RawJSON:', out.getvalue())
+
+
+@override_settings(FEED_SITE_URL='https://shop.example', FEED_MEDIA_URL='https://shop.example', FEED_CURRENCY='RUB')
+class FeedExportTests(APITestCase):
+    url = '/api/v1/feeds/'
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.brand = Brand.objects.create(name='Apple', slug='apple')
+        self.product = Product.objects.create(
+            name='iPhone 15 Pro',
+            slug='iphone-15-pro',
+            category=self.category,
+            brand=self.brand,
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product,
+            sku='APL-IP15PRO',
+            attributes={'storage': '256GB'},
+            price='999.00',
+            old_price='1099.00',
+            stock=3,
+        )
+        self.other = ProductVariant.objects.create(product=self.product, sku='APL-IP15PRO-1TB', price='1299.00')
+        ProductVariant.objects.create(product=self.product, sku='APL-IP15PRO-OLD', price='899.00', is_active=False)
+        self.staff = get_user_model().objects.create_user(username='staff', password='secret-pass', is_staff=True)
+
+    def export(self, **options):
+        out = StringIO()
+        call_command('export_feed', stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_yml_feed_lists_active_variants(self):
+        content = self.export(feed_format='yml')
+
+        self.assertIn('<offer id="%d" available="true" group_id="%d">' % (self.variant.pk, self.product.pk), content)
+        self.assertIn('<offer id="%d" available="false"' % self.other.pk, content)
+        self.assertNotIn('APL-IP15PRO-OLD', content)
+        self.assertIn('<name>iPhone 15 Pro 256GB</name>', content)
+        self.assertIn('<url>https://shop.example/products/iphone-15-pro</url>', content)
+        self.assertIn('<price>999.00</price><oldprice>1099.00</oldprice>', content)
+        self.assertIn('<category id="%d">Смартфоны</category>' % self.category.pk, content)
+        self.assertTrue(content.rstrip().endswith('</yml_catalog>'))
+
+    def test_csv_and_merchant_feeds(self):
+        rows = list(csv.DictReader(StringIO(self.export(feed_format='csv'))))
+        merchant = self.export(feed_format='merchant')
+
+        self.assertEqual([row['sku'] for row in rows], ['APL-IP15PRO', 'APL-IP15PRO-1TB'])
+        self.assertEqual(rows[0]['brand'], 'Apple')
+        self.assertEqual(rows[1]['available'], '0')
+        self.assertIn('<g:price>1099.00 RUB</g:price><g:sale_price>999.00 RUB</g:sale_price>', merchant)
+        self.assertIn('<g:availability>out_of_stock</g:availability>', merchant)
+
+    def test_incremental_export_renders_only_changed_entries(self):
+        first = self.export(feed_format='csv', incremental=True)
+        self.assertEqual(FeedEntry.objects.filter(format='csv').count(), 2)
+
+        with mock.patch('apps.products.feeds.CSVFeed.entry', side_effect=AssertionError('rendered')):
+            self.assertEqual(self.export(feed_format='csv', incremental=True), first)
+
+        self.other.stock = 5
+        self.other.save()
+        self.variant.is_active = False
+        self.variant.save()
+        rows = list(csv.DictReader(StringIO(self.export(feed_format='csv', incremental=True))))
+
+        self.assertEqual([(row['sku'], row['stock']) for row in rows], [('APL-IP15PRO-1TB', '5')])
+        self.assertEqual(list(FeedEntry.objects.values_list('variant_id', flat=True)), [self.other.pk])
+        self.assertGreater(FeedState.objects.get(format='csv').watermark, self.other.updated_at)
+
+    def test_interrupted_incremental_export_keeps_previous_watermark(self):
+        parts = iter_feed('csv', chunk_size=1, incremental=True)
+        next(parts)
+        next(parts)
+        parts.close()
+
+        # Выданная пачка уже сохранена, watermark — нет
+        self.assertEqual(list(FeedEntry.objects.values_list('variant_id', flat=True)), [self.variant.pk])
+        self.assertFalse(FeedState.objects.exists())
+
+        stats = {}
+        rows = list(csv.DictReader(StringIO(''.join(iter_feed('csv', chunk_size=1, incremental=True, stats=stats)))))
+
+        self.assertEqual([row['sku'] for row in rows], ['APL-IP15PRO', 'APL-IP15PRO-1TB'])
+        self.assertEqual(stats, {'entries': 2, 'rendered': 2, 'removed': 0})
+        self.assertEqual(FeedEntry.objects.count(), 2)
+        self.assertTrue(FeedState.objects.exists())
+
+    def test_endpoint_streams_feed_to_staff_only(self):
+        self.assertIn(self.client.get(self.url + 'yml/').status_code, (401, 403))
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(self.url + 'yml/', {'chunk_size': 1}, HTTP_ACCEPT='application/xml')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/xml; charset=utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.count('<offer '), 2)
+        self.assertEqual(self.client.get(self.url + 'xlsx/').status_code, status.HTTP_404_NOT_FOUND)
+
+        with mock.patch('apps.products.views.iter_feed', return_value=iter(())) as export:
+            b''.join(self.client.get(self.url + 'csv/', {'chunk_size': 10 ** 9}).streaming_content)
+        self.assertEqual(export.call_args.args[1], FEED_MAX_CHUNK_SIZE)
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='memory', CATALOG_SNAPSHOT_ASYNC=False)
+class ImportCatalogTests(TestCase):
+    header = 'sku,product_slug,product_name,brand,category,price,old_price,stock,spec.screen-size,attr.color\n'
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Смартфоны', slug='smartphones')
+        self.category.attributes.add(
+            Attribute.objects.create(
+                name='Диагональ экрана',
+                slug='screen-size',
+                applies_to='product',
+                type='number',
+                is_required=True,
+            ),
+            Attribute.objects.create(
+                name='Цвет',
+                slug='color',
+                applies_to='variant',
+                type='enum',
+                values=['Black', 'White'],
+            ),
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_upserts_by_sku_and_refreshes_derived_data(self):
+        path = self.write('catalog.csv', self.header + (
+            'APL-IP15PRO-B,iphone-15-pro,iPhone 15 Pro,Apple,smartphones,999.00,,3,6.1,Black\n'
+            'APL-IP15PRO-W,iphone-15-pro,iPhone 15 Pro,Apple,smartphones,1049.00,,0,,White\n'
+        ))
+
+        out, err = self.run_import(path)
+
+        self.assertEqual(err, '')
+        self.assertIn('импортировано: 2', out)
+        product = Product.objects.get(slug='iphone-15-pro')
+        self.assertEqual(product.brand.name, 'Apple')
+        self.assertEqual(product.specifications, {'screen-size': '6.1'})
+        self.assertEqual(product.min_price, Decimal('999.00'))
+        self.assertEqual(product.brand.product_count, 1)
+        self.assertEqual(ProductVariant.objects.get(sku='APL-IP15PRO-W').attributes, {'color': 'White'})
+        self.assertTrue(ProductDocument.objects.filter(product=product).exists())
+        self.assertTrue(ProductFacetValue.objects.filter(product=product, attribute_slug='color').exists())
+        self.assertEqual(search_product_ids('iphone'), [product.pk])
+
+        path = self.write('prices.csv', 'sku,product_slug,price,stock\nAPL-IP15PRO-B,iphone-15-pro,899.00,\n')
+        out, _ = self.run_import(path)
+
+        self.assertIn('Вариантов создано: 0, обновлено: 1', out)
+        variant = ProductVariant.objects.get(sku='APL-IP15PRO-B')
+        self.assertEqual((variant.price, variant.stock), (Decimal('899.00'), 3))
+        self.assertEqual(Product.objects.get(pk=product.pk).min_price, Decimal('899.00'))
+
+    def test_update_keeps_off_schema_values_and_recalculates_carts(self):
+        product = Product.objects.create(
+            name='iPhone 15 Pro',
+            slug='iphone-15-pro',
+            category=self.category,
+            specifications={'screen-size': '6.1', 'legacy-code': 'A2848'},
+        )
+        variant = ProductVariant.objects.create(
+            product=product,
+            sku='APL-IP15PRO-B',
+            price='999.00',
+            attributes={'color': 'Black', 'finish': 'Titanium'},
+        )
+        cart = Cart.objects.create(session_key='import')
+        CartItem.objects.create(cart=cart, variant=variant, quantity=2)
+
+        path = self.write('prices.csv', 'sku,product_slug,price,spec.screen-size,attr.color\n'
+                          'APL-IP15PRO-B,iphone-15-pro,899.00,6.7,White\n')
+        self.run_import(path)
+
+        product.refresh_from_db()
+        variant.refresh_from_db()
+        cart.refresh_from_db()
+        self.assertEqual(product.specifications, {'screen-size': '6.7', 'legacy-code': 'A2848'})
+        self.assertEqual(variant.attributes, {'color': 'White', 'finish': 'Titanium'})
+        self.assertEqual(cart.total_price, Decimal('1798.00'))
+
+    def test_row_errors_are_reported_and_skipped(self):
+        path = self.write('catalog.csv', self.header + (
+            'OK-1,phone,Phone,,smartphones,100,,1,6.1,Black\n'
+            'BAD-COLOR,phone,Phone,,smartphones,100,,1,6.1,Red\n'
+            'BAD-SPEC,tablet,Tablet,,smartphones,100,,1,,Black\n'
+            'BAD-PRICE,phone,Phone,,smartphones,-1,,1,6.1,Black\n'
+            'BAD-CATEGORY,watch,Watch,,watches,100,,1,,\n'
+        ))
+
+        out, err = self.run_import(path)
+
+        self.assertIn('импортировано: 1, с ошибками: 4', out)
+        self.assertIn('Строка 3: color:', err)
+        self.assertIn('Строка 4: screen-size: обязательное значение', err)
+        self.assertIn('Строка 5: price:', err)
+        self.assertIn('Строка 6: category:', err)
+        self.assertEqual(list(ProductVariant.objects.values_list('sku', flat=True)), ['OK-1'])
+
+    def test_dry_run_rolls_back_changes(self):
+        path = self.write('catalog.jsonl', '\n'.join([
+            json.dumps({
+                'sku': 'APL-IP15PRO-B',
+                'product_slug': 'iphone-15-pro',
+                'product_name': 'iPhone 15 Pro',
+                'brand': 'Apple',
+                'category': 'smartphones',
+                'price': '999.00',
+                'specifications': {'screen-size': 6.1},
+                'attributes': {'color': 'Black'},
+            }),
+            '{broken',
+        ]))
+
+        out, err = self.run_import(path, dry_run=True)
+
+        self.assertIn('Пробный запуск', out)
+        self.assertIn('Товаров создано: 1', out)
+        self.assertIn('Строка 2: некорректный JSON', err)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Brand.objects.exists())
+
+    def test_import_runs_in_bulk_queries(self):
+        rows = ''.join(
+            f'SKU-{number},phone-{number},Phone {number},Apple,smartphones,{100 + number},,1,6.1,Black\n'
+            for number in range(50)
+        )
+        path = self.write('catalog.csv', self.header + rows)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.run_import(path, chunk_size=50)
+
+        self.assertEqual(ProductVariant.objects.count(), 50)
+        self.assertLess(len(queries), 40)
@@ -0,0 +1,52 @@
+"""
+Дерево категорий: меню и выборки по поддереву.
+
+Всё дерево собирается из одного запроса по Category (порядок: уровень,
+order, имя) и кэшируется одним значением под версией CATEGORIES_SCOPE —
+любое сохранение или перенос категории (signals.py) даёт новый ключ.
+Товары поддерева выбираются подзапросом по индексу Category.path.
+"""
+from django.core.cache import cache
+
+from .conditional import CATEGORIES_SCOPE
+from .models import Category
+from .serializers import CategoryTreeSerializer
+from .versioning import get_version
+
+CATEGORY_TREE_KEY_PREFIX = 'category-tree:'
+CATEGORY_TREE_TIMEOUT = 24 * 60 * 60
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def build_category_tree():
+    """Вложенный список корневых категорий с children. Ссылки на медиа — от MEDIA_SITE_URL."""
+    categories = Category.objects.order_by('depth', 'order', 'name')
+    nodes = {}
+    roots = []
+    for category in categories:
+        node = {**CategoryTreeSerializer(category, context={'request': None}).data, 'children': []}
+        nodes[category.pk] = node
+        # Родитель всегда выше уровнем, поэтому уже в nodes
+        siblings = nodes[category.parent_id]['children'] if category.parent_id else roots
+        siblings.append(node)
+    return roots
+
+
+def get_category_tree():
+    key = f'{CATEGORY_TREE_KEY_PREFIX}{get_version(CATEGORIES_SCOPE)}'
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(key, tree, CATEGORY_TREE_TIMEOUT)
+    return tree
+
+
+def wants_descendants(request):
+    return request.query_params.get('include_descendants', '').strip().lower() in TRUE_VALUES
+
+
+def filter_by_category(queryset, category, include_descendants=False):
+    """Товары категории, а с include_descendants — и всех её подкатегорий."""
+    if include_descendants:
+        return queryset.filter(category__in=category.get_descendants().values('pk'))
+    return queryset.filter(category=category)
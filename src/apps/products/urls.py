@@ -4,7 +4,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     CategoryViewSet, BrandViewSet, ProductViewSet,
     ProductVariantViewSet, AttributeViewSet,
-    OrderViewSet, OverviewViewSet, HeroBlockViewSet
+    OrderViewSet, OverviewViewSet, HeroBlockViewSet, FeedViewSet
 )
 
 router = DefaultRouter()
@@ -16,6 +16,7 @@ router.register(r'attributes', AttributeViewSet, basename='attribute')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'overview', OverviewViewSet, basename='overview')
 router.register(r'hero-blocks', HeroBlockViewSet, basename='hero-block')
+router.register(r'feeds', FeedViewSet, basename='feed')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -0,0 +1,53 @@
+"""
+Версии изменений каталога, общие для всех процессов через кэш Django.
+
+Версия — метка времени в наносекундах. Её смена означает, что данные
+области (scope) изменились и производные кэши нужно перестроить.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY_PREFIX = 'catalog-version:'
+
+
+def _key(scope):
+    return f'{VERSION_KEY_PREFIX}{scope}'
+
+
+def new_version():
+    return time.time_ns()
+
+
+def get_versions(*scopes):
+    keys = {_key(scope): scope for scope in scopes}
+    versions = cache.get_many(list(keys))
+
+    missing = {key: new_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        # add не перезапишет версию, которую успел создать другой процесс
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        versions[key] = version
+
+    return {keys[key]: versions[key] for key in keys}
+
+
+def get_version(scope):
+    return get_versions(scope)[scope]
+
+
+def bump_version(*scopes):
+    version = new_version()
+    cache.set_many({_key(scope): version for scope in scopes}, None)
+    return version
+
+
+def invalidate_versions(*scopes):
+    """
+    Меняет версии сразу и ещё раз после коммита: читатель, успевший до
+    коммита увидеть старые данные под новой версией, не закэширует их надолго.
+    """
+    bump_version(*scopes)
+    transaction.on_commit(lambda: bump_version(*scopes))
@@ -1,18 +1,72 @@
-from django.db.models import Q
+from django.db.models import Case, IntegerField, Prefetch, When
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import viewsets, status, permissions, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .conditional import (
+    ATTRIBUTES_SCOPE, BRANDS_SCOPE, CATEGORIES_SCOPE, HERO_BLOCKS_SCOPE, PRODUCTS_SCOPE, STOCK_SCOPE,
+    ConditionalGetMixin,
+)
+from .brands import brand_product_cards
+from .documents import get_encoded_product_documents
+from .facets import filter_by_facets, get_category_facets, parse_facet_filters
+from .feeds import FEED_CHUNK_SIZE, FEED_MAX_CHUNK_SIZE, FEEDS, feed_filename, iter_feed
+from .fieldsets import DynamicFieldsViewMixin, is_expanded, is_requested, parse_shape, project_document, sub_shape
+from .hero import expire_hero_window, get_hero_feed, live_hero_blocks
 from .models import Category, Brand, Product, ProductVariant, Attribute, Order, HeroBlock
+from .pagination import (
+    CURSOR_FIELDS, CursorPaginationMixin, ProductCursorPagination, get_product_ordering, order_products,
+    wants_cursor_pagination,
+)
+from .renderers import CatalogRenderersMixin, RawJSON
+from .search import search_product_ids
+from .snapshots import (
+    get_overview_snapshot, is_overview_stale, rebuild_overview_snapshot, schedule_overview_rebuild,
+)
+from .stock import apply_available_stock, with_available_stock
+from .tree import TRUE_VALUES, filter_by_category, get_category_tree, wants_descendants
 from .serializers import (
-    CategorySerializer, BrandSerializer, BrandDetailSerializer, ProductSerializer,
+    CategorySerializer, BrandSerializer, BrandDetailSerializer, ProductCardSerializer, ProductSerializer,
     ProductVariantSerializer, AttributeSerializer, OrderSerializer, HeroBlockSerializer
 )
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+def shape_product_documents(documents, shape):
+    """
+    Документы товаров по форме ?fields=/?expand= (см. fieldsets.py).
+    Доступный остаток подставляется, только если остаток вариантов выводится.
+    """
+    if (
+        is_requested(shape, 'variants')
+        and is_expanded(shape, 'variants')
+        and is_requested(sub_shape(shape, 'variants'), 'stock')
+    ):
+        documents = apply_available_stock(documents)
+    return [project_document(document, shape, ProductSerializer.expandable_fields) for document in documents]
+
+
+def paginate_product_documents(products, request, view=None):
+    """Страница документов товаров с курсорной пагинацией."""
+    paginator = ProductCursorPagination()
+    page = paginator.paginate_queryset(products, request, view=view)
+    return paginator.get_paginated_response(
+        shape_product_documents(get_encoded_product_documents(page), parse_shape(request.query_params))
+    )
+
+
+class CategoryViewSet(
+    CatalogRenderersMixin, ConditionalGetMixin, DynamicFieldsViewMixin, viewsets.ReadOnlyModelViewSet,
+):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     lookup_field = 'slug'
+    conditional_scopes = (CATEGORIES_SCOPE,)
+    conditional_action_scopes = {
+        'products': (CATEGORIES_SCOPE, PRODUCTS_SCOPE, STOCK_SCOPE),
+        'facets': (CATEGORIES_SCOPE, ATTRIBUTES_SCOPE, PRODUCTS_SCOPE),
+    }
 
     @action(detail=False, methods=['get'], url_path='header-menu')
     def header_menu_categories(self, request):
@@ -23,50 +77,110 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(categories, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='tree')
+    def tree(self, request):
+        """
+        Всё дерево категорий одним ответом: корни и вложенные children,
+        соседи по order и имени. Берётся из кэша (см. tree.py)
+        """
+        return Response(get_category_tree())
 
     @action(detail=True, methods=['get'], url_path='products')
     def products(self, request, slug=None):
         category = self.get_object()
-        products = Product.objects.filter(category=category, is_active=True)
-        serializer = ProductSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        products = filter_by_category(
+            Product.objects.filter(is_active=True),
+            category,
+            include_descendants=wants_descendants(request),
+        )
+        products = filter_by_facets(products, parse_facet_filters(request.query_params))
+        return paginate_product_documents(products.only(*CURSOR_FIELDS), request, view=self)
+
+    @action(detail=True, methods=['get'], url_path='facets')
+    def facets(self, request, slug=None):
+        """
+        Значения атрибутов категории и число активных товаров для каждого
+        с учётом выбранных фильтров spec__<slug>/attr__<slug>
+        """
+        category = self.get_object()
+        return Response(get_category_facets(category, parse_facet_filters(request.query_params)))
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(
+    CatalogRenderersMixin,
+    ConditionalGetMixin,
+    DynamicFieldsViewMixin,
+    CursorPaginationMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     serializer_class = ProductSerializer
     lookup_field = 'slug'
+    conditional_scopes = (PRODUCTS_SCOPE, STOCK_SCOPE)
+    # Списки отдают готовые документы товаров, сериализатор для них не нужен
+    document_actions = {'list', 'popular_products', 'search'}
+    # Поиск сортируется по релевантности, курсор по ключу сортировки к нему не подходит
+    cursor_actions = ('list', 'popular_products')
 
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True).select_related(
-            'brand',
-            'category',
-        ).prefetch_related(
-            'images',
-            'variants',
-        )
-        return self.apply_attribute_filters(queryset)
+        queryset = Product.objects.filter(is_active=True)
+        if self.action in self.document_actions:
+            queryset = order_products(queryset.only(*CURSOR_FIELDS), get_product_ordering(self.request))
+        else:
+            queryset = self.load_requested_relations(queryset)
+        return self.apply_attribute_filters(self.apply_category_filter(queryset))
+
+    def load_requested_relations(self, queryset):
+        """Подгружает только связи, которые попадут в ответ по ?fields=/?expand=."""
+        shape = self.shape
+        variants_shape = sub_shape(shape, 'variants')
+        variants_expanded = is_requested(shape, 'variants') and is_expanded(shape, 'variants')
+
+        related = []
+        if is_requested(shape, 'brand') and is_expanded(shape, 'brand'):
+            related.append('brand')
+        # Категория нужна и схемам характеристик товара и вариантов
+        if (
+            (is_requested(shape, 'category') and is_expanded(shape, 'category'))
+            or is_requested(shape, 'specifications')
+            or (variants_expanded and is_requested(variants_shape, 'attribute_values'))
+        ):
+            related.append('category')
+
+        prefetches = []
+        if is_requested(shape, 'images') or (variants_expanded and is_requested(variants_shape, 'media_ids')):
+            prefetches.append('images')
+        if variants_expanded:
+            variants = ProductVariant.objects.all()
+            if is_requested(variants_shape, 'stock'):
+                variants = with_available_stock(variants)
+            prefetches.append(Prefetch('variants', queryset=variants))
+        elif is_requested(shape, 'variants'):
+            prefetches.append(Prefetch('variants', queryset=ProductVariant.objects.only('pk', 'product_id')))
+
+        return queryset.select_related(*related).prefetch_related(*prefetches)
+
+    def apply_category_filter(self, queryset):
+        # ?category=<slug>, с include_descendants=1 — вместе с подкатегориями
+        slug = self.request.query_params.get('category', '').strip()
+        if not slug:
+            return queryset
+        category = Category.objects.filter(slug=slug).only('pk', 'path').first()
+        if category is None:
+            return queryset.none()
+        return filter_by_category(queryset, category, include_descendants=wants_descendants(self.request))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(shape_product_documents(get_encoded_product_documents(page), self.shape))
+
+        return Response(shape_product_documents(get_encoded_product_documents(queryset), self.shape))
 
     def apply_attribute_filters(self, queryset):
-        for key, value in self.request.query_params.items():
-            value = value.strip()
-            if not value:
-                continue
-
-            if key.startswith('spec__'):
-                spec_slug = key[len('spec__'):]
-                if spec_slug:
-                    queryset = queryset.filter(
-                        **{f'specifications__{spec_slug}__iexact': value}
-                    )
-
-            if key.startswith('attr__'):
-                attr_slug = key[len('attr__'):]
-                if attr_slug:
-                    queryset = queryset.filter(
-                        **{f'variants__attributes__{attr_slug}__iexact': value}
-                    )
-
-        return queryset.distinct()
+        # spec__<slug> и attr__<slug> ищутся по таблице фасетов, без JOIN на варианты
+        return filter_by_facets(queryset, parse_facet_filters(self.request.query_params))
 
     @action(detail=False, methods=['get'], url_path='popular')
     def popular_products(self, request):
@@ -74,8 +188,10 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         Возвращает только товары, отмеченные для отображения в популярном (is_popular=True)
         """
         products = self.get_queryset().filter(is_popular=True)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        if wants_cursor_pagination(request):
+            page = self.paginate_queryset(products)
+            return self.get_paginated_response(shape_product_documents(get_encoded_product_documents(page), self.shape))
+        return Response(shape_product_documents(get_encoded_product_documents(products), self.shape))
 
     @action(detail=False, methods=['get'], url_path='search')
     def search(self, request):
@@ -86,52 +202,83 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        products = self.get_queryset().filter(
-            Q(name__icontains=query)
-            | Q(short_description__icontains=query)
-            | Q(description__icontains=query)
-            | Q(brand__name__icontains=query)
-            | Q(category__name__icontains=query)
-            | Q(variants__sku__icontains=query)
-            | Q(specifications__icontains=query)
-            | Q(variants__attributes__icontains=query)
-        ).distinct()
+        # Индекс возвращает id по релевантности, порядок сохраняем через CASE
+        product_ids = search_product_ids(query)
+        products = self.get_queryset().filter(pk__in=product_ids)
+        if product_ids:
+            products = products.order_by(Case(
+                *(When(pk=product_id, then=position) for position, product_id in enumerate(product_ids)),
+                output_field=IntegerField(),
+            ))
 
         page = self.paginate_queryset(products)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(shape_product_documents(get_encoded_product_documents(page), self.shape))
 
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return Response(shape_product_documents(get_encoded_product_documents(products), self.shape))
 
 
-class BrandViewSet(viewsets.ReadOnlyModelViewSet):
+class BrandViewSet(CatalogRenderersMixin, ConditionalGetMixin, DynamicFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     lookup_field = 'slug'
+    conditional_scopes = (BRANDS_SCOPE,)
+    conditional_action_scopes = {
+        'retrieve': (BRANDS_SCOPE, CATEGORIES_SCOPE, PRODUCTS_SCOPE),
+        'products': (BRANDS_SCOPE, PRODUCTS_SCOPE, STOCK_SCOPE),
+    }
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return BrandDetailSerializer
         return super().get_serializer_class()
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Шапка бренда с агрегатами и страница лёгких карточек товаров.
+        Следующие страницы — по products_next (тот же адрес с ?cursor=)
+        """
+        brand = self.get_object()
+        data = self.get_serializer(brand).data
+        if not is_requested(self.shape, 'products'):
+            return Response(data)
+
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(brand_product_cards(brand), request, view=self)
+        data['products'] = ProductCardSerializer(page, many=True, context={'request': request}).data
+        data['products_next'] = paginator.get_next_link()
+        data['products_previous'] = paginator.get_previous_link()
+        return Response(data)
+
     @action(detail=True, methods=['get'], url_path='products')
     def products(self, request, slug=None):
         brand = self.get_object()
-        products = Product.objects.filter(brand=brand, is_active=True)
-        serializer = ProductSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        products = Product.objects.filter(brand=brand, is_active=True).only(*CURSOR_FIELDS)
+        return paginate_product_documents(products, request, view=self)
 
-class ProductVariantViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = ProductVariant.objects.filter(is_active=True).select_related('product').prefetch_related('product__images')
+class ProductVariantViewSet(
+    CatalogRenderersMixin, ConditionalGetMixin, DynamicFieldsViewMixin, viewsets.ReadOnlyModelViewSet,
+):
     serializer_class = ProductVariantSerializer
     lookup_field = 'sku'
+    conditional_scopes = (PRODUCTS_SCOPE, STOCK_SCOPE)
 
-class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_queryset(self):
+        # Остаток, товар и его медиа загружаются, только если попадут в ответ
+        queryset = ProductVariant.objects.filter(is_active=True)
+        if is_requested(self.shape, 'stock'):
+            queryset = with_available_stock(queryset)
+        if is_requested(self.shape, 'media'):
+            queryset = queryset.select_related('product').prefetch_related('product__images')
+        elif is_requested(self.shape, 'attribute_values'):
+            queryset = queryset.select_related('product')
+        return queryset
+
+class AttributeViewSet(CatalogRenderersMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Attribute.objects.all()
     serializer_class = AttributeSerializer
     lookup_field = 'slug'
+    conditional_scopes = (ATTRIBUTES_SCOPE,)
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
@@ -139,13 +286,13 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            return Order.objects.filter(user=self.request.user)
+            return Order.objects.filter(user=self.request.user).prefetch_related('items').order_by('-created_at', '-id')
         return Order.objects.none()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class OverviewViewSet(viewsets.GenericViewSet):
+class OverviewViewSet(CatalogRenderersMixin, viewsets.GenericViewSet):
     """
     ViewSet для агрегированного представления каталога.
     Поддерживает только один эндпоинт — list (GET /api/v1/overview/).
@@ -161,62 +308,104 @@ class OverviewViewSet(viewsets.GenericViewSet):
         - brands: все бренды
         - categories: все категории
         - catalog: товары, сгруппированные по категориям (сохраняя порядок категорий)
+
+        Ответ берётся из готового снимка за один запрос к БД. Если снимок устарел,
+        отдаём последнюю собранную версию и ставим пересборку в фон. Снимка ещё
+        нет (деплой его не собрал) — собираем здесь же.
         """
-        # 1. Получаем все данные с оптимизацией запросов
-        brands = Brand.objects.all()
-        categories = Category.objects.all().order_by('id')  # или order_by('name'), как в Meta
-        # Желательно select_related, чтобы избежать N+1 при сериализации
-        products = Product.objects.select_related('brand', 'category') \
-                                   .filter(is_active=True) \
-                                   .order_by('category_id', '-created_at')
-
-        # 2. Сериализуем бренды и категории
-        brand_data = BrandSerializer(brands, many=True, context={'request': request}).data
-        category_data = CategorySerializer(categories, many=True, context={'request': request}).data
-
-        # 3. Группируем товары по категориям
-        # Создаём маппинг: category_id → список товаров
-        products_by_category = {}
-        for category in categories:
-            products_by_category[category.id] = []
-
-        for product in products:
-            products_by_category[product.category_id].append(
-                ProductSerializer(product, context={'request': request}).data
-            )
+        snapshot = get_overview_snapshot()
+        if snapshot is None or not snapshot.is_built:
+            rebuild_overview_snapshot()
+            snapshot = get_overview_snapshot()
+        elif is_overview_stale(snapshot):
+            schedule_overview_rebuild()
+
+        last_modified = int(snapshot.built_at.timestamp())
+        headers = {
+            'ETag': f'"{snapshot.etag}"',
+            'Last-Modified': http_date(last_modified),
+            'X-Catalog-Version': str(snapshot.built_version),
+        }
+        not_modified = get_conditional_response(
+            request,
+            etag=headers['ETag'],
+            last_modified=last_modified,
+        )
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        return Response(RawJSON(snapshot.raw_payload), headers=headers)
+
+class FeedViewSet(viewsets.ViewSet):
+    """
+    GET /api/v1/feeds/{yml|csv|merchant}/ — фид каталога для маркетплейсов,
+    только для персонала. Ответ стримится пачками вариантов (см. feeds.py);
+    ?incremental=1 перерисовывает только изменившиеся записи.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    lookup_field = 'feed_format'
+    lookup_value_regex = '[a-z]+'
 
-        # 4. Формируем упорядоченный каталог
-        catalog = []
-        for cat in categories:
-            catalog.append({
-                'id': cat.id,
-                'name': cat.name,
-                'slug': cat.slug,
-                'products': products_by_category[cat.id]
-            })
+    def perform_content_negotiation(self, request, force=False):
+        # Фид отдаётся своим content type, Accept: application/xml не должен давать 406
+        return super().perform_content_negotiation(request, force=True)
 
+    def list(self, request):
         return Response({
-            'brands': brand_data,
-            'categories': category_data,
-            'catalog': catalog,
+            feed_format: request.build_absolute_uri(f'{feed_format}/') for feed_format in FEEDS
         })
 
-class HeroBlockViewSet(viewsets.ModelViewSet):
+    def retrieve(self, request, feed_format=None):
+        if feed_format not in FEEDS:
+            raise Http404
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', FEED_CHUNK_SIZE))
+        except ValueError:
+            chunk_size = FEED_CHUNK_SIZE
+        chunk_size = min(max(chunk_size, 1), FEED_MAX_CHUNK_SIZE)
+        incremental = request.query_params.get('incremental', '').strip().lower() in TRUE_VALUES
+
+        response = StreamingHttpResponse(
+            (part.encode('utf-8') for part in iter_feed(feed_format, chunk_size, incremental)),
+            content_type=FEEDS[feed_format].content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{feed_filename(feed_format)}"'
+        return response
+
+class HeroBlockViewSet(CatalogRenderersMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet для управления герой-блоками.
     """
     
     serializer_class = HeroBlockSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    conditional_scopes = (HERO_BLOCKS_SCOPE, PRODUCTS_SCOPE)
     
+    def initial(self, request, *args, **kwargs):
+        # Наступившая граница окна показа меняет версию до проверки ETag
+        if request.method in ('GET', 'HEAD'):
+            expire_hero_window()
+        super().initial(request, *args, **kwargs)
+
     def get_queryset(self):
         """
-        Возвращает только опубликованные и активные блоки для неавторизованных пользователей.
-        Для авторизованных — все блоки.
+        Возвращает только опубликованные, активные и попавшие в окно показа блоки
+        для неавторизованных пользователей. Для авторизованных — все блоки.
         """
         if self.request.user.is_authenticated:
-            return HeroBlock.objects.all()
-        return HeroBlock.objects.filter(
-            status='published',
-            is_active=True
-        )
+            return HeroBlock.objects.select_related('product')
+        return live_hero_blocks().select_related('product')
+
+    def list(self, request, *args, **kwargs):
+        """Неавторизованным отдаётся готовая лента из кэша (см. hero.py)."""
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        feed = get_hero_feed()
+        page = self.paginate_queryset(feed)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(feed)
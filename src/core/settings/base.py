@@ -151,10 +151,23 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
-# Настройки сессий для корзины
+# Сессии в БД нужны админке; гостевая корзина живёт в своей подписанной cookie
+# (apps/cart/identity.py), поэтому анонимные запросы не пишут django_session
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_AGE = 1209600  # 2 недели
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False
+
+# Cookie гостевой корзины
+CART_COOKIE_NAME = 'cart_token'
+CART_COOKIE_AGE = SESSION_COOKIE_AGE
+
+# sweep_carts: через сколько часов простоя корзина считается брошенной
+# и через сколько дней брошенные/завершённые корзины удаляются
+CART_ABANDON_AFTER_HOURS = int(os.getenv('CART_ABANDON_AFTER_HOURS', '72'))
+CART_RETENTION_DAYS = int(os.getenv('CART_RETENTION_DAYS', '30'))
+
+# На сколько минут /cart/reserve/ удерживает остаток за корзиной
+STOCK_RESERVATION_MINUTES = int(os.getenv('STOCK_RESERVATION_MINUTES', '15'))
 
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'no-reply@izistore.local')
@@ -165,3 +178,37 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'true').lower() == 'true'
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', 'false').lower() == 'true'
 EMAIL_VERIFICATION_PIN_TTL_MINUTES = int(os.getenv('EMAIL_VERIFICATION_PIN_TTL_MINUTES', '10'))
+
+# Снимок /api/v1/overview/ пересобирается в фоновом потоке после изменений каталога
+CATALOG_SNAPSHOT_ASYNC = os.getenv('CATALOG_SNAPSHOT_ASYNC', 'true').lower() == 'true'
+# Задержка перед пересборкой: серия изменений (импорт, правки в админке) собирается одним проходом
+CATALOG_SNAPSHOT_DEBOUNCE = float(os.getenv('CATALOG_SNAPSHOT_DEBOUNCE', '2'))
+
+# Рендереры эндпоинтов каталога. FastJSONRenderer кодирует через orjson
+# и сам откатывается на JSONRenderer, если orjson не установлен или CATALOG_FAST_JSON=false
+CATALOG_FAST_JSON = os.getenv('CATALOG_FAST_JSON', 'true').lower() == 'true'
+CATALOG_RENDERER_CLASSES = [
+    'apps.products.renderers.FastJSONRenderer',
+    'rest_framework.renderers.BrowsableAPIRenderer',
+]
+
+# Адрес, от которого API строит ссылки на медиа. Одинаков для ответов
+# и для документов, снимков и кеша, собранных без запроса
+MEDIA_SITE_URL = os.getenv('MEDIA_SITE_URL', 'http://localhost:8000')
+
+# Фиды для маркетплейсов (export_feed, /api/v1/feeds/<format>/): ссылки на товары
+# строятся от адреса витрины, относительные ссылки на медиа — от FEED_MEDIA_URL
+FEED_SHOP_NAME = os.getenv('FEED_SHOP_NAME', 'IZI Store')
+FEED_COMPANY_NAME = os.getenv('FEED_COMPANY_NAME', FEED_SHOP_NAME)
+FEED_SITE_URL = os.getenv('FEED_SITE_URL', 'https://izistore.info')
+FEED_MEDIA_URL = os.getenv('FEED_MEDIA_URL', FEED_SITE_URL)
+FEED_PRODUCT_PATH = os.getenv('FEED_PRODUCT_PATH', '/products/{slug}')
+FEED_CURRENCY = os.getenv('FEED_CURRENCY', 'RUB')
+
+# Как часто (в секундах) реестр схем атрибутов сверяет свою версию с общим кэшем
+ATTRIBUTE_SCHEMA_CHECK_INTERVAL = float(os.getenv('ATTRIBUTE_SCHEMA_CHECK_INTERVAL', '1'))
+
+# Поиск по товарам: auto | memory | sqlite | postgres | путь к классу бэкенда
+PRODUCT_SEARCH_BACKEND = os.getenv('PRODUCT_SEARCH_BACKEND', 'auto')
+# Сколько самых релевантных товаров поиск отдаёт в пагинацию
+PRODUCT_SEARCH_MAX_RESULTS = int(os.getenv('PRODUCT_SEARCH_MAX_RESULTS', '1000'))
@@ -28,4 +28,12 @@ DATABASES = {
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
     }
-}
\ No newline at end of file
+}
+
+# Общий для всех воркеров gunicorn кэш: через него процессы узнают о смене версий каталога
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', '/var/tmp/electronics-store-cache'),
+    }
+}